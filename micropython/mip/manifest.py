@@ -1,4 +1,4 @@
-metadata(version="0.4.1", description="On-device package installer for network-capable boards")
+metadata(version="0.7.0", description="On-device package installer for network-capable boards")
 
 require("requests")
 
@@ -8,6 +8,8 @@ import sys
 
 _PACKAGE_INDEX = const("https://micropython.org/pi/v2")
 _CHUNK_SIZE = 128
+# Must match the window that tools/build.py compresses archives with.
+_ARCHIVE_WBITS = const(10)
 
 allowed_mip_url_prefixes = ("http://", "https://", "github:", "gitlab:")
 
@@ -43,19 +45,24 @@ def _chunk(src, dest):
         dest(buf if n == _CHUNK_SIZE else buf[:n])
 
 
+# Returns the hex digest of hs256 truncated to the length of short_hash.
+def _short_hash(hs256, short_hash):
+    import binascii
+
+    return str(binascii.hexlify(hs256.digest())[: len(short_hash)], "utf-8")
+
+
 # Check if the specified path exists and matches the hash.
 def _check_exists(path, short_hash):
     import os
 
     try:
-        import binascii
         import hashlib
 
         with open(path, "rb") as f:
             hs256 = hashlib.sha256()
             _chunk(f, hs256.update)
-            existing_hash = str(binascii.hexlify(hs256.digest())[: len(short_hash)], "utf-8")
-            return existing_hash == short_hash
+            return _short_hash(hs256, short_hash) == short_hash
     except:
         return False
 
@@ -90,85 +97,358 @@ def _rewrite_url(url, branch=None):
     return url
 
 
-def _download_file(url, dest):
-    response = requests.get(url)
+# Copy from src (stream) to a temporary file next to dest, verifying its hash
+# if known, and then move it into place. So dest is never left partially
+# written.
+def _write_file(src, dest, short_hash=None):
+    import os
+
+    hs256 = None
+    if short_hash:
+        try:
+            import hashlib
+
+            hs256 = hashlib.sha256()
+        except ImportError:
+            pass
+
+    _ensure_path_exists(dest)
+    temp = dest + ".tmp"
+    with open(temp, "wb") as f:
+
+        def write(buf):
+            f.write(buf)
+            if hs256:
+                hs256.update(buf)
+
+        _chunk(src, write)
+
+    if hs256 and _short_hash(hs256, short_hash) != short_hash:
+        print("Hash mismatch:", dest)
+        os.remove(temp)
+        return False
     try:
-        if response.status_code != 200:
-            print("Error", response.status_code, "requesting", url)
-            return False
+        os.remove(dest)
+    except OSError:
+        pass
+    os.rename(temp, dest)
+    return True
+
+
+# Returns the value of the named (lower case) response header, or None.
+def _header(response, name):
+    for k, v in response.headers.items():
+        if k.lower() == name:
+            return v
+    return None
+
+
+# Fetches urls over a keep-alive session, optionally caching responses in the
+# cache directory: package json by url, revalidated with the ETag or
+# Last-Modified of the cached response (and used as is if the server can't be
+# reached), and files, which never change, by their hash.
+class _Fetcher:
+    def __init__(self, cache=None):
+        self.session = requests.Session()
+        self.cache = cache.rstrip("/") if cache else None
+
+    def close(self):
+        self.session.close()
+
+    def get_json(self, url):
+        import json
+
+        entry = None
+        headers = {}
+        if self.cache:
+            import binascii
+
+            path = "{}/json/{:08x}.json".format(self.cache, binascii.crc32(url.encode()))
+            try:
+                with open(path) as f:
+                    entry = json.load(f)
+                if entry["url"] != url:
+                    entry = None
+            except (OSError, ValueError, KeyError):
+                entry = None
+            if entry:
+                if entry["etag"]:
+                    headers["If-None-Match"] = entry["etag"]
+                if entry["modified"]:
+                    headers["If-Modified-Since"] = entry["modified"]
+
+        try:
+            response = self.session.get(url, headers=headers)
+        except OSError:
+            if entry:
+                print("Using cached", url)
+                return entry["json"]
+            raise
+        try:
+            if response.status_code == 304 and entry:
+                return entry["json"]
+            if response.status_code != 200:
+                return None
+            obj = response.json()
+        finally:
+            response.close()
+
+        if self.cache:
+            _ensure_path_exists(path)
+            with open(path, "w") as f:
+                json.dump(
+                    {
+                        "url": url,
+                        "etag": _header(response, "etag"),
+                        "modified": _header(response, "last-modified"),
+                        "json": obj,
+                    },
+                    f,
+                )
+        return obj
+
+    def download(self, url, dest, short_hash=None):
+        response = self.session.get(url)
+        try:
+            if response.status_code != 200:
+                print("Error", response.status_code, "requesting", url)
+                return False
 
+            print("Copying:", dest)
+            return _write_file(response.raw, dest, short_hash)
+        finally:
+            response.close()
+
+    # Returns the path of the cached file with this hash, downloading it from
+    # url if it isn't cached yet, or None if there's no cache or the download
+    # failed.
+    def cached(self, url, short_hash):
+        if not self.cache or not short_hash:
+            return None
+        path = "{}/file/{}".format(self.cache, short_hash)
+        if _check_exists(path, short_hash) or self.download(url, path, short_hash):
+            return path
+        return None
+
+    def fetch(self, url, dest, short_hash=None):
+        path = self.cached(url, short_hash)
+        if not path:
+            return self.download(url, dest, short_hash)
         print("Copying:", dest)
-        _ensure_path_exists(dest)
-        with open(dest, "wb") as f:
-            _chunk(response.raw, f.write)
+        with open(path, "rb") as f:
+            return _write_file(f, dest, short_hash)
+
+
+# A stream of the next size bytes of f.
+class _Section:
+    def __init__(self, f, size):
+        self.f = f
+        self.size = size
+
+    def readinto(self, buf):
+        if not self.size:
+            return 0
+        if len(buf) > self.size:
+            buf = memoryview(buf)[: self.size]
+        n = self.f.readinto(buf)
+        self.size -= n
+        return n
+
+
+# Read from src (stream) until buf is full or the stream ends, returning the
+# number of bytes read.
+def _read_full(src, buf):
+    buf = memoryview(buf)
+    n = 0
+    while n < len(buf):
+        r = src.readinto(buf[n:])
+        if not r:
+            break
+        n += r
+    return n
 
-        return True
-    finally:
-        response.close()
 
+# Returns true if this device can extract package archives.
+def _can_extract():
+    try:
+        import deflate
+
+        return hasattr(deflate, "DeflateIO")
+    except ImportError:
+        return False
 
-def _install_json(package_json_url, index, target, version, mpy):
-    response = requests.get(_rewrite_url(package_json_url, version))
+
+# Extract a package archive (a .tar.gz of the package files, see
+# tools/build.py) from src (stream) to target, streaming each file to flash and
+# verifying it against the hashes dict of target path -> short hash. Files
+# in done are skipped, and extracted files are added to it.
+def _extract_archive(src, target, hashes, done):
+    import deflate
+
+    stream = deflate.DeflateIO(src, deflate.GZIP, _ARCHIVE_WBITS)
+    buf = bytearray(512)
+    while _read_full(stream, buf) == 512 and buf[0]:
+        # Read the name and size from the ustar header.
+        name = str(bytes(buf[:100]).rstrip(b"\0"), "utf-8")
+        size = int(bytes(buf[124:136]).rstrip(b" \0") or b"0", 8)
+        dest = target + "/" + name
+        section = _Section(stream, size)
+        if name in hashes and dest not in done:
+            print("Extracting:", dest)
+            if _write_file(section, dest, hashes[name]):
+                done.add(dest)
+        # Skip the rest of the file, and the padding to the next 512 byte block.
+        _chunk(section, lambda _: None)
+        _read_full(stream, memoryview(buf)[: -size % 512])
+    # Read to the end so that a connection can be reused.
+    _chunk(stream, lambda _: None)
+    _chunk(src, lambda _: None)
+
+
+# Install the files of a package from its archive, from the cache if enabled
+# or else streamed straight from the server.
+def _install_archive(fetcher, url, short_hash, target, hashes, done):
     try:
-        if response.status_code != 200:
-            print("Package not found:", package_json_url)
-            return False
+        path = fetcher.cached(url, short_hash)
+        if path:
+            with open(path, "rb") as f:
+                _extract_archive(f, target, hashes, done)
+            return
+        response = fetcher.session.get(url)
+        try:
+            if response.status_code != 200:
+                print("Error", response.status_code, "requesting", url)
+                return
+            _extract_archive(response.raw, target, hashes, done)
+        finally:
+            response.close()
+    except (OSError, ValueError) as e:
+        print("Error extracting", url, e)
+
+
+# Add the files of a package json to its resolved entry, and resolve its
+# dependencies.
+def _resolve_json(package_json_url, index, target, version, mpy, fetcher, resolved, entry):
+    _, files, archives, deps = entry
+    package_json = fetcher.get_json(_rewrite_url(package_json_url, version))
+    if package_json is None:
+        print("Package not found:", package_json_url)
+        return False
 
-        package_json = response.json()
-    finally:
-        response.close()
+    archive_hash = package_json.get("archive")
+    if archive_hash and _can_extract():
+        archive_url = "{}/file/{}/{}".format(index, archive_hash[:2], archive_hash)
+        archives.append((target, archive_url, archive_hash, dict(package_json["hashes"])))
     for target_path, short_hash in package_json.get("hashes", ()):
-        fs_target_path = target + "/" + target_path
-        if _check_exists(fs_target_path, short_hash):
-            print("Exists:", fs_target_path)
-        else:
-            file_url = "{}/file/{}/{}".format(index, short_hash[:2], short_hash)
-            if not _download_file(file_url, fs_target_path):
-                print("File not found: {} {}".format(target_path, short_hash))
-                return False
+        file_url = "{}/file/{}/{}".format(index, short_hash[:2], short_hash)
+        files.append((target + "/" + target_path, file_url, short_hash))
     base_url = package_json_url.rpartition("/")[0]
     for target_path, url in package_json.get("urls", ()):
-        fs_target_path = target + "/" + target_path
         is_full_url = any(url.startswith(p) for p in allowed_mip_url_prefixes)
         if base_url and not is_full_url:
             url = f"{base_url}/{url}"  # Relative URLs
-        if not _download_file(_rewrite_url(url, version), fs_target_path):
-            print("File not found: {} {}".format(target_path, url))
-            return False
+        files.append((target + "/" + target_path, _rewrite_url(url, version), None))
     for dep, dep_version in package_json.get("deps", ()):
-        if not _install_package(dep, index, target, dep_version, mpy):
+        deps.append(dep)
+        if not _resolve_package(dep, index, target, dep_version, mpy, fetcher, resolved):
             return False
     return True
 
 
-def _install_package(package, index, target, version, mpy):
+# Resolve a package and, recursively, its dependencies into the resolved dict
+# of package -> (version, files, archives, deps), where files are the files to
+# install, as (path, url, short hash or None), archives are the archives to
+# install them from when possible, as (target, url, short hash, hashes dict),
+# and deps are the names of the packages it depends on. Packages already
+# resolved are skipped, unless a specific version is required where "latest"
+# was resolved, in which case the pinned version replaces it. Requiring two
+# different versions of a package is an error.
+def _resolve_package(package, index, target, version, mpy, fetcher, resolved):
+    if version == "latest":
+        version = None
+    if package in resolved:
+        resolved_version = resolved[package][0]
+        if not version or version == resolved_version:
+            return True
+        if resolved_version:
+            print("Version conflict: {} {} and {}".format(package, resolved_version, version))
+            return False
+    entry = resolved[package] = (version, [], [], [])
+
     if any(package.startswith(p) for p in allowed_mip_url_prefixes):
         if package.endswith(".py") or package.endswith(".mpy"):
-            print("Downloading {} to {}".format(package, target))
-            return _download_file(
-                _rewrite_url(package, version), target + "/" + package.rsplit("/")[-1]
+            entry[1].append(
+                (target + "/" + package.rsplit("/")[-1], _rewrite_url(package, version), None)
             )
+            return True
         else:
-            if not package.endswith(".json"):
-                if not package.endswith("/"):
-                    package += "/"
-                package += "package.json"
-            print("Installing {} to {}".format(package, target))
+            package_json_url = package
+            if not package_json_url.endswith(".json"):
+                if not package_json_url.endswith("/"):
+                    package_json_url += "/"
+                package_json_url += "package.json"
+            print("Resolving {}".format(package_json_url))
     else:
-        if not version:
-            version = "latest"
-        print("Installing {} ({}) from {} to {}".format(package, version, index, target))
+        print("Resolving {} ({}) from {}".format(package, version or "latest", index))
 
         mpy_version = (
             sys.implementation._mpy & 0xFF if mpy and hasattr(sys.implementation, "_mpy") else "py"
         )
 
-        package = "{}/package/{}/{}/{}.json".format(index, mpy_version, package, version)
+        package_json_url = "{}/package/{}/{}/{}.json".format(
+            index, mpy_version, package, version or "latest"
+        )
 
-    return _install_json(package, index, target, version, mpy)
+    return _resolve_json(package_json_url, index, target, version, mpy, fetcher, resolved, entry)
+
+
+# Add the files and archives of a resolved package and its dependencies to
+# the lists to install, in dependency order. Packages that were only
+# depended on by a version that has since been replaced aren't included.
+def _collect(package, resolved, files, archives, seen):
+    if package in seen:
+        return
+    seen.add(package)
+    _, package_files, package_archives, deps = resolved[package]
+    files.extend(package_files)
+    archives.extend(package_archives)
+    for dep in deps:
+        _collect(dep, resolved, files, archives, seen)
+
+
+# Download the files that aren't already installed, from an archive with a
+# single request per package where possible, and then individually for any
+# files that couldn't be extracted. Files that are present with the right hash
+# are skipped, so an interrupted install can be resumed by running it again.
+def _install_files(fetcher, files, archives):
+    seen = set()
+    for target, url, archive_hash, hashes in archives:
+        missing = False
+        for target_path, short_hash in hashes.items():
+            fs_target_path = target + "/" + target_path
+            if fs_target_path in seen:
+                # Installed from an earlier archive.
+                continue
+            if _check_exists(fs_target_path, short_hash):
+                print("Exists:", fs_target_path)
+                seen.add(fs_target_path)
+            else:
+                missing = True
+        if missing:
+            _install_archive(fetcher, url, archive_hash, target, hashes, seen)
+    for fs_target_path, url, short_hash in files:
+        if fs_target_path in seen:
+            continue
+        seen.add(fs_target_path)
+        if short_hash and _check_exists(fs_target_path, short_hash):
+            print("Exists:", fs_target_path)
+        elif not fetcher.fetch(url, fs_target_path, short_hash):
+            print("File not found: {} {}".format(fs_target_path, url))
+            return False
+    return True
 
 
-def install(package, index=None, target=None, version=None, mpy=True):
+def install(package, index=None, target=None, version=None, mpy=True, cache=None):
     if not target:
         for p in sys.path:
             if not p.startswith("/rom") and p.endswith("/lib"):
@@ -181,7 +461,23 @@ def install(package, index=None, target=None, version=None, mpy=True):
     if not index:
         index = _PACKAGE_INDEX
 
-    if _install_package(package, index.rstrip("/"), target, version, mpy):
-        print("Done")
-    else:
-        print("Package may be partially installed")
+    print("Installing {} to {}".format(package, target))
+    # Resolve the whole dependency graph before writing anything, then
+    # download the files over a single keep-alive connection per host.
+    fetcher = _Fetcher(cache)
+    try:
+        resolved = {}
+        files = []
+        archives = []
+        if not _resolve_package(
+            package, index.rstrip("/"), target, version, mpy, fetcher, resolved
+        ):
+            print("Package not installed")
+            return
+        _collect(package, resolved, files, archives, set())
+        if _install_files(fetcher, files, archives):
+            print("Done")
+        else:
+            print("Package partially installed, install it again to resume")
+    finally:
+        fetcher.close()
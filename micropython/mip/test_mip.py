@@ -0,0 +1,174 @@
+import io
+import os
+import sys
+
+# The body readers of the real requests module, which mip streams archives from.
+sys.path.append("../../python-ecosys/requests")
+from requests import _ChunkedReader, _LengthReader
+
+del sys.modules["requests"]
+
+
+class requests:
+    class Session:
+        def close(self):
+            pass
+
+
+sys.modules["requests"] = requests
+# ruff: noqa: E402
+import mip
+
+
+class Fetcher:
+    def __init__(self, packages):
+        self.packages = packages
+
+    def get_json(self, url):
+        return self.packages.get(url)
+
+
+def package_json(hashes, deps=(), archive=None):
+    obj = {"v": 1, "hashes": hashes, "deps": deps, "version": ""}
+    if archive:
+        obj["archive"] = archive
+    return obj
+
+
+def resolve(packages, package):
+    resolved = {}
+    files = []
+    archives = []
+    fetcher = Fetcher({"https://index/package/py/" + k: v for k, v in packages.items()})
+    assert mip._resolve_package(package, "https://index", "/lib", None, False, fetcher, resolved)
+    mip._collect(package, resolved, files, archives, set())
+    return files, archives
+
+
+def test_dependency_order():
+    files, _ = resolve(
+        {
+            "a/latest.json": package_json([["a.py", "a000"]], [["b", "latest"]]),
+            "b/latest.json": package_json([["b.py", "b000"]]),
+        },
+        "a",
+    )
+    assert files == [
+        ("/lib/a.py", "https://index/file/a0/a000", "a000"),
+        ("/lib/b.py", "https://index/file/b0/b000", "b000"),
+    ], files
+
+
+def test_shared_dependency():
+    files, _ = resolve(
+        {
+            "a/latest.json": package_json([["a.py", "a000"]], [["b", "latest"], ["c", "latest"]]),
+            "b/latest.json": package_json([["b.py", "b000"]], [["c", "latest"]]),
+            "c/latest.json": package_json([["c.py", "c000"]]),
+        },
+        "a",
+    )
+    assert [f[0] for f in files] == ["/lib/a.py", "/lib/b.py", "/lib/c.py"], files
+
+
+def test_pinned_replaces_latest():
+    # pkg requires the latest dep, and then other requires dep 1.0, which
+    # must replace the latest dep along with its files, archive and deps.
+    files, archives = resolve(
+        {
+            "root/latest.json": package_json([], [["pkg", "latest"], ["other", "latest"]]),
+            "pkg/latest.json": package_json([["p.py", "p000"]], [["dep", "latest"]]),
+            "other/latest.json": package_json([["o.py", "o000"]], [["dep", "1.0"]]),
+            "dep/latest.json": package_json([["d.py", "d111"]], [["stale", "latest"]], "da11"),
+            "dep/1.0.json": package_json([["d.py", "d100"]]),
+            "stale/latest.json": package_json([["s.py", "s000"]]),
+        },
+        "root",
+    )
+    assert [f for f in files if f[0] == "/lib/d.py"] == [
+        ("/lib/d.py", "https://index/file/d1/d100", "d100")
+    ], files
+    assert "/lib/s.py" not in [f[0] for f in files], files
+    assert not [a for a in archives if a[2] == "da11"], archives
+
+
+def test_version_conflict():
+    resolved = {}
+    fetcher = Fetcher(
+        {
+            "https://index/package/py/a/latest.json": package_json(
+                [], [["b", "1.0"], ["c", "latest"]]
+            ),
+            "https://index/package/py/b/1.0.json": package_json([]),
+            "https://index/package/py/c/latest.json": package_json([], [["b", "2.0"]]),
+        }
+    )
+    assert not mip._resolve_package("a", "https://index", "/lib", None, False, fetcher, resolved)
+
+
+def test_archive_shared_path():
+    # b's archive also contains a.py, which a's archive installed, so only
+    # a's archive is fetched when the rest of b's files exist.
+    extracted = []
+
+    def install_archive(fetcher, url, short_hash, target, hashes, done):
+        extracted.append(short_hash)
+        for target_path in hashes:
+            done.add(target + "/" + target_path)
+
+    install_archive_, check_exists = mip._install_archive, mip._check_exists
+    mip._install_archive = install_archive
+    mip._check_exists = lambda path, short_hash: path != "/lib/a.py"
+    try:
+        archives = [
+            ("/lib", "https://index/file/aa/aa00", "aa00", {"a.py": "a000"}),
+            ("/lib", "https://index/file/bb/bb00", "bb00", {"a.py": "a000", "b.py": "b000"}),
+        ]
+        assert mip._install_files(None, [], archives)
+    finally:
+        mip._install_archive, mip._check_exists = install_archive_, check_exists
+    assert extracted == ["aa00"], extracted
+
+
+# tools/build.py's archive of a.py and pkg/b.py, containing "print('a')\n"
+# and "print('b')\n".
+ARCHIVE = bytes.fromhex(
+    "1f8b0800000000000203edd1310a84301085e1d49ec22edab823c9bae789cd220b223116de7e87"
+    "3482bd82e4ff9a37bc66602674cb6e2e266af03ea73aa748ef8e39f7c3dbf5a61673836d4d21ea"
+    "4a53a6254e736a6cb06d6550e0ff7fdfd7d82dfb953b440ddee754e714e9dd31e7fee3b4aae58e"
+    "036c6b0a515796faff38cda9b1a36d2b03000000000000000000000080e7f903894e568200280000"
+)
+
+
+def test_extract_response_body():
+    # Without a cache, archives are extracted straight from the response body.
+    if not mip._can_extract():
+        return
+    chunked = b"".join(
+        b"%x\r\n" % len(ARCHIVE[i : i + 50]) + ARCHIVE[i : i + 50] + b"\r\n"
+        for i in range(0, len(ARCHIVE), 50)
+    )
+    for raw in (
+        _LengthReader(io.BytesIO(ARCHIVE), len(ARCHIVE)),
+        _ChunkedReader(io.BytesIO(chunked + b"0\r\n\r\n")),
+    ):
+        done = set()
+        mip._extract_archive(raw, "test_lib", {"a.py": "62bdb208", "pkg/b.py": "82c7d03c"}, done)
+        assert done == {"test_lib/a.py", "test_lib/pkg/b.py"}, done
+        assert raw._eof
+        with open("test_lib/a.py") as f:
+            assert f.read() == "print('a')\n"
+        with open("test_lib/pkg/b.py") as f:
+            assert f.read() == "print('b')\n"
+        os.remove("test_lib/a.py")
+        os.remove("test_lib/pkg/b.py")
+        os.rmdir("test_lib/pkg")
+        os.rmdir("test_lib")
+
+
+test_dependency_order()
+test_shared_dependency()
+test_pinned_replaces_latest()
+test_version_conflict()
+test_archive_shared_path()
+test_extract_response_body()
@@ -1,6 +1,6 @@
 metadata(
     description="SenML serialisation for MicroPython.",
-    version="0.1.1",
+    version="0.2.0",
     pypi_publish="micropython-senml",
 )
 
@@ -26,4 +26,5 @@ THE SOFTWARE.
 from .senml_base import SenmlBase
 from .senml_pack import SenmlPack
 from .senml_record import SenmlRecord
+from .senml_series import SenmlSeries
 from .senml_unit import SenmlUnits
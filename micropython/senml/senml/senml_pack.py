@@ -72,6 +72,23 @@ class SenmlPack(SenmlBase):
         "ut": "ut",
     }
 
+    cbor_mappings = {
+        "bn": -2,
+        "bt": -3,
+        "bu": -4,
+        "bv": -5,
+        "bs": -16,
+        "n": 0,
+        "u": 1,
+        "v": 2,
+        "vs": 3,
+        "vb": 4,
+        "vd": 8,
+        "s": 5,
+        "t": 6,
+        "ut": 7,
+    }
+
     def __init__(self, name, callback=None):
         """
         initialize the object
@@ -277,47 +294,15 @@ class SenmlPack(SenmlBase):
         :return: None
         """
         records = cbor2.loads(data)  # load the raw senml data
-        naming_map = {
-            "bn": -2,
-            "bt": -3,
-            "bu": -4,
-            "bv": -5,
-            "bs": -16,
-            "n": 0,
-            "u": 1,
-            "v": 2,
-            "vs": 3,
-            "vb": 4,
-            "vd": 8,
-            "s": 5,
-            "t": 6,
-            "ut": 7,
-        }
-        self._process_incomming_data(records, naming_map)
+        self._process_incomming_data(records, SenmlPack.cbor_mappings)
 
     def to_cbor(self):
         """
         render the content of this object to a cbor byte array
         :return: a byte array
         """
-        naming_map = {
-            "bn": -2,
-            "bt": -3,
-            "bu": -4,
-            "bv": -5,
-            "bs": -16,
-            "n": 0,
-            "u": 1,
-            "v": 2,
-            "vs": 3,
-            "vb": 4,
-            "vd": 8,
-            "s": 5,
-            "t": 6,
-            "ut": 7,
-        }
         converted = []
-        self._build_rec_dict(naming_map, converted)
+        self._build_rec_dict(SenmlPack.cbor_mappings, converted)
         return cbor2.dumps(converted)
 
     def add(self, item):
@@ -0,0 +1,196 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2023 Arduino SA
+Copyright (c) 2018 KPN (Jan Bogaerts)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from array import array
+import io
+import json
+import math
+import cbor2
+from senml.senml_base import SenmlBase
+from senml.senml_pack import SenmlPack
+
+
+class SenmlSeries(SenmlBase):
+    """
+    represents a time series of measurements of a single sensor, stored in arrays instead of record objects.
+    Times are stored as offsets in milliseconds from the base time, which is the time of the first measurement.
+    The series is rendered as a senml pack with the name of the series as base name, and the base time, base unit
+    and (for integer series) base value in the first record.
+    """
+
+    def __init__(self, name, unit=None, typecode="f"):
+        """
+        create a new series
+        :param name: the name of the sensor
+        :param unit: optional unit of the values
+        :param typecode: the array type code of the values: 'f' for floats (single precision) or 'l' for integers
+        """
+        if typecode not in ("f", "l"):
+            raise Exception("invalid typecode, 'f' or 'l' expected")
+        self.name = name
+        self.unit = unit
+        self.base_time = None
+        self._times = array("l")
+        self._values = array(typecode)
+        self._parent = None
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        """
+        walk over the measurements
+        :return: an iterator over (time, value) tuples
+        """
+        for i in range(len(self._values)):
+            yield self._time(i), self._values[i]
+
+    def _time(self, i):
+        return self.base_time + self._offset(i)
+
+    def add(self, time, value):
+        """
+        add a measurement to the series
+        :param time: the time of the measurement, in seconds. The first one becomes the base time
+        :param value: the measured number
+        :return: None
+        """
+        if self.base_time is None:
+            self.base_time = time
+        ms = round((time - self.base_time) * 1000)
+        if not -0x80000000 <= ms <= 0x7FFFFFFF:
+            raise Exception("time too far from the base time of the series")
+        self._values.append(value)
+        self._times.append(ms)
+
+    def clear(self):
+        """
+        remove all measurements, the next one added sets a new base time
+        :return: None
+        """
+        self._times = array("l")
+        self._values = array(self._values.typecode)
+        self.base_time = None
+
+    def _base_value(self):
+        """
+        the base value for integer series: the midpoint of the values, which keeps the deltas small.
+        :return: a number or None
+        """
+        if self._values.typecode != "l" or not self._values:
+            return None
+        return (min(self._values) + max(self._values)) // 2
+
+    def _first_rec(self, naming_map):
+        rec = {naming_map["bn"]: self.name}
+        if self.base_time is not None:
+            rec[naming_map["bt"]] = self.base_time
+        if self.unit:
+            rec[naming_map["bu"]] = self.unit
+        base_value = self._base_value()
+        if base_value:
+            rec[naming_map["bv"]] = base_value
+        return rec
+
+    def _offset(self, i):
+        ms = self._times[i]
+        return ms // 1000 if ms % 1000 == 0 else ms / 1000
+
+    def to_json(self, stream=None):
+        """
+        render the series to senml json, without building records. Values that are nan or infinite
+        raise an exception, as json can't represent them.
+        :param stream: optional stream to write to, instead of returning a string
+        :return: a string, or None when a stream is given
+        """
+        out = io.StringIO() if stream is None else stream
+        base_value = self._base_value() or 0
+        is_float = self._values.typecode == "f"
+        fmt = '{"t":%s,"v":%.7g}' if is_float else '{"t":%s,"v":%d}'
+        out.write("[")
+        for i in range(len(self._values)):
+            value = self._values[i]
+            if is_float and not math.isfinite(value):
+                raise Exception("senml json can't represent the value " + str(value))
+            rec = fmt % (json.dumps(self._offset(i)), value - base_value)
+            if i == 0:
+                # Merge the base fields into the first record.
+                rec = json.dumps(self._first_rec(SenmlPack.json_mappings))[:-1] + "," + rec[1:]
+            else:
+                out.write(",")
+            out.write(rec)
+        out.write("]")
+        if stream is None:
+            return out.getvalue()
+
+    def to_cbor(self, stream=None, bufsize=256):
+        """
+        render the series to senml cbor, without building records.
+        :param stream: optional stream to write to, instead of returning a byte array
+        :param bufsize: when writing to a stream, the size of the chunks to write
+        :return: a byte array, or None when a stream is given
+        """
+        naming_map = SenmlPack.cbor_mappings
+        # Values are single precision, so floats are written in at most 5 bytes.
+        encoder = cbor2.CBORBufferEncoder(shortest_float=True)
+        encode = encoder.encode
+        base_value = self._base_value() or 0
+        encoder.write_head(0x80, len(self._values))
+        for i in range(len(self._values)):
+            if i == 0:
+                first = self._first_rec(naming_map)
+                encoder.write_head(0xA0, 2 + len(first))
+                for key in first:
+                    encode(key)
+                    encode(first[key])
+            else:
+                encoder.write(b"\xa2")
+            encode(naming_map["t"])
+            encode(self._offset(i))
+            encode(naming_map["v"])
+            encode(self._values[i] - base_value)
+            if stream is not None and encoder.pos >= bufsize:
+                stream.write(encoder.getvalue())
+                encoder.pos = 0
+        if stream is None:
+            return encoder.getvalue()
+        if encoder.pos:
+            stream.write(encoder.getvalue())
+
+    def _build_rec_dict(self, naming_map, appendTo):
+        """
+        converts the series to senml records, used when the series is part of a pack.
+        :param naming_map: a dictionary used to pick the correct field names for either senml json or senml cbor
+        :return: None
+        """
+        base_time = self._parent.base_time if self._parent else None
+        base_value = self._parent.base_value if self._parent else None
+        for i in range(len(self._values)):
+            rec = {naming_map["n"]: self.name}
+            rec[naming_map["v"]] = self._values[i] - (base_value or 0)
+            rec[naming_map["t"]] = self._time(i) - (base_time or 0)
+            if self.unit:
+                rec[naming_map["u"]] = self.unit
+            appendTo.append(rec)
@@ -0,0 +1,77 @@
+import json
+import cbor2
+from senml import SenmlPack, SenmlSeries, SenmlUnits
+
+
+def resolve(records, naming_map):
+    # Applies the base fields to each record, returning (name, time, value, unit) tuples.
+    res = []
+    bn, bt, bv, bu = "", 0, 0, None
+    for rec in records:
+        bn = rec.get(naming_map["bn"], bn)
+        bt = rec.get(naming_map["bt"], bt)
+        bv = rec.get(naming_map["bv"], bv)
+        bu = rec.get(naming_map["bu"], bu)
+        res.append(
+            (
+                bn + rec.get(naming_map["n"], ""),
+                bt + rec.get(naming_map["t"], 0),
+                bv + rec[naming_map["v"]],
+                rec.get(naming_map["u"], bu),
+            )
+        )
+    return res
+
+
+def assert_same(data, naming_map, pack_data):
+    # Compares the series' own rendering with that of a pack holding it.
+    got = resolve(data, naming_map)
+    expected = resolve(pack_data, naming_map)
+    assert len(got) == len(expected), (got, expected)
+    for a, b in zip(got, expected):
+        assert a[0] == b[0] and a[3] == b[3], (a, b)
+        assert abs(a[1] - b[1]) < 0.001, (a, b)
+        assert abs(a[2] - b[2]) <= abs(b[2]) * 1e-6, (a, b)
+
+
+def check(series):
+    pack = SenmlPack("")
+    pack.add(series)
+    data = series.to_json()
+    assert_same(json.loads(data), SenmlPack.json_mappings, json.loads(pack.to_json()))
+    data = series.to_cbor()
+    assert_same(cbor2.loads(data), SenmlPack.cbor_mappings, cbor2.loads(pack.to_cbor()))
+    pack.remove(series)
+    return data
+
+
+series = SenmlSeries("urn:dev:temp", unit=SenmlUnits.SENML_UNIT_DEGREES_CELSIUS)
+for i in range(30):
+    series.add(1700000000 + i * 0.5, 20.5 + i / 4)
+data = check(series)
+# Floats are written in half or single precision, not as doubles.
+assert len(data) < len(cbor2.dumps(cbor2.loads(data))) - 8 * 30, data.hex()
+
+series = SenmlSeries("urn:dev:count", typecode="l")
+for i in range(30):
+    series.add(1700000000 + i, 100000 + i * 3)
+check(series)
+
+# A single measurement, and more than fit in a one byte array head.
+series = SenmlSeries("urn:dev:temp")
+series.add(1700000000.25, -1.5)
+check(series)
+for i in range(300):
+    series.add(1700000000.25 + i, i)
+check(series)
+
+series = SenmlSeries("urn:dev:temp")
+series.add(1700000000, float("nan"))
+try:
+    series.to_json()
+except Exception:
+    pass
+else:
+    raise AssertionError("nan written to json")
+value = cbor2.loads(series.to_cbor())[0][SenmlPack.cbor_mappings["v"]]
+assert value != value
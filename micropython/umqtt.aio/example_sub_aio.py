@@ -0,0 +1,30 @@
+import asyncio
+from umqtt.aio import MQTTClient
+
+# Publish test messages e.g. with:
+# mosquitto_pub -t foo_topic -m hello
+
+
+async def heartbeat(c):
+    n = 0
+    while True:
+        # QoS 1 publishes run concurrently with the subscription below.
+        await c.publish(b"heartbeat", b"%d" % n, qos=1)
+        n += 1
+        await asyncio.sleep(5)
+
+
+async def main(server="localhost"):
+    c = MQTTClient("umqtt_client", server, keepalive=30)
+    await c.connect()
+    await c.subscribe(b"foo_topic")
+    hb = asyncio.create_task(heartbeat(c))
+    try:
+        async for topic, msg in c:
+            print((topic, msg))
+    finally:
+        hb.cancel()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,7 @@
+metadata(
+    description='Lightweight MQTT client for MicroPython ("asyncio" version).', version="0.2.0"
+)
+
+require("umqtt.simple")
+
+package("umqtt")
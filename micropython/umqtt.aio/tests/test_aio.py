@@ -0,0 +1,156 @@
+import asyncio
+import struct
+from umqtt.aio import MQTTClient
+
+
+class Server:
+    # Stream for a fake MQTT server, which acknowledges what the client sends.
+    # PUBACKs are held back until `batch` publishes are waiting for one.
+    def __init__(self, batch=1):
+        self.batch = batch
+        self.rx = bytearray()
+        self.tx = bytearray()
+        self.event = asyncio.Event()
+        self.published = []
+        self.unacked = []
+        self.closed = False
+
+    def feed(self, data):
+        self.rx.extend(data)
+        self.event.set()
+
+    def send_publish(self, topic, msg):
+        body = struct.pack("!H", len(topic)) + topic + msg
+        self.feed(bytes((0x30, len(body))) + body)
+
+    def write(self, data):
+        self.tx.extend(data)
+
+    async def drain(self):
+        while len(self.tx) >= 2 and len(self.tx) >= 2 + self.tx[1]:
+            op, body = self.tx[0], bytes(self.tx[2 : 2 + self.tx[1]])
+            self.tx = self.tx[2 + len(body) :]
+            if op == 0x10:
+                self.feed(b"\x20\x02\x00\x00")
+            elif op & 0xF0 == 0x30:
+                n = body[0] << 8 | body[1]
+                i = 2 + n
+                if op & 6:
+                    self.unacked.append(body[i : i + 2])
+                    i += 2
+                self.published.append((body[2 : 2 + n], body[i:]))
+                if len(self.unacked) >= self.batch:
+                    for pid in self.unacked:
+                        self.feed(b"\x40\x02" + pid)
+                    self.unacked = []
+            elif op == 0x82:
+                self.feed(b"\x90\x03" + body[:2] + body[-1:])
+
+    async def readexactly(self, n):
+        while len(self.rx) < n:
+            if self.closed:
+                raise EOFError
+            self.event.clear()
+            await self.event.wait()
+        data = bytes(self.rx[:n])
+        self.rx = self.rx[n:]
+        return data
+
+    async def aclose(self):
+        self.closed = True
+        self.event.set()
+
+
+opened = []
+
+
+async def open_connection(host, port, ssl=None):
+    opened.append((host, port, ssl))
+    return server, server
+
+
+asyncio.open_connection = open_connection
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+async def test_publish():
+    global server
+    # The server only acknowledges once all five publishes were sent.
+    server = Server(batch=5)
+    c = MQTTClient(b"test", "localhost")
+    await c.connect()
+    assert opened.pop() == ("localhost", 1883, None)
+    msgs = [b"%d" % i for i in range(5)]
+    await asyncio.wait_for(asyncio.gather(*(c.publish(b"topic", msg, qos=1) for msg in msgs)), 1)
+    assert server.published == [(b"topic", msg) for msg in msgs], server.published
+    await c.flush()
+    assert await c.subscribe(b"topic", qos=1) == 1
+    await c.disconnect()
+
+
+async def test_receive():
+    global server
+    server = Server()
+    c = MQTTClient(b"test", "localhost")
+    await c.connect()
+    assert c.check_msg() is None
+    server.send_publish(b"a", b"1")
+    assert await c.wait_msg() == (b"a", b"1")
+    server.send_publish(b"b", b"2")
+    await settle()
+    assert c.check_msg() == (b"b", b"2")
+    assert c.check_msg() is None
+    server.send_publish(b"c", b"3")
+    async for msg in c:
+        assert msg == (b"c", b"3")
+        break
+
+    received = []
+    c.set_callback(lambda topic, msg: received.append((topic, msg)))
+    server.send_publish(b"d", b"4")
+    assert await c.wait_msg() is None
+    assert received == [(b"d", b"4")], received
+    await c.disconnect()
+
+
+async def test_connection_lost():
+    global server
+    server = Server(batch=2)
+    c = MQTTClient(b"test", "localhost")
+    await c.connect()
+    task = asyncio.create_task(c.publish(b"topic", b"msg", qos=1))
+    await settle()
+    await server.aclose()
+    for coro in (task, c.wait_msg()):
+        try:
+            await coro
+        except EOFError:
+            pass
+        else:
+            raise AssertionError("connection loss not raised")
+
+
+async def test_ssl():
+    global server
+    server = Server()
+    ctx = object()
+    c = MQTTClient(b"test", "localhost", ssl=ctx)
+    await c.connect()
+    assert opened.pop() == ("localhost", 8883, ctx)
+    await c.disconnect()
+    try:
+        MQTTClient(b"test", "localhost", ssl=True, ssl_params={"cert_reqs": 0})
+    except AssertionError:
+        pass
+    else:
+        raise AssertionError("ssl_params accepted")
+
+
+asyncio.run(test_publish())
+asyncio.run(test_receive())
+asyncio.run(test_connection_lost())
+asyncio.run(test_ssl())
@@ -0,0 +1,311 @@
+import asyncio
+import struct
+import time
+from . import simple
+from .simple import MQTTException, encode_props
+
+
+class MQTTClient(simple.MQTTClient):
+    # Received messages that aren't delivered to a callback are queued for
+    # the async iterator, up to this many before the reader stops reading.
+    QUEUE_SIZE = 16
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Concurrent publishes from separate tasks take the place of a window.
+        assert not self.window, "window is not supported"
+        # asyncio streams take an SSLContext, not wrap_socket() arguments.
+        assert not self.ssl_params, "ssl_params is not supported, pass an SSLContext as ssl"
+        self._stream = None
+        self._tasks = ()
+        self._out = []
+        self._wlock = asyncio.Lock()
+        self._inflight = {}  # pid -> [Event, result]
+        self._publishing = 0  # number of QoS 1 publishes awaiting PUBACK
+        self._acked = asyncio.Event()
+        self._queue = []
+        self._queued = asyncio.Event()
+        self._dequeued = asyncio.Event()
+        self._exc = None
+        self._last_tx = 0
+        self._last_rx = 0
+
+    # The packet builders of simple.MQTTClient send through here: packets
+    # are queued in the order they're built, and written by _drain().
+    def _send_packet(self, buf, op, end, extra=b""):
+        start = self._put_header(buf, op, end - 5 + len(extra))
+        self._out.append(buf[start:end])
+        if extra:
+            self._out.append(extra)
+
+    # Writes the queued packets. The stream is only written while holding
+    # the lock, as data written to it during a drain() would be lost.
+    async def _drain(self):
+        async with self._wlock:
+            out = self._out
+            if out:
+                self._out = []
+                for pkt in out:
+                    self._stream.write(pkt)
+                await self._stream.drain()
+        self._last_tx = time.ticks_ms()
+
+    async def _write(self, pkt):
+        self._out.append(pkt)
+        await self._drain()
+
+    async def _recv(self):
+        read = self._stream.readexactly
+        op = (await read(1))[0]
+        sz = 0
+        sh = 0
+        while True:
+            b = (await read(1))[0]
+            sz |= (b & 0x7F) << sh
+            if not b & 0x80:
+                break
+            sh += 7
+        return op, await read(sz) if sz else b""
+
+    def _next_pid(self):
+        pid = self.pid
+        while True:
+            pid = pid % 65535 + 1
+            if pid not in self._inflight:
+                self.pid = pid
+                return pid
+
+    # Sends the packet already written with packet id pid and waits for the
+    # matching ack.
+    async def _request(self, pid):
+        ack = self._inflight[pid] = [asyncio.Event(), None]
+        try:
+            await self._drain()
+            await ack[0].wait()
+        finally:
+            del self._inflight[pid]
+        if isinstance(ack[1], Exception):
+            raise ack[1]
+        return ack[1]
+
+    async def connect(self, clean_session=True, timeout=None, properties=None):
+        self._stream, _ = await asyncio.wait_for(
+            asyncio.open_connection(self.server, self.port, self.ssl or None), timeout
+        )
+        self._exc = None
+        self._out = []
+        try:
+            self._send_connect(clean_session, properties)
+            await self._drain()
+            op, resp = await asyncio.wait_for(self._recv(), timeout)
+            assert op == 0x20
+            res = self._connack(resp)
+        except BaseException:
+            await self._stream.aclose()
+            raise
+        self._last_rx = time.ticks_ms()
+        self._tasks = [asyncio.create_task(self._reader())]
+        if self.keepalive:
+            self._tasks.append(asyncio.create_task(self._pinger()))
+        return res
+
+    async def disconnect(self):
+        try:
+            await self._write(b"\xe0\0")
+        finally:
+            self._close(OSError(-1))
+            await self._stream.aclose()
+
+    async def ping(self):
+        await self._write(b"\xc0\0")
+
+    # Publishes msg to topic. With qos=1 this waits for the PUBACK, and any
+    # number of such publishes (up to the receive maximum of an MQTT 5
+    # server) can be in flight at once from separate tasks.
+    async def publish(self, topic, msg, retain=False, qos=0, properties=None):
+        await self._publish(
+            topic, msg, retain, qos, encode_props(properties) if properties else b""
+        )
+
+    # As simple.MQTTClient.publish_into(). The payload is copied out of the
+    # packet buffer, which is reused while this waits to send it.
+    async def publish_into(self, topic, fill, retain=False, qos=0, properties=None):
+        props = encode_props(properties) if properties else b""
+        buf, i, _ = self._publish_header(topic, qos, 0, props)
+        mv = memoryview(buf)
+        await self._publish(topic, bytes(mv[i : i + fill(mv[i:])]), retain, qos, props)
+
+    async def _publish(self, topic, msg, retain, qos, props):
+        assert qos in (0, 1)
+        if not qos:
+            self._send_publish(topic, msg, retain, 0, 0, props)
+            await self._drain()
+            return
+        while self._publishing >= self.receive_max:
+            if self._exc:
+                raise self._exc
+            self._acked.clear()
+            await self._acked.wait()
+        self._publishing += 1
+        try:
+            pid = self._next_pid()
+            self._send_publish(topic, msg, retain, 1, pid, props)
+            await self._request(pid)
+        finally:
+            self._publishing -= 1
+            self._acked.set()
+
+    # Subscribes to topic and returns the QoS granted by the server.
+    async def subscribe(self, topic, qos=0):
+        assert qos in (0, 1)
+        pid = self._next_pid()
+        self._send_subscribe(topic, qos, pid)
+        granted = await self._request(pid)
+        if granted >= 0x80:
+            raise MQTTException(granted)
+        return granted
+
+    async def unsubscribe(self, topic):
+        pid = self._next_pid()
+        buf = self._buf(5 + 2 + 1 + 2 + len(topic))
+        struct.pack_into("!H", buf, 5, pid)
+        i = 7
+        if self.version == 5:
+            buf[i] = 0  # no properties
+            i += 1
+        self._send_packet(buf, 0xA2, self._put_str(buf, i, topic))
+        await self._request(pid)
+
+    # Waits until all QoS 1 publishes in progress have been acknowledged,
+    # for publishes started in other tasks.
+    async def flush(self):
+        while self._publishing:
+            if self._exc:
+                raise self._exc
+            self._acked.clear()
+            await self._acked.wait()
+
+    # Everything sent by the server is processed by the reader task. These
+    # wait for the next message it receives, or take one already received,
+    # and return it as (topic, msg). With a callback set, messages are
+    # passed to it instead, and these return None.
+    async def wait_msg(self):
+        if not self.cb:
+            return await self.__anext__()
+        if self._exc:
+            raise self._exc
+        self._queued.clear()
+        await self._queued.wait()
+        if self._exc:
+            raise self._exc
+
+    def check_msg(self):
+        if self._queue:
+            self._dequeued.set()
+            return self._queue.pop(0)
+        return None
+
+    # Iterating over the client yields (topic, msg) for each received message
+    # when no callback is set, until the connection is lost.
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._queue:
+            if self._exc:
+                raise self._exc
+            self._queued.clear()
+            await self._queued.wait()
+        self._dequeued.set()
+        return self._queue.pop(0)
+
+    # Fails all pending operations and stops the background tasks.
+    def _close(self, exc):
+        if self._exc is None:
+            self._exc = exc
+        for ack in self._inflight.values():
+            ack[1] = exc
+            ack[0].set()
+        self._queued.set()
+        self._acked.set()
+        current = asyncio.current_task()
+        for t in self._tasks:
+            if t is not current:
+                t.cancel()
+        self._tasks = ()
+
+    async def _reader(self):
+        try:
+            while True:
+                op, data = await self._recv()
+                self._last_rx = time.ticks_ms()
+                if op & 0xF0 == 0x30:
+                    await self._recv_publish(op, data)
+                elif op in (0x40, 0x90, 0xB0):
+                    # PUBACK, SUBACK (result is the granted QoS, last after
+                    # any MQTT 5 properties) or UNSUBACK.
+                    pid = data[0] << 8 | data[1]
+                    ack = self._inflight.get(pid)
+                    if ack:
+                        if op == 0x90:
+                            ack[1] = data[-1]
+                        elif op == 0x40 and len(data) > 2 and data[2] >= 0x80:
+                            # An MQTT 5 PUBACK with an error reason code.
+                            ack[1] = MQTTException(data[2])
+                        ack[0].set()
+                elif op == 0xE0:
+                    # An MQTT 5 server may disconnect with a reason code.
+                    raise MQTTException(data[0] if data else 0)
+        except Exception as e:
+            self._close(e)
+            await self._stream.aclose()
+
+    async def _recv_publish(self, op, data):
+        topic_len = data[0] << 8 | data[1]
+        topic = data[2 : 2 + topic_len]
+        i = 2 + topic_len
+        if op & 6:
+            pid = data[i] << 8 | data[i + 1]
+            i += 2
+        if self.version == 5:
+            # Skip the properties.
+            n = 0
+            sh = 0
+            while True:
+                b = data[i]
+                i += 1
+                n |= (b & 0x7F) << sh
+                if not b & 0x80:
+                    break
+                sh += 7
+            i += n
+        msg = data[i:]
+        if self.cb:
+            self.cb(topic, msg)
+            self._queued.set()
+        else:
+            while len(self._queue) >= self.QUEUE_SIZE:
+                self._dequeued.clear()
+                await self._dequeued.wait()
+            self._queue.append((topic, msg))
+            self._queued.set()
+        if op & 6 == 2:
+            await self._write(struct.pack("!BBH", 0x40, 2, pid))
+        elif op & 6 == 4:
+            raise MQTTException("QoS 2 not supported")
+
+    # Sends a PINGREQ when nothing was sent for half the keepalive period,
+    # and drops the connection if the server was silent for 1.5 periods.
+    async def _pinger(self):
+        period = self.keepalive * 1000
+        try:
+            while True:
+                await asyncio.sleep_ms(period // 4)
+                now = time.ticks_ms()
+                if time.ticks_diff(now, self._last_rx) > period * 3 // 2:
+                    raise OSError(110)  # ETIMEDOUT
+                if time.ticks_diff(now, self._last_tx) >= period // 2:
+                    await self.ping()
+        except Exception as e:
+            self._close(e)
+            await self._stream.aclose()
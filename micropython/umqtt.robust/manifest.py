@@ -1,5 +1,5 @@
 metadata(
-    description='Lightweight MQTT client for MicroPython ("robust" version).', version="1.0.2"
+    description='Lightweight MQTT client for MicroPython ("robust" version).', version="1.1.1"
 )
 
 # Originally written by Paul Sokolovsky.
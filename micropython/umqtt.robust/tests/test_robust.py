@@ -0,0 +1,186 @@
+import io
+import os
+import sys
+import time
+
+
+CONNACK = b"\x20\x02\0\0"
+
+
+class Socket:
+    # Reads from data, then fails as if the connection dropped.
+    def __init__(self, data):
+        self.written = io.BytesIO()
+        self.data = io.BytesIO(data)
+
+    def settimeout(self, timeout):
+        pass
+
+    def setblocking(self, flag):
+        pass
+
+    def connect(self, address):
+        if self.data is None:
+            raise OSError(113)
+
+    def close(self):
+        pass
+
+    def write(self, buf, off=0, n=None):
+        if n is None:
+            n = len(buf) - off
+        return self.written.write(memoryview(buf)[off : off + n])
+
+    def read(self, n):
+        res = self.data.read(n)
+        if len(res) < n:
+            raise OSError(104)
+        return res
+
+
+class socket:
+    # Data sent by the server on each new connection, None to refuse it.
+    conns = []
+    socks = []
+
+    @staticmethod
+    def getaddrinfo(host, port):
+        return [(2, 1, 6, "", ("127.0.0.1", port))]
+
+    @staticmethod
+    def socket():
+        s = Socket(socket.conns.pop(0))
+        if s.data is not None:
+            socket.socks.append(s)
+        return s
+
+
+sys.modules["socket"] = socket
+# ruff: noqa: E402
+from umqtt import robust
+
+
+class MQTTClient(robust.MQTTClient):
+    def backoff(self, i):
+        return 0
+
+    def delay(self, i):
+        raise AssertionError("blocked in reconnect()")
+
+
+OUTBOX = "test_outbox.bin"
+
+
+def make_client(window=0):
+    try:
+        os.remove(OUTBOX)
+    except OSError:
+        pass
+    c = MQTTClient(b"test", "localhost", window=window)
+    c.set_outbox(OUTBOX, 1024)
+    return c
+
+
+def queued(c):
+    return [m[:2] for m in c.outbox.peek(100)[0]]
+
+
+def test_puback_lost():
+    socket.conns = [CONNACK]
+    c = make_client()
+    c.connect()
+    c.publish(b"t", b"1", qos=1)
+    assert not c._up
+    assert not c.inflight
+    assert queued(c) == [(b"t", b"1")], queued(c)
+    c.outbox.close()
+
+
+def test_windowed_puback_lost():
+    socket.conns = [CONNACK]
+    c = make_client(window=2)
+    c.connect()
+    c.publish(b"t", b"1", qos=1)
+    c.publish(b"t", b"2", qos=1)
+    # The window is full, so this waits for a PUBACK.
+    c.publish(b"t", b"3", qos=1)
+    assert not c._up
+    assert not c.inflight
+    assert queued(c) == [(b"t", b"1"), (b"t", b"2"), (b"t", b"3")], queued(c)
+    c.outbox.close()
+
+
+def test_drain_puback_lost():
+    socket.conns = [None, None]
+    c = make_client()
+    c.publish(b"t", b"1", qos=1)
+    c.publish(b"t", b"2", qos=1)
+    assert queued(c) == [(b"t", b"1"), (b"t", b"2")], queued(c)
+    # Reconnects and sends the outbox, then drops with one PUBACK received.
+    socket.conns = [CONNACK + b"\x40\x02\0\x01"]
+    socket.socks = []
+    c.publish(b"t", b"3", qos=1)
+    assert not c._up
+    assert not c.inflight
+    assert len(socket.socks) == 1
+    assert queued(c) == [(b"t", b"1"), (b"t", b"2"), (b"t", b"3")], queued(c)
+    # The next connection acknowledges all of it.
+    socket.conns = [CONNACK + b"\x40\x02\0\x03\x40\x02\0\x04\x40\x02\0\x05"]
+    c.check_msg()
+    assert not c.outbox.used()
+    c.outbox.close()
+
+
+def test_wait_msg_down():
+    socket.conns = [CONNACK, None]
+    c = make_client()
+    c.connect()
+    assert c.wait_msg() is None
+    assert not c._up
+    assert c.wait_msg() is None
+    c.outbox.close()
+
+
+def test_wait_msg_backoff():
+    # While disconnected, wait_msg() waits for the next reconnect attempt
+    # before returning, and check_msg() returns at once.
+    socket.conns = [None]
+    c = make_client()
+    c.backoff = lambda i: 100
+    c.publish(b"t", b"1", qos=1)
+    t = time.ticks_ms()
+    assert c.check_msg() is None
+    assert time.ticks_diff(time.ticks_ms(), t) < 50
+    assert c.wait_msg() is None
+    assert time.ticks_diff(time.ticks_ms(), t) >= 90
+    assert queued(c) == [(b"t", b"1")], queued(c)
+    c.outbox.close()
+
+
+def test_windowed_publish_error():
+    # Without an outbox, publish() retries after reconnecting, so the message
+    # it failed to send must not also be retransmitted from the window.
+    socket.conns = [CONNACK, CONNACK]
+    socket.socks = []
+    c = MQTTClient(b"test", "localhost", window=4)
+    c.connect()
+    c.publish(b"t", b"1", qos=1)
+
+    def write(buf, off=0, n=None):
+        raise OSError(104)
+
+    socket.socks[0].write = write
+    c.publish(b"t", b"2", qos=1)
+    assert len(socket.socks) == 2
+    assert sorted(m[1] for m in c.inflight.values()) == [b"1", b"2"], c.inflight
+
+
+try:
+    test_puback_lost()
+    test_windowed_puback_lost()
+    test_drain_puback_lost()
+    test_wait_msg_down()
+    test_wait_msg_backoff()
+    test_windowed_publish_error()
+finally:
+    os.remove(OUTBOX)
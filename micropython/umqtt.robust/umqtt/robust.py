@@ -1,13 +1,137 @@
 import time
+import random
+import struct
+from binascii import crc32
 from . import simple
 
+# Outbox record header: topic length, message length, CRC32, flags.
+_REC = "<HHIB"
+_REC_SIZE = 9
+_WRAP = 0xFFFF  # topic length of the marker that sends readers back to the start
+
+
+class Outbox:
+    # A bounded ring buffer of messages in a file: an 8 byte header holding
+    # the head and tail offsets, followed by size - 8 bytes of records. When
+    # full, the oldest records are dropped to make room for new ones.
+    def __init__(self, path, size):
+        self.cap = size - 8
+        try:
+            self.f = open(path, "r+b")
+            self.head, self.tail = struct.unpack("<II", self.f.read(8))
+            if self.f.seek(0, 2) != size or self.head >= self.cap or self.tail >= self.cap:
+                raise ValueError
+        except (OSError, ValueError):
+            self.f = open(path, "w+b")
+            zeros = memoryview(bytes(256))
+            n = size
+            while n:
+                n -= self.f.write(zeros[: min(n, 256)])
+            self.head = self.tail = 0
+            self._save()
+
+    # Returns the number of bytes taken by records.
+    def used(self):
+        return (self.tail - self.head) % self.cap
+
+    def _save(self):
+        self.f.seek(0)
+        self.f.write(struct.pack("<II", self.head, self.tail))
+        self.f.flush()
+
+    # Returns the offset and header of the record at offset i, following any
+    # wrap marker.
+    def _rec(self, i):
+        if i + _REC_SIZE > self.cap:
+            i = 0
+        self.f.seek(8 + i)
+        hdr = struct.unpack(_REC, self.f.read(_REC_SIZE))
+        if hdr[0] == _WRAP:
+            return self._rec(0)
+        return i, hdr
+
+    def put(self, topic, msg, retain, qos):
+        n = _REC_SIZE + len(topic) + len(msg)
+        # Leave room for a wrap marker and the gap that tells full from empty.
+        if n + _REC_SIZE + 1 > self.cap:
+            raise ValueError("message too large for outbox")
+        i = self.tail
+        if i + n <= self.cap:
+            while self.used() and (self.head - i) % self.cap <= n:
+                self._drop()
+        else:
+            # Records are contiguous, so this one goes at the start. The rest
+            # of the end is skipped by readers, using a marker unless it's too
+            # short to hold a record header.
+            while self.used() and (self.head >= i or self.head <= n):
+                self._drop()
+            if not self.used():
+                self.head = 0
+            elif i + _REC_SIZE <= self.cap:
+                self.f.seek(8 + i)
+                self.f.write(struct.pack(_REC, _WRAP, 0, 0, 0))
+            i = 0
+        flags = qos << 1 | retain
+        self.f.seek(8 + i)
+        self.f.write(struct.pack(_REC, len(topic), len(msg), crc32(msg, crc32(topic)), flags))
+        self.f.write(topic)
+        self.f.write(msg)
+        self.tail = (i + n) % self.cap
+        self._save()
+
+    def _drop(self):
+        i, hdr = self._rec(self.head)
+        self.head = (i + _REC_SIZE + hdr[0] + hdr[1]) % self.cap
+
+    # Reads up to n records from the head without removing them. Returns the
+    # list of (topic, msg, retain, qos) and the offset to pass to remove().
+    def peek(self, n):
+        res = []
+        i = self.head
+        while n and i != self.tail:
+            i, (tlen, mlen, crc, flags) = self._rec(i)
+            topic = self.f.read(tlen)
+            msg = self.f.read(mlen)
+            if crc32(msg, crc32(topic)) != crc:
+                # Corrupted, most likely by a write interrupted by power loss.
+                i = self.tail
+                break
+            res.append((topic, msg, flags & 1, flags >> 1))
+            i = (i + _REC_SIZE + tlen + mlen) % self.cap
+            n -= 1
+        return res, i
+
+    def remove(self, i):
+        self.head = i
+        self._save()
+
+    def close(self):
+        self.f.close()
+
 
 class MQTTClient(simple.MQTTClient):
     DELAY = 2
+    MAX_DELAY = 60
     DEBUG = False
+    # Number of outbox messages sent per window when draining it.
+    BATCH = 16
+
+    outbox = None
+    _raw = False
+    _up = False
+    _attempt = 0
+    _retry_at = 0
+    _connect_props = None
+
+    # Returns the delay in milliseconds before reconnect attempt i: DELAY
+    # doubled for each failed attempt up to MAX_DELAY, randomised over its
+    # upper half so that many clients don't retry in lockstep.
+    def backoff(self, i):
+        d = int(min(self.DELAY * (1 << min(i - 1, 16)), self.MAX_DELAY) * 1000)
+        return d // 2 + random.getrandbits(16) * d // 0x20000
 
     def delay(self, i):
-        time.sleep(self.DELAY)
+        time.sleep_ms(self.backoff(i))
 
     def log(self, in_reconnect, e):
         if self.DEBUG:
@@ -16,25 +140,120 @@ class MQTTClient(simple.MQTTClient):
             else:
                 print("mqtt: %r" % e)
 
+    # In outbox mode, publishing never blocks on a broken connection: messages
+    # are queued in a ring buffer file of the given size, reconnects are only
+    # attempted when their backoff delay has passed, and queued messages are
+    # sent after reconnecting.
+    def set_outbox(self, path, size=32768):
+        self.outbox = Outbox(path, size)
+
+    # The properties are also used for reconnects.
+    def connect(self, clean_session=True, timeout=None, properties=None):
+        self._connect_props = properties
+        res = super().connect(clean_session, timeout, properties)
+        self._up = True
+        self._attempt = 0
+        if self.outbox is not None:
+            self._drain()
+        return res
+
     def reconnect(self):
         i = 0
         while 1:
             try:
-                return super().connect(False)
+                return self.connect(False, None, self._connect_props)
             except OSError as e:
                 self.log(True, e)
                 i += 1
                 self.delay(i)
 
-    def publish(self, topic, msg, retain=False, qos=0):
+    # Sends the outbox in batches through the publish window, removing each
+    # batch once the server has acknowledged it.
+    def _drain(self):
+        window = self.window
+        self.window = max(window, self.BATCH)
+        raw = self._raw
+        self._raw = True
+        pids = []
+        try:
+            while self.outbox.used():
+                batch, end = self.outbox.peek(self.BATCH)
+                for topic, msg, retain, qos in batch:
+                    self._publish(topic, msg, retain, qos)
+                    if qos:
+                        pids.append(self.pid)
+                self.flush()
+                self.outbox.remove(end)
+                pids = []
+        except OSError:
+            # The batch stays in the outbox, don't also retransmit it.
+            for pid in pids:
+                self.inflight.pop(pid, None)
+            raise
+        finally:
+            self.window = window
+            self._raw = raw
+
+    # Called on a connection error in outbox mode: moves unacknowledged
+    # messages to the outbox and schedules the next reconnect attempt.
+    def _down(self, e):
+        self.log(False, e)
+        self._up = False
+        self.sock.close()
+        for pid in self.inflight:
+            topic, msg, retain, _ = self.inflight[pid]
+            self.outbox.put(topic, msg, retain, 1)
+        self.inflight.clear()
+        self._schedule()
+
+    def _schedule(self):
+        self._attempt += 1
+        self._retry_at = time.ticks_add(time.ticks_ms(), self.backoff(self._attempt))
+
+    # Attempts to reconnect if the backoff delay has passed.
+    def _try_reconnect(self):
+        if self._attempt and time.ticks_diff(self._retry_at, time.ticks_ms()) > 0:
+            return False
+        try:
+            self.connect(False, None, self._connect_props)
+        except OSError as e:
+            self.log(True, e)
+            if self.sock:
+                self.sock.close()
+            self._up = False
+            self._schedule()
+        return self._up
+
+    def publish(self, topic, msg, retain=False, qos=0, properties=None):
+        if self.outbox is not None:
+            if self._up or self._try_reconnect():
+                self._raw = True
+                try:
+                    return super().publish(topic, msg, retain, qos, properties)
+                except OSError as e:
+                    self._down(e)
+                finally:
+                    self._raw = False
+            self.outbox.put(topic, msg, retain, qos)
+            return
         while 1:
             try:
-                return super().publish(topic, msg, retain, qos)
+                return super().publish(topic, msg, retain, qos, properties)
             except OSError as e:
                 self.log(False, e)
             self.reconnect()
 
+    # In outbox mode, wait_msg() and check_msg() return None while the
+    # connection is down instead of reconnecting (wait_msg() only after waiting
+    # for the backoff delay, so that calling it in a loop doesn't spin), and
+    # errors while waiting for
+    # a PUBACK in publish() or when draining the outbox reach those, so that
+    # the messages go to the outbox.
     def wait_msg(self):
+        if self._raw:
+            return super().wait_msg()
+        if self.outbox is not None:
+            return self._wait_outbox(True)
         while 1:
             try:
                 return super().wait_msg()
@@ -43,6 +262,8 @@ class MQTTClient(simple.MQTTClient):
             self.reconnect()
 
     def check_msg(self, attempts=2):
+        if self.outbox is not None:
+            return self._wait_outbox(False)
         while attempts:
             self.sock.setblocking(False)
             try:
@@ -51,3 +272,15 @@ class MQTTClient(simple.MQTTClient):
                 self.log(False, e)
             self.reconnect()
             attempts -= 1
+
+    def _wait_outbox(self, blocking):
+        if not (self._up or self._try_reconnect()):
+            if blocking:
+                time.sleep_ms(max(0, time.ticks_diff(self._retry_at, time.ticks_ms())))
+            return None
+        self.sock.setblocking(blocking)
+        try:
+            return super().wait_msg()
+        except OSError as e:
+            self._down(e)
+            return None
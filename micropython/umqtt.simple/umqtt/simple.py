@@ -3,11 +3,116 @@ import struct
 from binascii import hexlify
 
 
+# MQTT 5 property types by identifier: B byte, H two byte integer, I four
+# byte integer, V variable byte integer, s string or binary data, p string pair.
+_PROPS = {
+    0x01: "B",  # Payload Format Indicator
+    0x02: "I",  # Message Expiry Interval
+    0x03: "s",  # Content Type
+    0x08: "s",  # Response Topic
+    0x09: "s",  # Correlation Data
+    0x0B: "V",  # Subscription Identifier
+    0x11: "I",  # Session Expiry Interval
+    0x12: "s",  # Assigned Client Identifier
+    0x13: "H",  # Server Keep Alive
+    0x15: "s",  # Authentication Method
+    0x16: "s",  # Authentication Data
+    0x17: "B",  # Request Problem Information
+    0x18: "I",  # Will Delay Interval
+    0x19: "B",  # Request Response Information
+    0x1A: "s",  # Response Information
+    0x1C: "s",  # Server Reference
+    0x1F: "s",  # Reason String
+    0x21: "H",  # Receive Maximum
+    0x22: "H",  # Topic Alias Maximum
+    0x23: "H",  # Topic Alias
+    0x24: "B",  # Maximum QoS
+    0x25: "B",  # Retain Available
+    0x26: "p",  # User Property
+    0x27: "I",  # Maximum Packet Size
+    0x28: "B",  # Wildcard Subscription Available
+    0x29: "B",  # Subscription Identifier Available
+    0x2A: "B",  # Shared Subscription Available
+}
+
+
+def _varint(n):
+    b = bytearray()
+    while n > 0x7F:
+        b.append((n & 0x7F) | 0x80)
+        n >>= 7
+    b.append(n)
+    return b
+
+
+# Encodes a dict of MQTT 5 properties, with a list of (name, value) pairs
+# for User Property, into their wire format without the length prefix.
+def encode_props(props):
+    b = bytearray()
+    for k in props:
+        t = _PROPS[k]
+        for v in props[k] if t == "p" else (props[k],):
+            b.append(k)
+            if t == "V":
+                b.extend(_varint(v))
+            elif t == "s":
+                b.extend(struct.pack("!H", len(v)))
+                b.extend(v)
+            elif t == "p":
+                for s in v:
+                    b.extend(struct.pack("!H", len(s)))
+                    b.extend(s)
+            else:
+                b.extend(struct.pack("!" + t, v))
+    return b
+
+
+# Decodes MQTT 5 properties from data, which doesn't include the length
+# prefix. Strings are returned as bytes.
+def decode_props(data):
+    props = {}
+    i = 0
+    while i < len(data):
+        k = data[i]
+        t = _PROPS[k]
+        i += 1
+        if t == "V":
+            v = 0
+            sh = 0
+            while True:
+                b = data[i]
+                i += 1
+                v |= (b & 0x7F) << sh
+                if not b & 0x80:
+                    break
+                sh += 7
+        elif t in "sp":
+            v = []
+            for _ in range(1 if t == "s" else 2):
+                n = data[i] << 8 | data[i + 1]
+                v.append(bytes(data[i + 2 : i + 2 + n]))
+                i += 2 + n
+            if t == "s":
+                v = v[0]
+            else:
+                props.setdefault(k, []).append(tuple(v))
+                continue
+        else:
+            v = struct.unpack_from("!" + t, data, i)[0]
+            i += struct.calcsize(t)
+        props[k] = v
+    return props
+
+
 class MQTTException(Exception):
     pass
 
 
 class MQTTClient:
+    # Size of the buffer packets are assembled in. Larger publish payloads
+    # are written separately after the rest of the packet.
+    BUF_SIZE = 256
+
     def __init__(
         self,
         client_id,
@@ -18,6 +123,8 @@ class MQTTClient:
         keepalive=0,
         ssl=None,
         ssl_params={},
+        window=0,
+        version=4,
     ):
         if port == 0:
             port = 8883 if ssl else 1883
@@ -36,10 +143,65 @@ class MQTTClient:
         self.lw_msg = None
         self.lw_qos = 0
         self.lw_retain = False
+        # Max number of unacknowledged QoS 1 publishes, 0 to wait for each.
+        self.window = window
+        self.inflight = {}  # pid -> (topic, msg, retain, props) awaiting PUBACK
+        self.buf = bytearray(self.BUF_SIZE)
+        # MQTT protocol version, 4 (3.1.1) or 5.
+        assert version in (4, 5)
+        self.version = version
+        # Limits sent by an MQTT 5 server in CONNACK, and the properties.
+        self.receive_max = 65535
+        self.alias_max = 0
+        self.connack_props = {}
+        self.aliases = {}  # topic -> topic alias in use on this connection
+
+    # Packets are assembled in a buffer with their body starting at offset 5,
+    # leaving room for the longest fixed header in front of it.
+    def _buf(self, sz):
+        return self.buf if sz <= len(self.buf) else bytearray(sz)
 
-    def _send_str(self, s):
-        self.sock.write(struct.pack("!H", len(s)))
-        self.sock.write(s)
+    def _put_varint(self, buf, i, n):
+        while n > 0x7F:
+            buf[i] = (n & 0x7F) | 0x80
+            n >>= 7
+            i += 1
+        buf[i] = n
+        return i + 1
+
+    def _put_str(self, buf, i, s):
+        n = len(s)
+        buf[i] = n >> 8
+        buf[i + 1] = n & 0xFF
+        buf[i + 2 : i + 2 + n] = s
+        return i + 2 + n
+
+    # Writes the fixed header for first byte op and a body of sz bytes in
+    # front of the body at buf[5:], and returns the offset it starts at.
+    def _put_header(self, buf, op, sz):
+        assert sz < 268435456
+        i = 4
+        n = sz
+        while n > 0x7F:
+            n >>= 7
+            i -= 1
+        start = i - 1
+        buf[start] = op
+        while sz > 0x7F:
+            buf[i] = (sz & 0x7F) | 0x80
+            sz >>= 7
+            i += 1
+        buf[i] = sz
+        return start
+
+    # Sends the packet with first byte op and body buf[5:end], followed by
+    # extra, with a single write when extra is empty.
+    def _send_packet(self, buf, op, end, extra=b""):
+        start = self._put_header(buf, op, end - 5 + len(extra))
+        # print(hex(end - start), hexlify(buf[start:end], ":"))
+        self.sock.write(buf, start, end - start)
+        if extra:
+            self.sock.write(extra)
 
     def _recv_len(self):
         n = 0
@@ -51,6 +213,14 @@ class MQTTClient:
                 return n
             sh += 7
 
+    def _next_pid(self):
+        pid = self.pid
+        while True:
+            pid = pid % 65535 + 1
+            if pid not in self.inflight:
+                self.pid = pid
+                return pid
+
     def set_callback(self, f):
         self.cb = f
 
@@ -62,7 +232,7 @@ class MQTTClient:
         self.lw_qos = qos
         self.lw_retain = retain
 
-    def connect(self, clean_session=True, timeout=None):
+    def connect(self, clean_session=True, timeout=None, properties=None):
         self.sock = socket.socket()
         self.sock.settimeout(timeout)
         addr = socket.getaddrinfo(self.server, self.port)[0][-1]
@@ -74,45 +244,73 @@ class MQTTClient:
             self.sock = ssl.wrap_socket(self.sock, **self.ssl_params)
         elif self.ssl:
             self.sock = self.ssl.wrap_socket(self.sock, server_hostname=self.server)
-        premsg = bytearray(b"\x10\0\0\0\0\0")
-        msg = bytearray(b"\x04MQTT\x04\x02\0\0")
+        self._send_connect(clean_session, properties)
+        op = self.sock.read(1)
+        assert op == b"\x20"
+        res = self._connack(self.sock.read(self._recv_len()))
+        # Retransmit QoS 1 messages still awaiting PUBACK as duplicates.
+        for pid in self.inflight:
+            topic, msg, retain, props = self.inflight[pid]
+            self._send_publish(topic, msg, retain, 1, pid, props, True)
+        return res
 
-        sz = 10 + 2 + len(self.client_id)
-        msg[6] = clean_session << 1
+    def _send_connect(self, clean_session, properties):
+        props = b""
+        if self.version == 5:
+            properties = properties.copy() if properties else {}
+            if not clean_session and 0x11 not in properties:
+                # Keep the session after disconnecting, as in MQTT 3.1.1.
+                properties[0x11] = 0xFFFFFFFF
+            props = encode_props(properties)
+        sz = 5 + 10 + 5 + len(props) + 2 + len(self.client_id) + 1
         if self.user:
             sz += 2 + len(self.user) + 2 + len(self.pswd)
-            msg[6] |= 0xC0
+        if self.lw_topic:
+            sz += 2 + len(self.lw_topic) + 2 + len(self.lw_msg)
+        buf = self._buf(sz)
+        buf[5:15] = b"\0\x04MQTT\x04\x02\0\0"
+        buf[11] = self.version
+        buf[12] = clean_session << 1
+        if self.user:
+            buf[12] |= 0xC0
         if self.keepalive:
             assert self.keepalive < 65536
-            msg[7] |= self.keepalive >> 8
-            msg[8] |= self.keepalive & 0x00FF
+            struct.pack_into("!H", buf, 13, self.keepalive)
         if self.lw_topic:
-            sz += 2 + len(self.lw_topic) + 2 + len(self.lw_msg)
-            msg[6] |= 0x4 | (self.lw_qos & 0x1) << 3 | (self.lw_qos & 0x2) << 3
-            msg[6] |= self.lw_retain << 5
-
-        i = 1
-        while sz > 0x7F:
-            premsg[i] = (sz & 0x7F) | 0x80
-            sz >>= 7
-            i += 1
-        premsg[i] = sz
+            buf[12] |= 0x4 | (self.lw_qos & 0x1) << 3 | (self.lw_qos & 0x2) << 3
+            buf[12] |= self.lw_retain << 5
 
-        self.sock.write(premsg, i + 2)
-        self.sock.write(msg)
-        # print(hex(len(msg)), hexlify(msg, ":"))
-        self._send_str(self.client_id)
+        i = 15
+        if self.version == 5:
+            i = self._put_varint(buf, i, len(props))
+            buf[i : i + len(props)] = props
+            i += len(props)
+        i = self._put_str(buf, i, self.client_id)
         if self.lw_topic:
-            self._send_str(self.lw_topic)
-            self._send_str(self.lw_msg)
+            if self.version == 5:
+                buf[i] = 0  # no will properties
+                i += 1
+            i = self._put_str(buf, i, self.lw_topic)
+            i = self._put_str(buf, i, self.lw_msg)
         if self.user:
-            self._send_str(self.user)
-            self._send_str(self.pswd)
-        resp = self.sock.read(4)
-        assert resp[0] == 0x20 and resp[1] == 0x02
-        if resp[3] != 0:
-            raise MQTTException(resp[3])
-        return resp[2] & 1
+            i = self._put_str(buf, i, self.user)
+            i = self._put_str(buf, i, self.pswd)
+        self._send_packet(buf, 0x10, i)
+
+    # Processes the body of a CONNACK, returning the session present flag.
+    def _connack(self, resp):
+        if resp[1] != 0:
+            raise MQTTException(resp[1])
+        self.aliases = {}
+        if self.version == 5:
+            # Skip the properties length, at most 4 bytes.
+            i = 2
+            while resp[i] & 0x80:
+                i += 1
+            self.connack_props = decode_props(memoryview(resp)[i + 1 :])
+            self.receive_max = self.connack_props.get(0x21, 65535)
+            self.alias_max = self.connack_props.get(0x22, 0)
+        return resp[0] & 1
 
     def disconnect(self):
         self.sock.write(b"\xe0\0")
@@ -121,60 +319,113 @@ class MQTTClient:
     def ping(self):
         self.sock.write(b"\xc0\0")
 
-    def publish(self, topic, msg, retain=False, qos=0):
-        pkt = bytearray(b"\x30\0\0\0")
-        pkt[0] |= qos << 1 | retain
-        sz = 2 + len(topic) + len(msg)
-        if qos > 0:
-            sz += 2
-        assert sz < 2097152
-        i = 1
-        while sz > 0x7F:
-            pkt[i] = (sz & 0x7F) | 0x80
-            sz >>= 7
-            i += 1
-        pkt[i] = sz
-        # print(hex(len(pkt)), hexlify(pkt, ":"))
-        self.sock.write(pkt, i + 1)
-        self._send_str(topic)
+    # Publishes msg to topic. With qos=1 and no window this waits for the
+    # PUBACK. With a window, up to that many messages are left in flight and
+    # their PUBACKs are processed by wait_msg()/check_msg()/flush().
+    # With MQTT 5, properties is a dict of property identifier -> value.
+    def publish(self, topic, msg, retain=False, qos=0, properties=None):
+        self._publish(topic, msg, retain, qos, encode_props(properties) if properties else b"")
+
+    # Publishes a payload that fill(buf) encodes straight into the packet
+    # buffer: fill writes to the memoryview buf and returns the payload size.
+    def publish_into(self, topic, fill, retain=False, qos=0, properties=None):
+        props = encode_props(properties) if properties else b""
+        buf, i, _ = self._publish_header(topic, qos, 0, props)
+        mv = memoryview(buf)
+        msg = mv[i : i + fill(mv[i:])]
+        if qos:
+            # Keep a copy for retransmission, the buffer is reused.
+            msg = bytes(msg)
+        self._publish(topic, msg, retain, qos, props)
+
+    def _publish(self, topic, msg, retain, qos, props=b""):
+        assert qos < 2
+        pid = 0
+        if qos:
+            while len(self.inflight) >= self.receive_max or (
+                self.window and len(self.inflight) >= self.window
+            ):
+                self.wait_msg()
+            pid = self._next_pid()
+            self.inflight[pid] = (topic, msg, retain, props)
+        try:
+            self._send_publish(topic, msg, retain, qos, pid, props)
+            while not self.window and pid in self.inflight:
+                self.wait_msg()
+        except OSError:
+            # The caller gets the error, so don't retransmit it.
+            self.inflight.pop(pid, None)
+            raise
+
+    # Waits until all windowed QoS 1 messages have been acknowledged.
+    def flush(self):
+        while self.inflight:
+            self.wait_msg()
+
+    # Writes the variable header of a PUBLISH packet to the buffer. Returns
+    # the buffer, the offset of the payload, and the MQTT 5 topic alias used.
+    # With MQTT 5 each topic is sent once with a new alias (while the server
+    # allows more) and then replaced by its alias and an empty topic.
+    def _publish_header(self, topic, qos, pid, props):
+        alias = 0
+        if self.version == 5:
+            alias = self.aliases.get(topic, 0)
+            if alias:
+                topic = b""
+            elif len(self.aliases) < self.alias_max:
+                alias = len(self.aliases) + 1
+        buf = self._buf(5 + 2 + len(topic) + 2 + 4 + 3 + len(props))
+        i = self._put_str(buf, 5, topic)
         if qos > 0:
-            self.pid += 1
-            pid = self.pid
-            struct.pack_into("!H", pkt, 0, pid)
-            self.sock.write(pkt, 2)
-        self.sock.write(msg)
-        if qos == 1:
-            while 1:
-                op = self.wait_msg()
-                if op == 0x40:
-                    sz = self.sock.read(1)
-                    assert sz == b"\x02"
-                    rcv_pid = self.sock.read(2)
-                    rcv_pid = rcv_pid[0] << 8 | rcv_pid[1]
-                    if pid == rcv_pid:
-                        return
-        elif qos == 2:
-            assert 0
+            struct.pack_into("!H", buf, i, pid)
+            i += 2
+        if self.version == 5:
+            i = self._put_varint(buf, i, len(props) + (3 if alias else 0))
+            if alias:
+                struct.pack_into("!BH", buf, i, 0x23, alias)
+                i += 3
+            buf[i : i + len(props)] = props
+            i += len(props)
+        return buf, i, alias
+
+    def _send_publish(self, topic, msg, retain, qos, pid, props=b"", dup=False):
+        buf, i, alias = self._publish_header(topic, qos, pid, props)
+        n = len(msg)
+        if i + n <= len(buf):
+            buf[i : i + n] = msg
+            i += n
+            msg = b""
+        self._send_packet(buf, 0x30 | dup << 3 | qos << 1 | retain, i, msg)
+        if alias:
+            self.aliases[topic] = alias
 
     def subscribe(self, topic, qos=0):
         assert self.cb is not None, "Subscribe callback is not set"
-        pkt = bytearray(b"\x82\0\0\0")
-        self.pid += 1
-        struct.pack_into("!BH", pkt, 1, 2 + 2 + len(topic) + 1, self.pid)
-        # print(hex(len(pkt)), hexlify(pkt, ":"))
-        self.sock.write(pkt)
-        self._send_str(topic)
-        self.sock.write(qos.to_bytes(1, "little"))
+        pid = self._next_pid()
+        self._send_subscribe(topic, qos, pid)
         while 1:
             op = self.wait_msg()
             if op == 0x90:
-                resp = self.sock.read(4)
+                resp = self.sock.read(self._recv_len())
                 # print(resp)
-                assert resp[1] == pkt[2] and resp[2] == pkt[3]
-                if resp[3] == 0x80:
-                    raise MQTTException(resp[3])
+                assert resp[0] << 8 | resp[1] == pid
+                # The reason code (or granted QoS) is last, after any
+                # MQTT 5 properties.
+                if resp[-1] >= 0x80:
+                    raise MQTTException(resp[-1])
                 return
 
+    def _send_subscribe(self, topic, qos, pid):
+        buf = self._buf(5 + 2 + 1 + 2 + len(topic) + 1)
+        struct.pack_into("!H", buf, 5, pid)
+        i = 7
+        if self.version == 5:
+            buf[i] = 0  # no properties
+            i += 1
+        i = self._put_str(buf, i, topic)
+        buf[i] = qos
+        self._send_packet(buf, 0x82, i + 1)
+
     # Wait for a single incoming MQTT message and process it.
     # Subscribed messages are delivered to a callback previously
     # set by .set_callback() method. Other (internal) MQTT
@@ -191,6 +442,13 @@ class MQTTClient:
             assert sz == 0
             return None
         op = res[0]
+        if op == 0x40:  # PUBACK
+            resp = self.sock.read(self._recv_len())
+            self.inflight.pop(resp[0] << 8 | resp[1], None)
+            # MQTT 5 adds a reason code, and properties, unless it's 0.
+            if len(resp) > 2 and resp[2] >= 0x80:
+                raise MQTTException(resp[2])
+            return op
         if op & 0xF0 != 0x30:
             return op
         sz = self._recv_len()
@@ -202,6 +460,12 @@ class MQTTClient:
             pid = self.sock.read(2)
             pid = pid[0] << 8 | pid[1]
             sz -= 2
+        if self.version == 5:
+            # Skip the properties.
+            n = self._recv_len()
+            sz -= 1 + (n > 0x7F) + (n > 0x3FFF) + (n > 0x1FFFFF) + n
+            if n:
+                self.sock.read(n)
         msg = self.sock.read(sz)
         self.cb(topic, msg)
         if op & 6 == 2:
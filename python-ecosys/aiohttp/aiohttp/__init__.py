@@ -2,7 +2,9 @@
 # MIT license; Copyright (c) 2023 Carlos Gil
 
 import asyncio
+import io
 import json as _json
+import time
 from .aiohttp_ws import (
     _WSRequestContextManager,
     ClientWebSocketResponse,
@@ -13,44 +15,262 @@ from .aiohttp_ws import (
 HttpVersion10 = "HTTP/1.0"
 HttpVersion11 = "HTTP/1.1"
 
+_CHUNK_SIZE = 1024
+# Compressed input kept buffered ahead of the decompressor, enough for a block header.
+_INFLATE_MARGIN = 1024
+
+
+class CIMultiDict:
+    # Case-insensitive multi-valued mapping for response headers. Each header is
+    # stored once as (key, lowercase key, value) in received order, and the
+    # first value of each key is indexed by its lowercase name.
+    def __init__(self):
+        self._items = []
+        self._index = {}
+
+    def add(self, key, value):
+        lkey = key.lower()
+        self._items.append((key, lkey, value))
+        if lkey not in self._index:
+            self._index[lkey] = value
+
+    def __getitem__(self, key):
+        return self._index[key.lower()]
+
+    def get(self, key, default=None):
+        return self._index.get(key.lower(), default)
+
+    def getall(self, key, default=None):
+        lkey = key.lower()
+        values = [v for _, k, v in self._items if k == lkey]
+        if values:
+            return values
+        if default is None:
+            raise KeyError(key)
+        return default
+
+    def __contains__(self, key):
+        return key.lower() in self._index
+
+    def __iter__(self):
+        return (k for k, _, _ in self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def keys(self):
+        return [k for k, _, _ in self._items]
+
+    def values(self):
+        return [v for _, _, v in self._items]
+
+    def items(self):
+        return [(k, v) for k, _, v in self._items]
+
+    def __repr__(self):
+        return "<CIMultiDict(%s)>" % ", ".join("'%s': '%s'" % (k, v) for k, _, v in self._items)
+
+
+class ClientTimeout:
+    def __init__(self, total=None, connect=None, sock_read=None):
+        # All values in seconds, None means no limit.
+        self.total = total
+        self.connect = connect
+        self.sock_read = sock_read
+
+
+async def _wait(aw, timeout, deadline):
+    # Await aw bounded by its own timeout and by the request's total deadline.
+    if deadline is not None:
+        left = max(0, time.ticks_diff(deadline, time.ticks_ms())) / 1000
+        if timeout is None or left < timeout:
+            timeout = left
+    if timeout is None:
+        return await aw
+    return await asyncio.wait_for(aw, timeout)
+
+
+class _Inflater(io.IOBase):
+    # Streaming decompressor in front of a response body.  DeflateIO pulls its
+    # input synchronously through readinto(), so enough compressed data is kept
+    # buffered that it never runs dry before the end of the body.
+    def __init__(self, resp, encoding):
+        import deflate
+
+        self._resp = resp
+        self._buf = b""
+        self._pos = 0
+        self._eof = False
+        if encoding == "deflate":
+            self._d = deflate.DeflateIO(self, deflate.ZLIB)
+        else:
+            self._d = deflate.DeflateIO(self, deflate.GZIP, 15)
+
+    def readinto(self, buf):
+        n = min(len(buf), len(self._buf) - self._pos)
+        buf[:n] = self._buf[self._pos : self._pos + n]
+        self._pos += n
+        return n
+
+    async def read(self, sz=-1):
+        if sz == -1:
+            out = []
+            while True:
+                data = await self.read(_CHUNK_SIZE)
+                if not data:
+                    return b"".join(out)
+                out.append(data)
+        while True:
+            if self._eof:
+                return self._d.read(sz)
+            # Deflate needs at most ~2 input bytes per output byte, plus block headers.
+            n = (len(self._buf) - self._pos - _INFLATE_MARGIN) // 2
+            if n > 0:
+                data = self._d.read(min(sz, n))
+                if not data:
+                    # End of the compressed stream, drain the rest of the body.
+                    while await self._resp._read_raw(_CHUNK_SIZE):
+                        pass
+                return data
+            data = await self._resp._read_raw(_CHUNK_SIZE)
+            if data:
+                self._buf = self._buf[self._pos :] + data
+                self._pos = 0
+            else:
+                self._eof = True
+
+
+async def _write_chunk(writer, chunk, chunked):
+    if isinstance(chunk, str):
+        chunk = chunk.encode()
+    if chunked:
+        await writer.awrite(b"%x\r\n" % len(chunk))
+        await writer.awrite(chunk)
+        await writer.awrite(b"\r\n")
+    else:
+        await writer.awrite(chunk)
+
+
+async def _write_body(writer, data, chunked):
+    # Stream the request body without joining it to the headers or copying it.
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        await writer.awrite(data)
+        return
+    if hasattr(data, "readinto"):
+        # File-like object, read through a single reusable buffer.
+        buf = bytearray(_CHUNK_SIZE)
+        mv = memoryview(buf)
+        while True:
+            n = data.readinto(buf)
+            if not n:
+                break
+            await _write_chunk(writer, mv[:n], chunked)
+    elif hasattr(data, "__aiter__"):
+        async for chunk in data:
+            if chunk:
+                await _write_chunk(writer, chunk, chunked)
+    else:
+        for chunk in data:
+            if chunk:
+                await _write_chunk(writer, chunk, chunked)
+    if chunked:
+        await writer.awrite(b"0\r\n\r\n")
+
+
+class _ChunkIterator:
+    def __init__(self, resp, n):
+        self.resp = resp
+        self.n = n
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        data = await self.resp.read(self.n)
+        if not data:
+            raise StopAsyncIteration
+        return data
+
 
 class ClientResponse:
     def __init__(self, reader):
         self.content = reader
+        # Remaining body length, None if the body is delimited by connection close.
+        self._length = None
+        self._connector = None
+        self._keepalive = False
+        self._inflater = None
+        self._timeout = None
+        self._deadline = None
+        # Body already read by gather_requests().
+        self._body = None
 
     def _get_header(self, keyname, default):
-        for k in self.headers:
-            if k.lower() == keyname:
-                return self.headers[k]
-        return default
-
-    def _decode(self, data):
-        c_encoding = self._get_header("content-encoding", None)
-        if c_encoding in ("gzip", "deflate", "gzip,deflate"):
-            try:
-                import deflate
-                import io
-
-                if c_encoding == "deflate":
-                    with deflate.DeflateIO(io.BytesIO(data), deflate.ZLIB) as d:
-                        return d.read()
-                elif c_encoding == "gzip":
-                    with deflate.DeflateIO(io.BytesIO(data), deflate.GZIP, 15) as d:
-                        return d.read()
-            except ImportError:
-                print("WARNING: deflate module required")
-        return data
+        return self.headers.get(keyname, default)
+
+    def _decoder(self):
+        # Set up a streaming decompressor on first use if the body is compressed.
+        if self._inflater is None:
+            self._inflater = False
+            c_encoding = self._get_header("content-encoding", None)
+            if c_encoding in ("gzip", "deflate"):
+                try:
+                    self._inflater = _Inflater(self, c_encoding)
+                except ImportError:
+                    print("WARNING: deflate module required")
+        return self._inflater
+
+    async def _recv(self, aw):
+        if self._timeout is None:
+            return await aw
+        try:
+            return await _wait(aw, self._timeout.sock_read, self._deadline)
+        except BaseException:
+            # The connection is in an unknown state, don't return it to the pool.
+            self._keepalive = False
+            raise
+
+    async def _read_raw(self, sz=-1):
+        if self._length is None:
+            # Body is delimited by connection close.
+            return await self._recv(self.content.read(sz))
+        # Never read past the end of the body, the connection may be reused.
+        if sz == -1 or sz > self._length:
+            sz = self._length
+        self._length -= sz
+        return await self._recv(self.content.readexactly(sz))
 
     async def read(self, sz=-1):
-        return self._decode(
-            await (self.content.read(sz) if sz == -1 else self.content.readexactly(sz))
-        )
+        if self._body is not None:
+            if sz == -1 or sz >= len(self._body):
+                data, self._body = self._body, b""
+            else:
+                data, self._body = self._body[:sz], self._body[sz:]
+            return data
+        inflater = self._decoder()
+        if inflater:
+            return await inflater.read(sz)
+        return await self._read_raw(sz)
+
+    def iter_chunked(self, n):
+        return _ChunkIterator(self, n)
 
     async def text(self, encoding="utf-8"):
-        return (await self.read(int(self._get_header("content-length", -1)))).decode(encoding)
+        return (await self.read(-1)).decode(encoding)
 
     async def json(self):
-        return _json.loads(await self.read(int(self._get_header("content-length", -1))))
+        return _json.loads(await self.read(-1))
+
+    async def release(self):
+        # Return the connection to the pool if the body was fully read, otherwise close it.
+        reader = self.content
+        if reader is None:
+            return
+        self.content = None
+        if self._connector:
+            await self._connector.release(reader, self._keepalive and self._length == 0)
+        else:
+            await reader.aclose()
 
     def __repr__(self):
         return "<ClientResponse %d %s>" % (self.status, self.headers)
@@ -58,25 +278,38 @@ class ClientResponse:
 
 class ChunkedClientResponse(ClientResponse):
     def __init__(self, reader):
-        self.content = reader
+        super().__init__(reader)
         self.chunk_size = 0
 
-    async def read(self, sz=4 * 1024 * 1024):
+    async def _read_raw(self, sz=4 * 1024 * 1024):
+        if sz == -1:
+            out = []
+            while True:
+                data = await self._read_raw()
+                if not data:
+                    return b"".join(out)
+                out.append(data)
+        if self._length == 0:
+            return b""
         if self.chunk_size == 0:
-            l = await self.content.readline()
+            l = await self._recv(self.content.readline())
             l = l.split(b";", 1)[0]
             self.chunk_size = int(l, 16)
             if self.chunk_size == 0:
                 # End of message
-                sep = await self.content.readexactly(2)
+                sep = await self._recv(self.content.readexactly(2))
                 assert sep == b"\r\n"
+                self._length = 0
                 return b""
-        data = await self.content.readexactly(min(sz, self.chunk_size))
+        data = await self._recv(self.content.readexactly(min(sz, self.chunk_size)))
         self.chunk_size -= len(data)
         if self.chunk_size == 0:
-            sep = await self.content.readexactly(2)
+            sep = await self._recv(self.content.readexactly(2))
             assert sep == b"\r\n"
-        return self._decode(data)
+        return data
+
+    async def read(self, sz=4 * 1024 * 1024):
+        return await super().read(sz)
 
     def __repr__(self):
         return "<ChunkedClientResponse %d %s>" % (self.status, self.headers)
@@ -86,57 +319,278 @@ class _RequestContextManager:
     def __init__(self, client, request_co):
         self.reqco = request_co
         self.client = client
+        self.resp = None
 
     async def __aenter__(self):
-        return await self.reqco
+        self.resp = await self.reqco
+        return self.resp
 
     async def __aexit__(self, *args):
-        await self.client._reader.aclose()
+        if self.resp:
+            await self.resp.release()
         return await asyncio.sleep(0)
 
 
+class _GatherIterator:
+    # Runs a list of requests concurrently over a bounded number of tasks and
+    # yields the responses, with their bodies already read, as they complete.
+    def __init__(self, session, requests, limit, limit_per_host, return_exceptions):
+        self._session = session
+        self._queue = []
+        for req in requests:
+            if isinstance(req, str):
+                req = ("GET", req, {})
+            elif len(req) == 2:
+                req = (req[0], req[1], {})
+            host = (session._base_url + req[1]).split("/", 3)[2]
+            self._queue.append((req, host))
+        self._remaining = len(self._queue)
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._return_exceptions = return_exceptions
+        self._hosts = {}
+        self._results = []
+        self._tasks = None
+        self._slot = asyncio.Event()
+        self._ready = asyncio.Event()
+
+    def __aiter__(self):
+        return self
+
+    def _next_request(self):
+        # First queued request whose host is below its concurrency cap.
+        for i, (req, host) in enumerate(self._queue):
+            if not self._limit_per_host or self._hosts.get(host, 0) < self._limit_per_host:
+                return self._queue.pop(i)
+        return None
+
+    async def _worker(self):
+        while self._queue:
+            item = self._next_request()
+            if item is None:
+                self._slot.clear()
+                await self._slot.wait()
+                continue
+            (method, url, kwargs), host = item
+            self._hosts[host] = self._hosts.get(host, 0) + 1
+            try:
+                async with self._session.request(method, url, **kwargs) as resp:
+                    # Read the body now so the connection is released straight away.
+                    body = await resp.read(-1)
+                resp._body = body
+                result = resp
+            except Exception as e:
+                result = e
+            self._hosts[host] -= 1
+            self._slot.set()
+            self._results.append(result)
+            self._ready.set()
+
+    def _cancel(self):
+        for t in self._tasks:
+            t.cancel()
+
+    async def __anext__(self):
+        if self._tasks is None:
+            n = self._limit or self._remaining
+            self._tasks = [
+                asyncio.create_task(self._worker()) for _ in range(min(n, self._remaining))
+            ]
+        while not self._results:
+            if not self._remaining:
+                raise StopAsyncIteration
+            self._ready.clear()
+            await self._ready.wait()
+        self._remaining -= 1
+        result = self._results.pop(0)
+        if isinstance(result, Exception) and not self._return_exceptions:
+            self._cancel()
+            self._remaining = 0
+            raise result
+        return result
+
+
+class TCPConnector:
+    def __init__(self, limit=100, limit_per_host=0, keepalive_timeout=15):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        # Idle connections as (key, reader, writer, ticks_ms), least recently used first.
+        self._idle = []
+        # Number of connections in use (or being opened) per (host, port, ssl) key.
+        self._active = {}
+        # reader -> (key, writer, reused) for connections in use.
+        self._conns = {}
+        self._released = asyncio.Event()
+
+    async def _close(self, reader):
+        try:
+            await reader.aclose()
+        except OSError:
+            pass
+
+    async def _expire(self):
+        now = time.ticks_ms()
+        timeout = self.keepalive_timeout * 1000
+        i = 0
+        while i < len(self._idle):
+            if time.ticks_diff(now, self._idle[i][3]) >= timeout:
+                await self._close(self._idle.pop(i)[1])
+            else:
+                i += 1
+
+    def _host_full(self, key):
+        return self.limit_per_host and self._active.get(key, 0) >= self.limit_per_host
+
+    async def connect(self, host, port, ssl):
+        key = (host, port, ssl)
+        while True:
+            await self._expire()
+            # Prefer the most recently used idle connection to this host.
+            for i in range(len(self._idle) - 1, -1, -1):
+                if self._idle[i][0] == key:
+                    _, reader, writer, _ = self._idle.pop(i)
+                    self._active[key] = self._active.get(key, 0) + 1
+                    self._conns[reader] = (key, writer, True)
+                    return reader, writer
+            if not self._host_full(key):
+                if not self.limit or sum(self._active.values()) + len(self._idle) < self.limit:
+                    break
+                if self._idle:
+                    # Total limit reached, make room by dropping the oldest idle connection.
+                    await self._close(self._idle.pop(0)[1])
+                    break
+            self._released.clear()
+            await self._released.wait()
+        # Reserve the slot before yielding so concurrent connects see it.
+        self._active[key] = self._active.get(key, 0) + 1
+        try:
+            reader, writer = await asyncio.open_connection(host, port, ssl=ssl)
+        except BaseException:
+            self._active[key] -= 1
+            self._released.set()
+            raise
+        self._conns[reader] = (key, writer, False)
+        return reader, writer
+
+    def reused(self, reader):
+        # Whether a connection in use was taken from the idle pool.
+        conn = self._conns.get(reader)
+        return conn is not None and conn[2]
+
+    async def release(self, reader, reuse=True):
+        conn = self._conns.pop(reader, None)
+        if conn is None:
+            return
+        key, writer, _ = conn
+        self._active[key] -= 1
+        if reuse and self.keepalive_timeout:
+            self._idle.append((key, reader, writer, time.ticks_ms()))
+        else:
+            await self._close(reader)
+        self._released.set()
+
+    async def close(self):
+        while self._idle:
+            await self._close(self._idle.pop()[1])
+
+
 class ClientSession:
-    def __init__(self, base_url="", headers={}, version=HttpVersion10):
+    def __init__(self, base_url="", headers={}, version=None, connector=None, timeout=None):
         self._reader = None
         self._base_url = base_url
-        self._base_headers = {"Connection": "close", "User-Agent": "compat"}
+        self._connector = connector
+        self._timeout = timeout or ClientTimeout()
+        if connector:
+            # Keep-alive mode, connections are reused through the connector's pool.
+            self._base_headers = {"Connection": "keep-alive", "User-Agent": "compat"}
+        else:
+            # Explicitly set Connection: close, even though this should be default for 1.0,
+            # because some servers misbehave w/o it.
+            self._base_headers = {"Connection": "close", "User-Agent": "compat"}
         self._base_headers.update(**headers)
+        if version is None:
+            # Without a connector use protocol 1.0, because 1.1 always allows to use chunked
+            # transfer-encoding.
+            version = HttpVersion11 if connector else HttpVersion10
         self._http_version = version
 
     async def __aenter__(self):
         return self
 
     async def __aexit__(self, *args):
+        await self.close()
         return await asyncio.sleep(0)
 
-    # TODO: Implement timeouts
+    async def close(self):
+        if self._connector:
+            await self._connector.close()
+
+    async def _release(self, reader):
+        if self._connector:
+            await self._connector.release(reader, False)
+        else:
+            await reader.aclose()
 
-    async def _request(self, method, url, data=None, json=None, ssl=None, params=None, headers={}):
+    async def _request(
+        self,
+        method,
+        url,
+        data=None,
+        json=None,
+        ssl=None,
+        params=None,
+        headers={},
+        timeout=None,
+    ):
+        if timeout is None:
+            timeout = self._timeout
+        elif not isinstance(timeout, ClientTimeout):
+            timeout = ClientTimeout(total=timeout)
+        deadline = None
+        if timeout.total is not None:
+            deadline = time.ticks_add(time.ticks_ms(), int(timeout.total * 1000))
+        # A file or iterator body is consumed by sending it, so it can't be sent again.
+        replayable = data is None or isinstance(data, (str, bytes, bytearray, memoryview))
         redir_cnt = 0
         while redir_cnt < 2:
-            reader = await self.request_raw(method, url, data, json, ssl, params, headers)
-            _headers = []
-            sline = await reader.readline()
-            sline = sline.split(None, 2)
-            status = int(sline[1])
-            chunked = False
-            while True:
-                line = await reader.readline()
-                if not line or line == b"\r\n":
-                    break
-                _headers.append(line)
-                if line.startswith(b"Transfer-Encoding:"):
-                    if b"chunked" in line:
-                        chunked = True
-                elif line.startswith(b"Location:"):
-                    url = line.rstrip().split(None, 1)[1].decode()
+            reader = await self.request_raw(
+                method, url, data, json, ssl, params, headers, timeout=timeout, deadline=deadline
+            )
+            try:
+                sline = await _wait(reader.readline(), timeout.sock_read, deadline)
+                if not sline and self._connector and self._connector.reused(reader):
+                    # An idle pooled connection was closed by the server, retry on another one.
+                    if not replayable:
+                        raise OSError("connection closed, can't resend streamed body")
+                    await self._release(reader)
+                    continue
+                _headers = CIMultiDict()
+                sline = sline.split(None, 2)
+                status = int(sline[1])
+                while True:
+                    line = await _wait(reader.readline(), timeout.sock_read, deadline)
+                    if not line or line == b"\r\n":
+                        break
+                    # Split each line once, skipping malformed ones.
+                    kv = line.decode().split(":", 1)
+                    if len(kv) == 2:
+                        _headers.add(kv[0], kv[1].strip())
+            except BaseException:
+                # Timed out or cancelled, the connection can't be reused.
+                await self._release(reader)
+                raise
 
             if 301 <= status <= 303:
                 redir_cnt += 1
-                await reader.aclose()
+                url = _headers.get("location", url)
+                await self._release(reader)
+                if not replayable:
+                    raise ValueError("can't resend streamed body to follow redirect")
                 continue
             break
 
+        chunked = "chunked" in _headers.get("transfer-encoding", "")
         if chunked:
             resp = ChunkedClientResponse(reader)
         else:
@@ -144,16 +598,24 @@ class ClientSession:
         resp.status = status
         resp.headers = _headers
         resp.url = url
+        resp._timeout = timeout
+        resp._deadline = deadline
         if params:
             resp.url += "?" + "&".join(f"{k}={params[k]}" for k in sorted(params))
-        try:
-            resp.headers = {
-                val.split(":", 1)[0]: val.split(":", 1)[-1].strip()
-                for val in [hed.decode().strip() for hed in _headers]
-            }
-        except Exception:
-            pass
-        self._reader = reader
+        if not chunked:
+            if method == "HEAD" or status in (204, 304):
+                resp._length = 0
+            else:
+                length = resp._get_header("content-length", None)
+                if length is not None:
+                    resp._length = int(length)
+        if self._connector:
+            resp._connector = self._connector
+            conn = resp._get_header("connection", "").lower()
+            if sline[0] == b"HTTP/1.1":
+                resp._keepalive = conn != "close"
+            else:
+                resp._keepalive = conn == "keep-alive"
         return resp
 
     async def request_raw(
@@ -167,6 +629,8 @@ class ClientSession:
         headers={},
         is_handshake=False,
         version=None,
+        timeout=None,
+        deadline=None,
     ):
         if json and isinstance(json, dict):
             data = _json.dumps(json)
@@ -193,46 +657,82 @@ class ClientSession:
             host, port = host.split(":", 1)
             port = int(port)
 
-        reader, writer = await asyncio.open_connection(host, port, ssl=ssl)
-
-        # Use protocol 1.0, because 1.1 always allows to use chunked transfer-encoding
-        # But explicitly set Connection: close, even though this should be default for 1.0,
-        # because some servers misbehave w/o it.
         if version is None:
             version = self._http_version
         if "Host" not in headers:
             headers.update(Host=host)
-        if not data:
-            query = b"%s /%s %s\r\n%s\r\n" % (
-                method,
-                path,
-                version,
-                "\r\n".join(f"{k}: {v}" for k, v in headers.items()) + "\r\n" if headers else "",
-            )
-        else:
+        chunked = False
+        if data:
             if json:
                 headers.update(**{"Content-Type": "application/json"})
-            if isinstance(data, bytes):
-                headers.update(**{"Content-Type": "application/octet-stream"})
-            else:
+            if isinstance(data, str):
                 data = data.encode()
-
-            headers.update(**{"Content-Length": len(data)})
-            query = b"""%s /%s %s\r\n%s\r\n%s""" % (
-                method,
-                path,
-                version,
-                "\r\n".join(f"{k}: {v}" for k, v in headers.items()) + "\r\n",
-                data,
+            elif isinstance(data, (bytes, bytearray, memoryview)):
+                if "Content-Type" not in headers:
+                    headers.update(**{"Content-Type": "application/octet-stream"})
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                headers.update(**{"Content-Length": len(data)})
+            elif "Content-Length" not in headers:
+                # File object or (async) iterator of unknown length.
+                headers.update(**{"Transfer-Encoding": "chunked"})
+                version = HttpVersion11
+                chunked = True
+        else:
+            data = None
+
+        # Request line and headers are encoded once, the body is written separately.
+        query = (
+            f"{method} /{path} {version}\r\n"
+            + "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+            + "\r\n"
+        ).encode()
+
+        connect_timeout = timeout.connect if timeout else None
+        if is_handshake or not self._connector:
+            reader, writer = await _wait(
+                asyncio.open_connection(host, port, ssl=ssl), connect_timeout, deadline
             )
-        if not is_handshake:
-            await writer.awrite(query)
-            return reader
+            try:
+                await writer.awrite(query)
+            except BaseException:
+                await reader.aclose()
+                raise
         else:
-            await writer.awrite(query)
+            while True:
+                reader, writer = await _wait(
+                    self._connector.connect(host, port, ssl), connect_timeout, deadline
+                )
+                try:
+                    await writer.awrite(query)
+                    break
+                except OSError:
+                    reused = self._connector.reused(reader)
+                    await self._connector.release(reader, False)
+                    # Only retry if a stale pooled connection failed, not a fresh one.
+                    if not reused:
+                        raise
+
+        if data is not None:
+            try:
+                await _wait(_write_body(writer, data, chunked), None, deadline)
+            except BaseException:
+                await self._release(reader)
+                raise
+        if is_handshake:
             return reader, writer
+        return reader
 
-    def request(self, method, url, data=None, json=None, ssl=None, params=None, headers={}):
+    def request(
+        self,
+        method,
+        url,
+        data=None,
+        json=None,
+        ssl=None,
+        params=None,
+        headers={},
+        timeout=None,
+    ):
         return _RequestContextManager(
             self,
             self._request(
@@ -243,9 +743,14 @@ class ClientSession:
                 ssl=ssl,
                 params=params,
                 headers=dict(**self._base_headers, **headers),
+                timeout=timeout,
             ),
         )
 
+    def gather_requests(self, requests, limit=8, limit_per_host=0, return_exceptions=False):
+        # requests is a list of URLs to GET, (method, url) or (method, url, kwargs) tuples.
+        return _GatherIterator(self, requests, limit, limit_per_host, return_exceptions)
+
     def get(self, url, **kwargs):
         return self.request("GET", url, **kwargs)
 
@@ -267,11 +772,11 @@ class ClientSession:
     def options(self, url, **kwargs):
         return self.request("OPTIONS", url, **kwargs)
 
-    def ws_connect(self, url, ssl=None):
-        return _WSRequestContextManager(self, self._ws_connect(url, ssl=ssl))
+    def ws_connect(self, url, ssl=None, compress=0):
+        return _WSRequestContextManager(self, self._ws_connect(url, ssl=ssl, compress=compress))
 
-    async def _ws_connect(self, url, ssl=None):
-        ws_client = WebSocketClient(self._base_headers.copy())
+    async def _ws_connect(self, url, ssl=None, compress=0):
+        ws_client = WebSocketClient(self._base_headers.copy(), compress)
         await ws_client.connect(url, ssl=ssl, handshake_request=self.request_raw)
         self._reader = ws_client.reader
         return ClientWebSocketResponse(ws_client)
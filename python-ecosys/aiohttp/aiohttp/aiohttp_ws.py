@@ -4,6 +4,7 @@
 # and https://github.com/miguelgrinberg/microdot/blob/main/src/microdot_asyncio_websocket.py
 
 import asyncio
+import io
 import random
 import json as _json
 import binascii
@@ -11,6 +12,11 @@ import re
 import struct
 from collections import namedtuple
 
+try:
+    import uctypes
+except ImportError:
+    uctypes = None
+
 URL_RE = re.compile(r"(wss|ws)://([A-Za-z0-9-\.]+)(?:\:([0-9]+))?(/.+)?")
 URI = namedtuple("URI", ("protocol", "hostname", "port", "path"))  # noqa: PYI024
 
@@ -36,6 +42,35 @@ def urlparse(uri):
         return URI(protocol, host, int(port), path)
 
 
+# Size of the reusable buffer outgoing payloads are masked in.
+_TX_BUF_SIZE = 1024
+# Messages shorter than this are not worth compressing.
+_COMPRESS_MIN = 64
+
+
+def _mask(buf, n, mask, off):
+    # XOR the first n bytes of buf in place with the 4-byte mask at mask[off].
+    i = 0
+    if uctypes and n >= 16 and not uctypes.addressof(buf) & 1:
+        # Two bytes at a time through a uctypes view, so values stay small ints.
+        h = n >> 1
+        w = uctypes.struct(
+            uctypes.addressof(buf),
+            {"h": (uctypes.ARRAY | 0, uctypes.UINT16 | h)},
+            uctypes.NATIVE,
+        ).h
+        m0, m1 = struct.unpack_from("@HH", mask, off)
+        for j in range(0, h - 1, 2):
+            w[j] ^= m0
+            w[j + 1] ^= m1
+        if h & 1:
+            w[h - 1] ^= m0
+        i = h << 1
+    while i < n:
+        buf[i] ^= mask[off + (i & 3)]
+        i += 1
+
+
 class WebSocketMessage:
     def __init__(self, opcode, data):
         self.type = opcode
@@ -56,11 +91,27 @@ class WebSocketClient:
     PING = 9
     PONG = 10
 
-    def __init__(self, params):
+    def __init__(self, params, compress=0):
         self.params = params
+        # permessage-deflate window bits to offer, 0 to disable.
+        if compress:
+            try:
+                import deflate
+            except ImportError:
+                compress = 0
+        self.compress = compress
+        self._rx_deflate = False
+        self._tx_deflate = False
+        self._rx_wbits = self._tx_wbits = compress
+        self._rx_takeover = True
+        self._rx_hist = b""
         self.closed = False
         self.reader = None
         self.writer = None
+        # Reusable frame header buffers: 2 bytes, up to 8 bytes length, 4 bytes mask.
+        self._tx_hdr = bytearray(14)
+        self._rx_hdr = bytearray(14)
+        self._tx_buf = None
 
     async def connect(self, uri, ssl=None, handshake_request=None):
         uri = urlparse(uri)
@@ -70,20 +121,6 @@ class WebSocketClient:
                 ssl = True
         await self.handshake(uri, ssl, handshake_request)
 
-    @classmethod
-    def _parse_frame_header(cls, header):
-        byte1, byte2 = struct.unpack("!BB", header)
-
-        # Byte 1: FIN(1) _(1) _(1) _(1) OPCODE(4)
-        fin = bool(byte1 & 0x80)
-        opcode = byte1 & 0x0F
-
-        # Byte 2: MASK(1) LENGTH(7)
-        mask = bool(byte2 & (1 << 7))
-        length = byte2 & 0x7F
-
-        return fin, opcode, mask, length
-
     def _process_websocket_frame(self, opcode, payload):
         if opcode == self.TEXT:
             payload = str(payload, "utf-8")
@@ -98,42 +135,90 @@ class WebSocketClient:
             return None, None
         return None, payload
 
-    @classmethod
-    def _encode_websocket_frame(cls, opcode, payload):
-        if opcode == cls.TEXT:
-            payload = payload.encode()
-
-        length = len(payload)
-        fin = mask = True
-
-        # Frame header
-        # Byte 1: FIN(1) _(1) _(1) _(1) OPCODE(4)
-        byte1 = 0x80 if fin else 0
-        byte1 |= opcode
-
+    def _negotiate(self, value):
+        # Apply the server's Sec-WebSocket-Extensions response.
+        params = [p.strip() for p in value.split(";")]
+        if params[0] != "permessage-deflate":
+            return
+        import deflate
+
+        self._rx_deflate = True
+        # Outgoing messages can only be compressed if the deflate module supports it.
+        self._tx_deflate = hasattr(deflate.DeflateIO, "write")
+        for p in params[1:]:
+            k, v = (p + "=").split("=", 1)
+            v = v.strip('"=')
+            if k == "server_no_context_takeover":
+                self._rx_takeover = False
+            elif k == "server_max_window_bits":
+                self._rx_wbits = int(v)
+            elif k == "client_max_window_bits" and v:
+                self._tx_wbits = min(self._tx_wbits, int(v))
+
+    def _deflate(self, payload):
+        # DeflateIO can't do a sync flush, so each message is a complete stream
+        # (hence client_no_context_takeover). Per RFC 7692 an empty stored block
+        # is appended and its 4 length bytes removed, leaving a single 0 byte.
+        import deflate
+
+        buf = io.BytesIO()
+        with deflate.DeflateIO(buf, deflate.RAW, self._tx_wbits) as d:
+            d.write(payload)
+        return buf.getvalue() + b"\x00"
+
+    def _inflate(self, payload):
+        # DeflateIO can't resume once it runs out of input, so each message is
+        # inflated as its own stream: the window is primed with the previous
+        # output as a stored block (context takeover), and the message is
+        # terminated by the sync flush trailer and a final empty stored block.
+        import deflate
+
+        hist = self._rx_hist
+        n = len(hist)
+        prime = b"\x00" + struct.pack("<HH", n, n ^ 0xFFFF) + hist if n else b""
+        src = io.BytesIO(prime + payload + b"\x00\x00\xff\xff\x01\x00\x00\xff\xff")
+        with deflate.DeflateIO(src, deflate.RAW, self._rx_wbits) as d:
+            if n:
+                d.read(n)
+            data = d.read()
+        if self._rx_takeover:
+            self._rx_hist = (hist + data)[-(1 << self._rx_wbits) :]
+        return data
+
+    def _write_frame(self, opcode, payload, fin=True, rsv1=False):
+        # Write one masked frame, reusing the header and payload buffers.
+        n = len(payload)
+        hdr = self._tx_hdr
+        # Byte 1: FIN(1) RSV1(1) _(1) _(1) OPCODE(4)
+        hdr[0] = (0x80 if fin else 0) | (0x40 if rsv1 else 0) | opcode
         # Byte 2: MASK(1) LENGTH(7)
-        byte2 = 0x80 if mask else 0
-
-        if length < 126:  # 126 is magic value to use 2-byte length header
-            byte2 |= length
-            frame = struct.pack("!BB", byte1, byte2)
-
-        elif length < (1 << 16):  # Length fits in 2-bytes
-            byte2 |= 126  # Magic code
-            frame = struct.pack("!BBH", byte1, byte2, length)
-
-        elif length < (1 << 64):
-            byte2 |= 127  # Magic code
-            frame = struct.pack("!BBQ", byte1, byte2, length)
-
+        if n < 126:  # 126 is magic value to use 2-byte length header
+            hdr[1] = 0x80 | n
+            i = 2
+        elif n < (1 << 16):  # Length fits in 2-bytes
+            hdr[1] = 0x80 | 126  # Magic code
+            struct.pack_into("!H", hdr, 2, n)
+            i = 4
         else:
-            raise ValueError
-
+            hdr[1] = 0x80 | 127  # Magic code
+            struct.pack_into("!Q", hdr, 2, n)
+            i = 10
         # Mask is 4 bytes
-        mask_bits = struct.pack("!I", random.getrandbits(32))
-        frame += mask_bits
-        payload = bytes(b ^ mask_bits[i % 4] for i, b in enumerate(payload))
-        return frame + payload
+        struct.pack_into("!I", hdr, i, random.getrandbits(32))
+        self.writer.write(memoryview(hdr)[: i + 4])
+
+        # Mask the payload piece by piece in the reusable buffer, the buffer size
+        # is a multiple of 4 so every piece starts at mask offset 0.
+        if self._tx_buf is None:
+            self._tx_buf = bytearray(_TX_BUF_SIZE)
+        buf = self._tx_buf
+        mv = memoryview(buf)
+        payload = memoryview(payload)
+        for off in range(0, n, _TX_BUF_SIZE):
+            k = min(_TX_BUF_SIZE, n - off)
+            mv[:k] = payload[off : off + k]
+            _mask(buf, k, hdr, i)
+            self.writer.write(mv[:k])
 
     async def handshake(self, uri, ssl, req):
         headers = self.params
@@ -146,6 +231,12 @@ class WebSocketClient:
         headers["Sec-WebSocket-Key"] = str(key, "utf-8")
         headers["Sec-WebSocket-Version"] = "13"
         headers["Origin"] = f"{_http_proto}://{uri.hostname}:{uri.port}"
+        if self.compress:
+            # We can't keep a compression context, but can inflate with one.
+            headers["Sec-WebSocket-Extensions"] = (
+                "permessage-deflate; client_no_context_takeover; server_max_window_bits=%d"
+                % self.compress
+            )
 
         self.reader, self.writer = await req(
             "GET",
@@ -163,24 +254,102 @@ class WebSocketClient:
         while header:
             header = await self.reader.readline()
             header = header[:-2]
+            if self.compress and header[:25].lower() == b"sec-websocket-extensions:":
+                self._negotiate(header[25:].decode().strip())
 
     async def receive(self):
+        frag_opcode = None
+        frags = None
+        compressed = False
         while True:
-            opcode, payload = await self._read_frame()
+            fin, rsv1, opcode, payload = await self._read_frame()
+            if opcode == self.CONT:
+                # Continuation of a fragmented message.
+                if frags is None:
+                    continue
+                frags.extend(payload)
+                if not fin:
+                    continue
+                opcode, payload = frag_opcode, bytes(frags)
+                frags = None
+            elif opcode < self.CLOSE:
+                # RSV1 on the first frame marks a compressed message.
+                compressed = rsv1 and self._rx_deflate
+                if not fin:
+                    # First fragment of a message, control frames may be interleaved.
+                    frag_opcode, frags = opcode, bytearray(payload)
+                    continue
+            if compressed and opcode < self.CLOSE:
+                payload = self._inflate(payload)
             send_opcode, data = self._process_websocket_frame(opcode, payload)
             if send_opcode:  # pragma: no cover
                 await self.send(data, send_opcode)
             if opcode == self.CLOSE:
                 self.closed = True
                 return opcode, data
-            elif data:  # pragma: no branch
+            elif data and opcode < self.CLOSE:  # pragma: no branch
+                # Pings are answered above, only data messages are returned.
                 return opcode, data
 
-    async def send(self, data, opcode=None):
-        frame = self._encode_websocket_frame(
-            opcode or (self.TEXT if isinstance(data, str) else self.BINARY), data
-        )
-        self.writer.write(frame)
+    async def receive_into(self, buf):
+        # Receive the next data message straight into buf, returning (opcode, nbytes).
+        # Raises ValueError if the message doesn't fit, the connection should then be closed.
+        mv = memoryview(buf)
+        msg_opcode = None
+        compressed = False
+        n = 0
+        while True:
+            fin, rsv1, opcode, length, has_mask = await self._read_frame_header()
+            if opcode is None:
+                # End of stream.
+                self.closed = True
+                return self.CLOSE, 0
+            if opcode >= self.CLOSE:
+                # Control frame, handle it and keep waiting for data.
+                payload = await self._read_payload(length, has_mask) if length else b""
+                send_opcode, data = self._process_websocket_frame(opcode, payload)
+                if send_opcode:  # pragma: no cover
+                    await self.send(data, send_opcode)
+                if opcode == self.CLOSE:
+                    self.closed = True
+                    return self.CLOSE, 0
+                continue
+            if opcode != self.CONT:
+                msg_opcode = opcode
+                compressed = rsv1 and self._rx_deflate
+                n = 0
+            if n + length > len(mv):
+                raise ValueError("message too large for buffer")
+            if not await self._read_into(mv[n : n + length]):
+                self.closed = True
+                return self.CLOSE, 0
+            if has_mask:  # pragma: no cover
+                _mask(mv[n:], length, self._rx_hdr, 10)
+            n += length
+            if fin:
+                if compressed:
+                    data = self._inflate(bytes(mv[:n]))
+                    if len(data) > len(mv):
+                        raise ValueError("message too large for buffer")
+                    n = len(data)
+                    mv[:n] = data
+                return msg_opcode, n
+
+    async def send(self, data, opcode=None, fin=True):
+        if isinstance(data, str):
+            data = data.encode()
+            if opcode is None:
+                opcode = self.TEXT
+        if opcode is None:
+            opcode = self.BINARY
+        rsv1 = False
+        # Only whole data messages are compressed, and only if it makes them smaller.
+        if self._tx_deflate and fin and opcode < self.CLOSE and len(data) >= _COMPRESS_MIN:
+            compressed = self._deflate(data)
+            if len(compressed) < len(data):
+                data = compressed
+                rsv1 = True
+        self._write_frame(opcode, data, fin, rsv1)
         await self.writer.drain()
 
     async def close(self):
@@ -188,25 +357,57 @@ class WebSocketClient:
             self.closed = True
             await self.send(b"", self.CLOSE)
 
-    async def _read_frame(self):
-        header = await self.reader.readexactly(2)
-        if len(header) != 2:  # pragma: no cover
+    async def _read_into(self, mv):
+        # Fill mv completely from the stream, returns False at end of stream.
+        n = 0
+        while n < len(mv):
+            r = await self.reader.readinto(mv[n:])
+            if not r:
+                return False
+            n += r
+        return True
+
+    async def _read_frame_header(self):
+        # Parse a frame header using the reusable buffer, the mask (if any) is left at hdr[10:14].
+        # At end of stream (even part way through the header) the opcode is None.
+        hdr = self._rx_hdr
+        mv = memoryview(hdr)
+        if not await self._read_into(mv[:2]):  # pragma: no cover
             # raise OSError(32, "Websocket connection closed")
-            opcode = self.CLOSE
-            payload = b""
-            return opcode, payload
-        fin, opcode, has_mask, length = self._parse_frame_header(header)
+            return True, False, None, 0, False
+        # Byte 1: FIN(1) RSV1(1) _(1) _(1) OPCODE(4)
+        fin = bool(hdr[0] & 0x80)
+        rsv1 = bool(hdr[0] & 0x40)
+        opcode = hdr[0] & 0x0F
+        # Byte 2: MASK(1) LENGTH(7)
+        has_mask = bool(hdr[1] & 0x80)
+        length = hdr[1] & 0x7F
         if length == 126:  # Magic number, length header is 2 bytes
-            (length,) = struct.unpack("!H", await self.reader.readexactly(2))
+            if not await self._read_into(mv[2:4]):
+                return True, False, None, 0, False
+            length = hdr[2] << 8 | hdr[3]
         elif length == 127:  # Magic number, length header is 8 bytes
-            (length,) = struct.unpack("!Q", await self.reader.readexactly(8))
+            if not await self._read_into(mv[2:10]):
+                return True, False, None, 0, False
+            (length,) = struct.unpack_from("!Q", hdr, 2)
+        if has_mask and not await self._read_into(mv[10:14]):  # pragma: no cover
+            return True, False, None, 0, False
+        return fin, rsv1, opcode, length, has_mask
+
+    async def _read_payload(self, length, has_mask):
+        if not has_mask:
+            return await self.reader.readexactly(length)
+        payload = bytearray(length)  # pragma: no cover
+        await self._read_into(memoryview(payload))  # pragma: no cover
+        _mask(payload, length, self._rx_hdr, 10)  # pragma: no cover
+        return payload  # pragma: no cover
 
-        if has_mask:  # pragma: no cover
-            mask = await self.reader.readexactly(4)
-        payload = await self.reader.readexactly(length)
-        if has_mask:  # pragma: no cover
-            payload = bytes(x ^ mask[i % 4] for i, x in enumerate(payload))
-        return opcode, payload
+    async def _read_frame(self):
+        fin, rsv1, opcode, length, has_mask = await self._read_frame_header()
+        if opcode is None:  # pragma: no cover
+            return True, False, self.CLOSE, b""
+        payload = await self._read_payload(length, has_mask) if length else b""
+        return fin, rsv1, opcode, payload
 
 
 class ClientWebSocketResponse:
@@ -255,6 +456,11 @@ class ClientWebSocketResponse:
         data = await self.receive_str()
         return _json.loads(data)
 
+    async def receive_into(self, buf):
+        # Receive the next message into buf, msg.data is a memoryview of the filled part.
+        opcode, n = await self.ws.receive_into(buf)
+        return WebSocketMessage(opcode, memoryview(buf)[:n])
+
 
 class _WSRequestContextManager:
     def __init__(self, client, request_co):
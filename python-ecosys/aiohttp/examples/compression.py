@@ -17,5 +17,12 @@ async def main():
             html = await response.text()
             print(html)
 
+        # Large bodies can be decompressed and processed in bounded pieces.
+        async with session.get("http://micropython.org") as response:
+            size = 0
+            async for chunk in response.iter_chunked(256):
+                size += len(chunk)
+            print("Decompressed size:", size)
+
 
 asyncio.run(main())
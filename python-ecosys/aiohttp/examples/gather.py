@@ -0,0 +1,21 @@
+import sys
+
+# ruff: noqa: E402
+sys.path.insert(0, ".")
+import aiohttp
+import asyncio
+
+
+async def main():
+    connector = aiohttp.TCPConnector(limit=4)
+    async with aiohttp.ClientSession("http://httpbin.org", connector=connector) as session:
+        requests = ["/delay/1", "/get", ("POST", "/post", {"json": {"foo": "bar"}}), "/uuid"]
+        async for resp in session.gather_requests(requests, limit=4, return_exceptions=True):
+            if isinstance(resp, Exception):
+                print("Error:", resp)
+            else:
+                print(resp.status, resp.url, len(await resp.text()))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
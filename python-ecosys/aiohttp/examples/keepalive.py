@@ -0,0 +1,22 @@
+import sys
+
+# ruff: noqa: E402
+sys.path.insert(0, ".")
+import aiohttp
+import asyncio
+import time
+
+
+async def main():
+    connector = aiohttp.TCPConnector(limit=2, keepalive_timeout=15)
+    async with aiohttp.ClientSession("http://httpbin.org", connector=connector) as session:
+        for i in range(5):
+            t0 = time.ticks_ms()
+            async with session.get("/get", params={"i": i}) as resp:
+                assert resp.status == 200
+                await resp.text()
+            print(f"GET {i}: {time.ticks_diff(time.ticks_ms(), t0)} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
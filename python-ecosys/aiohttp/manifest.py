@@ -1,6 +1,6 @@
 metadata(
     description="HTTP client module for MicroPython asyncio module",
-    version="0.0.6",
+    version="0.0.14",
     pypi="aiohttp",
 )
 
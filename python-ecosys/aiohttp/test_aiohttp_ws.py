@@ -0,0 +1,140 @@
+import asyncio
+from aiohttp import WebSocketClient
+
+
+class Loopback:
+    # Stream whose reads return what was written to it.
+    def __init__(self):
+        self.buf = bytearray()
+
+    def write(self, data):
+        self.buf.extend(data)
+
+    async def drain(self):
+        pass
+
+    async def readinto(self, mv):
+        n = min(len(mv), len(self.buf))
+        mv[:n] = self.buf[:n]
+        self.buf = self.buf[n:]
+        return n
+
+    async def readexactly(self, n):
+        data = bytes(self.buf[:n])
+        self.buf = self.buf[n:]
+        return data
+
+    async def readline(self):
+        return await self.readexactly(self.buf.find(b"\n") + 1 or len(self.buf))
+
+
+def make_pair():
+    # The client writes masked frames, which the peer reads.
+    stream = Loopback()
+    ws = WebSocketClient({})
+    ws.writer = stream
+    peer = WebSocketClient({})
+    peer.reader = stream
+    peer.writer = Loopback()
+    return ws, peer
+
+
+async def test_masking():
+    ws, peer = make_pair()
+    for n in (1, 125, 126, 1025, 65535, 65536):
+        data = bytes(i * 7 & 0xFF for i in range(n))
+        await ws.send(data)
+        assert await peer.receive() == (ws.BINARY, data), n
+        await ws.send(data)
+        buf = bytearray(n + 1)
+        assert await peer.receive_into(buf) == (ws.BINARY, n), n
+        assert buf[:n] == data, n
+    await ws.send("text")
+    assert await peer.receive() == (ws.TEXT, "text")
+
+
+async def test_fragments():
+    ws, peer = make_pair()
+    for recv_into in (False, True):
+        await ws.send(b"ab", fin=False)
+        await ws.send(b"c" * 200, ws.CONT, fin=False)
+        await ws.send(b"", ws.PING)
+        await ws.send(b"de", ws.CONT)
+        data = b"ab" + b"c" * 200 + b"de"
+        if recv_into:
+            buf = bytearray(256)
+            assert await peer.receive_into(buf) == (ws.BINARY, len(data))
+            assert buf[: len(data)] == data
+        else:
+            assert await peer.receive() == (ws.BINARY, data)
+    await ws.send("ab", fin=False)
+    await ws.send(b"cd", ws.CONT)
+    assert await peer.receive() == (ws.TEXT, "abcd")
+
+
+# A message compressed by a server three times with a 2^10 byte window, for
+# each context takeover mode: with takeover, the repeats refer to the first.
+MESSAGE = "temperature,humidity,pressure;" * 4
+FIRST = "2a49cd2d482d4a2c292d4ad5c928cdcd4cc92ca9d429284a2d2e068a5897d04c1600"
+COMPRESSED = {
+    True: (FIRST, "1a28590000", "1a28590000"),
+    False: (FIRST, FIRST, FIRST),
+}
+
+
+async def test_deflate():
+    for takeover in (True, False):
+        ext = "permessage-deflate; client_no_context_takeover; server_max_window_bits=10"
+        if not takeover:
+            ext += "; server_no_context_takeover"
+        # The handshake response, followed by compressed frames with RSV1 set.
+        reader = Loopback()
+        reader.write(b"HTTP/1.1 101 Switching Protocols\r\n")
+        reader.write(b"Sec-WebSocket-Extensions: %s\r\n\r\n" % ext.encode())
+        for payload in COMPRESSED[takeover]:
+            payload = bytes.fromhex(payload)
+            reader.write(bytes((0xC1, len(payload))) + payload)
+        writer = Loopback()
+        sent = {}
+
+        async def request(method, url, headers, **kw):
+            sent.update(headers)
+            return reader, writer
+
+        ws = WebSocketClient({}, compress=10)
+        if not ws.compress:
+            # No deflate module.
+            return
+        await ws.connect("ws://example.com/", handshake_request=request)
+        assert sent["Sec-WebSocket-Extensions"].startswith("permessage-deflate;"), sent
+        assert ws._rx_deflate and ws._rx_takeover == takeover and ws._rx_wbits == 10
+
+        assert await ws.receive() == (ws.TEXT, MESSAGE)
+        assert await ws.receive() == (ws.TEXT, MESSAGE)
+        buf = bytearray(256)
+        assert await ws.receive_into(buf) == (ws.TEXT, len(MESSAGE))
+        assert buf[: len(MESSAGE)] == MESSAGE.encode()
+
+        if not ws._tx_deflate:
+            # The deflate module can't compress.
+            continue
+        # Messages sent are compressed, each on its own.
+        writer.buf = bytearray()
+        peer = WebSocketClient({})
+        peer.reader = writer
+        peer._rx_deflate = True
+        peer._rx_takeover = takeover
+        peer._rx_wbits = ws._tx_wbits
+        for _ in range(2):
+            await ws.send(MESSAGE)
+            assert writer.buf[0] == 0xC1 and writer.buf[1] & 0x7F < len(MESSAGE), writer.buf
+            assert await peer.receive() == (ws.TEXT, MESSAGE)
+        # Short messages aren't compressed.
+        await ws.send("short")
+        assert writer.buf[0] == 0x81, writer.buf
+        assert await peer.receive() == (ws.TEXT, "short")
+
+
+asyncio.run(test_masking())
+asyncio.run(test_fragments())
+asyncio.run(test_deflate())
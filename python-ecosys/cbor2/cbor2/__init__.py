@@ -26,7 +26,15 @@ THE SOFTWARE.
 from ._decoder import CBORDecoder
 from ._decoder import load
 from ._decoder import loads
+from ._decoder import loads_into
+from ._decoder import CBORBufferDecoder
+
+from ._stream import CBORStreamDecoder
+from ._stream import load_iter
 
 from ._encoder import CBOREncoder
 from ._encoder import dump
 from ._encoder import dumps
+from ._encoder import dumps_into
+from ._encoder import dump_iter
+from ._encoder import CBORBufferEncoder
@@ -23,7 +23,7 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
-import io
+import math
 import struct
 
 
@@ -80,8 +80,8 @@ def decode_negint(decoder, subtype):
     return -uint - 1
 
 
-def decode_bytestring(decoder, subtype):
-    # Major tag 2
+def decode_bytestring(decoder, subtype, text=False):
+    # Major tag 2, or 3 if text
     length = decode_uint(decoder, subtype, allow_indefinite=True)
     if length is None:
         # Indefinite length
@@ -89,18 +89,24 @@ def decode_bytestring(decoder, subtype):
         while True:
             initial_byte = decoder.read(1)[0]
             if initial_byte == 255:
-                return buf
+                return buf.decode("utf-8") if text else buf
             else:
                 length = decode_uint(decoder, initial_byte & 31)
                 value = decoder.read(length)
                 buf.extend(value)
     else:
-        return decoder.read(length)
+        value = decoder.read(length)
+        if text:
+            value = value.decode("utf-8")
+        refs = decoder.refs
+        if refs is not None and length >= string_ref_min_length(len(refs)):
+            refs.append(value)
+        return value
 
 
 def decode_string(decoder, subtype):
     # Major tag 3
-    return decode_bytestring(decoder, subtype).decode("utf-8")
+    return decode_bytestring(decoder, subtype, True)
 
 
 def decode_array(decoder, subtype):
@@ -144,6 +150,36 @@ def decode_map(decoder, subtype):
     return dictionary
 
 
+def decode_semantic(decoder, subtype):
+    # Major tag 6
+    tag = decode_uint(decoder, subtype)
+    if tag == 25:
+        # Reference to a string in the current stringref namespace.
+        refs = decoder.refs
+        if refs is None:
+            raise CBORDecodeError("string reference outside of a namespace")
+        index = decoder.decode()
+        if type(index) is not int or index < 0 or index >= len(refs):
+            raise CBORDecodeError("invalid string reference")
+        return refs[index]
+    elif tag == 256:
+        # Stringref namespace.
+        outer = decoder.refs
+        decoder.refs = []
+        try:
+            return decoder.decode()
+        finally:
+            decoder.refs = outer
+    elif tag == 2 or tag == 3:
+        # Bignum.
+        value = decoder.decode()
+        if not isinstance(value, (bytes, bytearray)):
+            raise CBORDecodeError("invalid bignum")
+        value = int.from_bytes(value, "big")
+        return value if tag == 2 else -value - 1
+    raise CBORDecodeError("unsupported semantic tag %d" % tag)
+
+
 def decode_special(decoder, subtype):
     # Simple value
     if subtype < 20:
@@ -157,9 +193,22 @@ def decode_simple_value(decoder):
     return CBORSimpleValue(struct.unpack(">B", decoder.read(1))[0])
 
 
+def half_to_float(h):
+    # Converts the bits of an IEEE 754 half precision float (struct has no
+    # "e" format on MicroPython).
+    exp = (h >> 10) & 0x1F
+    mant = h & 0x3FF
+    if exp == 0:
+        value = math.ldexp(mant, -24)
+    elif exp == 31:
+        value = math.nan if mant else math.inf
+    else:
+        value = math.ldexp(mant + 1024, exp - 25)
+    return -value if h & 0x8000 else value
+
+
 def decode_float16(decoder):
-    decoder.read(2)
-    raise NotImplementedError  # no float16 unpack function
+    return half_to_float(struct.unpack(">H", decoder.read(2))[0])
 
 
 def decode_float32(decoder):
@@ -177,6 +226,7 @@ major_decoders = {
     3: decode_string,
     4: decode_array,
     5: decode_map,
+    6: decode_semantic,
     7: decode_special,
 }
 
@@ -196,10 +246,16 @@ special_decoders = {
 class CBORDecoder(object):
     """
     Deserializes a CBOR encoded byte stream.
+
+    The semantic tags supported are bignums (tags 2 and 3) and stringref
+    namespaces and references (tags 256 and 25); others raise
+    :class:`CBORDecodeError`.
     """
 
     def __init__(self, fp):
         self.fp = fp
+        # Strings in the current stringref namespace.
+        self.refs = None
 
     def read(self, amount):
         """
@@ -241,15 +297,328 @@ class CBORDecoder(object):
             )  # tell doesn't work on micropython at the moment
 
 
+# Decoding from a buffer. Each item is decoded by a function taking the
+# decoder and the initial byte, picked from a table indexed by that byte.
+# Arguments and floats are unpacked directly from the buffer.
+
+_ARG_FORMATS = (">B", ">H", ">L", ">Q")
+
+
+def _arg(d, ib):
+    subtype = ib & 31
+    if subtype < 24:
+        return subtype
+    if subtype < 28:
+        pos = d.pos
+        d.pos = pos + (1 << (subtype - 24))
+        return struct.unpack_from(_ARG_FORMATS[subtype - 24], d.buf, pos)[0]
+    raise CBORDecodeError("unknown subtype 0x%x" % subtype)
+
+
+def _slice(d, n):
+    pos = d.pos
+    end = pos + n
+    if end > len(d.buf):
+        raise CBORDecodeError("premature end of data")
+    d.pos = end
+    return d.buf[pos:end]
+
+
+def _fast_small_uint(d, ib):
+    return ib
+
+
+def _fast_uint(d, ib):
+    return _arg(d, ib)
+
+
+def _fast_negint(d, ib):
+    return -_arg(d, ib) - 1
+
+
+def string_ref_min_length(index):
+    # Strings in a stringref namespace are only numbered if a reference to
+    # them, with the given index, would be shorter than the string.
+    if index < 24:
+        return 3
+    elif index < 256:
+        return 4
+    elif index < 65536:
+        return 5
+    elif index < 4294967296:
+        return 7
+    return 11
+
+
+def _fast_bytestring(d, ib):
+    n = _arg(d, ib)
+    value = _slice(d, n)
+    if not d.zero_copy:
+        value = bytes(value)
+    refs = d.refs
+    if refs is not None and n >= string_ref_min_length(len(refs)):
+        refs.append(value)
+    return value
+
+
+def _fast_string(d, ib):
+    n = _arg(d, ib)
+    value = str(_slice(d, n), "utf-8")
+    refs = d.refs
+    if refs is not None and n >= string_ref_min_length(len(refs)):
+        refs.append(value)
+    return value
+
+
+def _fast_indefinite_string(d, ib):
+    buf = bytearray()
+    while True:
+        chunk_ib = d.buf[d.pos]
+        d.pos += 1
+        if chunk_ib == 255:
+            break
+        if chunk_ib & 0xE0 != ib & 0xE0 or chunk_ib & 31 == 31:
+            raise CBORDecodeError("invalid indefinite length string chunk")
+        buf.extend(_slice(d, _arg(d, chunk_ib)))
+    return str(buf, "utf-8") if ib == 0x7F else bytes(buf)
+
+
+def _fast_array(d, ib):
+    decode = d._decode
+    return [decode() for _ in range(_arg(d, ib))]
+
+
+def _fast_map(d, ib):
+    decode = d._decode
+    decode_key = decode if d.key_table is None else d._decode_key
+    dictionary = {}
+    for _ in range(_arg(d, ib)):
+        key = decode_key()
+        dictionary[key] = decode()
+    return dictionary
+
+
+def _at_break(d):
+    # Consumes the break ending an indefinite length item, if it's next.
+    if d.buf[d.pos] == 0xFF:
+        d.pos += 1
+        return True
+    return False
+
+
+def _fast_indefinite_array(d, ib):
+    items = []
+    while not _at_break(d):
+        items.append(d._decode())
+    return items
+
+
+def _fast_indefinite_map(d, ib):
+    dictionary = {}
+    while not _at_break(d):
+        key = d._decode_key()
+        dictionary[key] = d._decode()
+    return dictionary
+
+
+def _fast_tag(d, ib):
+    tag = _arg(d, ib)
+    if tag == 25:
+        # Reference to a string in the current stringref namespace.
+        if d.refs is None:
+            raise CBORDecodeError("string reference outside of a namespace")
+        index = d._decode()
+        if type(index) is not int or index < 0 or index >= len(d.refs):
+            raise CBORDecodeError("invalid string reference")
+        return d.refs[index]
+    elif tag == 256:
+        # Stringref namespace.
+        outer = d.refs
+        d.refs = []
+        try:
+            return d._decode()
+        finally:
+            d.refs = outer
+    elif tag == 2 or tag == 3:
+        # Bignum.
+        value = d._decode()
+        if not isinstance(value, (bytes, memoryview)):
+            raise CBORDecodeError("invalid bignum")
+        value = int.from_bytes(value, "big")
+        return value if tag == 2 else -value - 1
+    raise CBORDecodeError("unsupported semantic tag %d" % tag)
+
+
+def _fast_simple_value(d, ib):
+    return CBORSimpleValue(_arg(d, ib))
+
+
+def _fast_float(d, ib):
+    pos = d.pos
+    if ib == 0xF9:
+        d.pos = pos + 2
+        return half_to_float(struct.unpack_from(">H", d.buf, pos)[0])
+    elif ib == 0xFA:
+        d.pos = pos + 4
+        return struct.unpack_from(">f", d.buf, pos)[0]
+    d.pos = pos + 8
+    return struct.unpack_from(">d", d.buf, pos)[0]
+
+
+def _fast_invalid(d, ib):
+    raise CBORDecodeError("unsupported initial byte 0x%x" % ib)
+
+
+def _fast_break(d, ib):
+    raise CBORDecodeError("unexpected break")
+
+
+def _fast_table():
+    table = [_fast_invalid] * 256
+    for i in range(28):
+        table[i] = _fast_small_uint if i < 24 else _fast_uint
+        table[0x20 + i] = _fast_negint
+        table[0x40 + i] = _fast_bytestring
+        table[0x60 + i] = _fast_string
+        table[0x80 + i] = _fast_array
+        table[0xA0 + i] = _fast_map
+        table[0xC0 + i] = _fast_tag
+    for i in range(0xE0, 0xF4):
+        table[i] = _fast_simple_value
+    table[0x5F] = _fast_indefinite_string
+    table[0x7F] = _fast_indefinite_string
+    table[0x9F] = _fast_indefinite_array
+    table[0xBF] = _fast_indefinite_map
+    table[0xF4] = lambda d, ib: False
+    table[0xF5] = lambda d, ib: True
+    table[0xF6] = lambda d, ib: None
+    table[0xF8] = _fast_simple_value
+    table[0xF9] = _fast_float
+    table[0xFA] = _fast_float
+    table[0xFB] = _fast_float
+    table[0xFF] = _fast_break
+    return table
+
+
+fast_decoders = _fast_table()
+
+
+def _reusable(obj):
+    return isinstance(obj, (list, dict))
+
+
+class CBORBufferDecoder(object):
+    """
+    Deserializes CBOR data held in memory, without copying it.
+    :param buf: the data (any object supporting the buffer protocol)
+    :param int offset: the index of the first item in ``buf``
+    :param bool zero_copy: return byte strings as memoryview slices of
+        ``buf`` instead of copies; they are only valid while ``buf`` is
+        unchanged, and can't be used as map keys
+    :param key_table: a dict used to intern text map keys, so that equal
+        keys decode to the same object; pass the same dict to several
+        decoders to share it
+    """
+
+    def __init__(self, buf, offset=0, zero_copy=False, key_table=None):
+        self.buf = memoryview(buf)
+        self.pos = offset
+        self.zero_copy = zero_copy
+        self.key_table = key_table
+        # Strings in the current stringref namespace.
+        self.refs = None
+
+    def _decode(self):
+        pos = self.pos
+        ib = self.buf[pos]
+        self.pos = pos + 1
+        return fast_decoders[ib](self, ib)
+
+    def _decode_key(self):
+        key = self._decode()
+        if self.key_table is not None and type(key) is str:
+            key = self.key_table.setdefault(key, key)
+        return key
+
+    def _decode_into(self, obj):
+        ib = self.buf[self.pos]
+        if ib & 0xE0 == 0x80 and isinstance(obj, list):
+            self.pos += 1
+            length = None if ib == 0x9F else _arg(self, ib)
+            i = 0
+            while i < length if length is not None else not _at_break(self):
+                if i < len(obj):
+                    value = obj[i]
+                    obj[i] = self._decode_into(value) if _reusable(value) else self._decode()
+                else:
+                    obj.append(self._decode())
+                i += 1
+            del obj[i:]
+            return obj
+        elif ib & 0xE0 == 0xA0 and isinstance(obj, dict):
+            self.pos += 1
+            length = None if ib == 0xBF else _arg(self, ib)
+            # Keys are only recorded if there may be stale ones to remove.
+            keys = [] if obj else None
+            i = 0
+            while i < length if length is not None else not _at_break(self):
+                key = self._decode_key()
+                value = obj.get(key)
+                obj[key] = self._decode_into(value) if _reusable(value) else self._decode()
+                if keys is not None:
+                    keys.append(key)
+                i += 1
+            if keys is not None and len(obj) > len(keys):
+                for key in [key for key in obj if key not in keys]:
+                    del obj[key]
+            return obj
+        elif ib == 0xD9 and struct.unpack_from(">H", self.buf, self.pos + 1)[0] == 256:
+            # Stringref namespace.
+            self.pos += 3
+            outer = self.refs
+            self.refs = []
+            try:
+                return self._decode_into(obj)
+            finally:
+                self.refs = outer
+        return self._decode()
+
+    def decode(self, into=None):
+        """
+        Decode the next value from the buffer.
+        :param into: a list or dict to decode an array or map into, reusing
+            it and, recursively, any lists and dicts it holds in the same
+            positions or keys
+        :raises CBORDecodeError: if there is any problem decoding the data
+        """
+        try:
+            return self._decode_into(into) if into is not None else self._decode()
+        except CBORDecodeError:
+            raise
+        except Exception as e:
+            raise CBORDecodeError("error decoding value: {}".format(e))
+
+
 def loads(payload, **kwargs):
     """
     Deserialize an object from a bytestring.
     :param bytes payload: the bytestring to serialize
-    :param kwargs: keyword arguments passed to :class:`~.CBORDecoder`
+    :param kwargs: keyword arguments passed to :class:`~.CBORBufferDecoder`
     :return: the deserialized object
     """
-    fp = io.BytesIO(payload)
-    return CBORDecoder(fp, **kwargs).decode()
+    return CBORBufferDecoder(payload, **kwargs).decode()
+
+
+def loads_into(payload, obj, **kwargs):
+    """
+    Deserialize an array or map from a bytestring into an existing list or
+    dict, reusing the containers of a previous result.
+    :param bytes payload: the bytestring to deserialize
+    :param obj: the list or dict to decode into
+    :param kwargs: keyword arguments passed to :class:`~.CBORBufferDecoder`
+    :return: the deserialized object, which is ``obj`` if it had the same type
+    """
+    return CBORBufferDecoder(payload, **kwargs).decode(obj)
 
 
 def load(fp, **kwargs):
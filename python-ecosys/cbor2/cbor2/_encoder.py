@@ -23,9 +23,11 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
-import io
+import math
 import struct
 
+from ._decoder import string_ref_min_length
+
 
 class CBOREncodeError(Exception):
     """Raised when an error occurs while serializing an object into a CBOR datastream."""
@@ -51,8 +53,6 @@ def encode_semantic(encoder, tag, value):
 
 def encode_float(encoder, value):
     # Handle special values efficiently
-    import math
-
     if math.isnan(value):
         encoder.write(b"\xf9\x7e\x00")
     elif math.isinf(value):
@@ -159,24 +159,352 @@ class CBOREncoder(object):
         encoder(self, obj)
 
 
+# Encoding into a buffer. Heads and floats are packed directly into a
+# bytearray that grows as needed, or into a caller-supplied buffer.
+
+_FLOAT32_MAX = 3.4028234663852886e38
+
+
+def single_to_half(bits):
+    # Returns the bits of the IEEE 754 half precision float equal to the
+    # single precision float with the given bits, or None if there is none.
+    sign = (bits >> 16) & 0x8000
+    exp = (bits >> 23) & 0xFF
+    mant = bits & 0x7FFFFF
+    if exp == 0xFF:
+        return sign | 0x7C00 | mant >> 13 if not mant & 0x1FFF else None
+    if exp > 142:
+        return None
+    if exp > 112:
+        return sign | (exp - 112) << 10 | mant >> 13 if not mant & 0x1FFF else None
+    if exp > 101:
+        # Subnormal in half precision.
+        mant |= 0x800000
+        shift = 126 - exp
+        return sign | mant >> shift if not mant & ((1 << shift) - 1) else None
+    return sign if not exp and not mant else None
+
+
+def _head(e, major_tag, length):
+    pos = e.pos
+    if length < 24:
+        e._reserve(1)[pos] = major_tag | length
+        e.pos = pos + 1
+    elif length < 256:
+        struct.pack_into(">BB", e._reserve(2), pos, major_tag | 24, length)
+        e.pos = pos + 2
+    elif length < 65536:
+        struct.pack_into(">BH", e._reserve(3), pos, major_tag | 25, length)
+        e.pos = pos + 3
+    elif length < 4294967296:
+        struct.pack_into(">BL", e._reserve(5), pos, major_tag | 26, length)
+        e.pos = pos + 5
+    else:
+        struct.pack_into(">BQ", e._reserve(9), pos, major_tag | 27, length)
+        e.pos = pos + 9
+
+
+def _fast_int(e, value):
+    if value >= 18446744073709551616 or value < -18446744073709551616:
+        if value >= 0:
+            tag = 0x02
+        else:
+            tag = 0x03
+            value = -value - 1
+        values = []
+        while value > 0:
+            value, remainder = divmod(value, 256)
+            values.insert(0, remainder)
+        _head(e, 0xC0, tag)
+        _fast_bytestring(e, bytes(values))
+    elif value >= 0:
+        _head(e, 0, value)
+    else:
+        _head(e, 0x20, -value - 1)
+
+
+def _fast_float(e, value):
+    pos = e.pos
+    if math.isnan(value) or math.isinf(value):
+        half = 0x7E00 if math.isnan(value) else 0x7C00 if value > 0 else 0xFC00
+        struct.pack_into(">BH", e._reserve(3), pos, 0xF9, half)
+        e.pos = pos + 3
+        return
+    if e.shortest_float and abs(value) <= _FLOAT32_MAX:
+        single = struct.pack(">f", value)
+        if struct.unpack(">f", single)[0] == value:
+            half = single_to_half(struct.unpack(">I", single)[0])
+            if half is not None:
+                struct.pack_into(">BH", e._reserve(3), pos, 0xF9, half)
+                e.pos = pos + 3
+            else:
+                struct.pack_into(">Bf", e._reserve(5), pos, 0xFA, value)
+                e.pos = pos + 5
+            return
+    struct.pack_into(">Bd", e._reserve(9), pos, 0xFB, value)
+    e.pos = pos + 9
+
+
+def _string_ref(e, key, n):
+    # Writes a reference to a string if it's in the stringref namespace, or
+    # else numbers it if it's long enough. Returns whether it was written.
+    refs = e.refs
+    index = refs.get(key)
+    if index is not None:
+        _head(e, 0xC0, 25)
+        _head(e, 0, index)
+        return True
+    if n >= string_ref_min_length(len(refs)):
+        refs[key] = len(refs)
+    return False
+
+
+def _string(e, value, major_tag):
+    n = len(value)
+    if n < 24:
+        # Short strings, the most common, are written in one go.
+        pos = e.pos
+        end = pos + 1 + n
+        buf = e.buf
+        if end > len(buf):
+            buf = e._reserve(1 + n)
+        buf[pos] = major_tag | n
+        buf[pos + 1 : end] = value
+        e.pos = end
+    else:
+        _head(e, major_tag, n)
+        e.write(value)
+
+
+def _fast_bytestring(e, value):
+    if e.refs is not None:
+        key = value if type(value) is bytes else bytes(value)
+        if _string_ref(e, key, len(value)):
+            return
+    _string(e, value, 0x40)
+
+
+def _fast_string(e, value):
+    data = value.encode("utf-8")
+    if e.refs is not None and _string_ref(e, value, len(data)):
+        return
+    _string(e, data, 0x60)
+
+
+def _fast_array(e, value):
+    _head(e, 0x80, len(value))
+    encode = e._encode
+    for item in value:
+        encode(item)
+
+
+def _fast_map(e, value):
+    _head(e, 0xA0, len(value))
+    encode = e._encode
+    if e.canonical:
+        # Keys are sorted by their encoding, which is found by encoding them
+        # at the end of the buffer. String references aren't used for this.
+        refs = e.refs
+        e.refs = None
+        start = e.pos
+        items = []
+        for key, val in value.items():
+            encode(key)
+            items.append((bytes(e.buf[start : e.pos]), key, val))
+            e.pos = start
+        e.refs = refs
+        items.sort(key=lambda item: item[0])
+        for data, key, val in items:
+            if refs is None:
+                e.write(data)
+            else:
+                encode(key)
+            encode(val)
+    else:
+        for key, val in value.items():
+            encode(key)
+            encode(val)
+
+
+def _fast_bool(e, value):
+    buf = e._reserve(1)
+    buf[e.pos] = 0xF5 if value else 0xF4
+    e.pos += 1
+
+
+def _fast_none(e, value):
+    buf = e._reserve(1)
+    buf[e.pos] = 0xF6
+    e.pos += 1
+
+
+fast_encoders = {
+    bytes: _fast_bytestring,
+    bytearray: _fast_bytestring,
+    memoryview: _fast_bytestring,
+    str: _fast_string,
+    int: _fast_int,
+    float: _fast_float,
+    bool: _fast_bool,
+    type(None): _fast_none,
+    list: _fast_array,
+    tuple: _fast_array,
+    dict: _fast_map,
+}
+
+
+class CBORBufferEncoder(object):
+    """
+    Serializes objects into a buffer using Concise Binary Object Representation.
+    :param buf: the buffer to write to, or None to use a bytearray that grows as
+        needed; a supplied buffer has a fixed size
+    :param int offset: the index in ``buf`` to start writing at
+    :param bool canonical: use deterministic encoding (RFC 8949 section 4.2),
+        in which map keys are sorted
+    :param bool shortest_float: encode floats as half or single precision
+        when that loses no precision, rather than double precision; always
+        on in canonical mode
+    :param bool string_referencing: wrap each encoded object in a stringref
+        namespace (tag 256), in which repeated strings are encoded as
+        references (tag 25) to their first occurrence
+    """
+
+    def __init__(
+        self, buf=None, offset=0, canonical=False, shortest_float=False, string_referencing=False
+    ):
+        self.growable = buf is None
+        self.buf = bytearray(64) if buf is None else buf
+        self.pos = offset
+        self.canonical = canonical
+        self.shortest_float = shortest_float or canonical
+        self.string_referencing = string_referencing
+        # Indexes of the strings in the current stringref namespace.
+        self.refs = None
+
+    def _reserve(self, amount):
+        # Returns the buffer, with room for amount more bytes.
+        buf = self.buf
+        if self.pos + amount > len(buf):
+            if not self.growable:
+                raise CBOREncodeError("buffer too small")
+            buf.extend(bytes(max(len(buf), self.pos + amount - len(buf))))
+        return buf
+
+    def write(self, data):
+        """
+        Write bytes to the buffer.
+        :param data: the bytes to write
+        """
+        pos = self.pos
+        end = pos + len(data)
+        self._reserve(end - pos)[pos:end] = data
+        self.pos = end
+
+    def getvalue(self):
+        """
+        Return the data written to the buffer.
+        :rtype: bytes
+        """
+        return bytes(memoryview(self.buf)[: self.pos])
+
+    def write_head(self, major_tag, length):
+        """
+        Write the head of an item, such as an array or map whose items are
+        then encoded one by one.
+        :param int major_tag: the major type in the top 3 bits, e.g. 0x80 for
+            an array
+        :param int length: the length of the item, or its value for integers
+        """
+        _head(self, major_tag, length)
+
+    def _encode(self, obj):
+        try:
+            encoder = fast_encoders[type(obj)]
+        except KeyError:
+            raise CBOREncodeError("cannot serialize type %s" % type(obj))
+        encoder(self, obj)
+
+    def _begin(self):
+        if self.string_referencing:
+            _head(self, 0xC0, 256)
+            self.refs = {}
+
+    def encode(self, obj):
+        """
+        Encode the given object using CBOR.
+        :param obj: the object to encode
+        """
+        self._begin()
+        try:
+            self._encode(obj)
+        finally:
+            self.refs = None
+
+
 def dumps(obj, **kwargs):
     """
     Serialize an object to a bytestring.
     :param obj: the object to serialize
-    :param kwargs: keyword arguments passed to :class:`~.CBOREncoder`
+    :param kwargs: keyword arguments passed to :class:`~.CBORBufferEncoder`
     :return: the serialized output
     :rtype: bytes
     """
-    fp = io.BytesIO()
-    dump(obj, fp, **kwargs)
-    return fp.getvalue()
+    encoder = CBORBufferEncoder(**kwargs)
+    encoder.encode(obj)
+    return encoder.getvalue()
+
+
+def dumps_into(obj, buf, offset=0, **kwargs):
+    """
+    Serialize an object into an existing buffer.
+    :param obj: the object to serialize
+    :param buf: the buffer to write to (a bytearray, memoryview or array)
+    :param int offset: the index in ``buf`` to start writing at
+    :param kwargs: keyword arguments passed to :class:`~.CBORBufferEncoder`
+    :return: the index in ``buf`` after the serialized output
+    :raises CBOREncodeError: if ``buf`` is too small
+    """
+    encoder = CBORBufferEncoder(buf, offset, **kwargs)
+    encoder.encode(obj)
+    return encoder.pos
 
 
 def dump(obj, fp, **kwargs):
     """
-    Serialize an object to a file.
+    Serialize an object to a file, with a single write.
     :param obj: the object to serialize
     :param fp: a file-like object
-    :param kwargs: keyword arguments passed to :class:`~.CBOREncoder`
+    :param kwargs: keyword arguments passed to :class:`~.CBORBufferEncoder`
+    """
+    fp.write(dumps(obj, **kwargs))
+
+
+def dump_iter(items, bufsize=256, **kwargs):
+    """
+    Serialize an array item by item, without holding all the items or their
+    encoding in memory.
+    :param items: an iterable of the items; the array has indefinite length
+        unless it has a length, which it must have in canonical mode
+    :param int bufsize: the size of the chunks to produce
+    :param kwargs: keyword arguments passed to :class:`~.CBORBufferEncoder`
+    :return: an iterator over chunks of the serialized output, each about
+        ``bufsize`` bytes
     """
-    CBOREncoder(fp, **kwargs).encode(obj)
+    encoder = CBORBufferEncoder(**kwargs)
+    encoder._begin()
+    try:
+        _head(encoder, 0x80, len(items))
+        end = b""
+    except TypeError:
+        if encoder.canonical:
+            raise CBOREncodeError("indefinite length array in canonical mode")
+        encoder.write(b"\x9f")
+        end = b"\xff"
+    for item in items:
+        encoder._encode(item)
+        if encoder.pos >= bufsize:
+            yield encoder.getvalue()
+            encoder.pos = 0
+    encoder.write(end)
+    if encoder.pos:
+        yield encoder.getvalue()
@@ -0,0 +1,258 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2023 Arduino SA
+Copyright (c) 2018 KPN (Jan Bogaerts)
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import struct
+
+from ._decoder import CBORDecodeError, CBORSimpleValue, half_to_float, string_ref_min_length
+
+# Frame layout on the decoder stack: major type of the open item, number of
+# items left (None if indefinite), the container being built (or for a
+# semantic tag, the tag number), and for maps whether the next item is a key.
+_MAJOR = 0
+_LEFT = 1
+_CONTAINER = 2
+_IS_KEY = 3
+
+_ARG_FORMATS = (">B", ">H", ">L", ">Q")
+
+
+class CBORStreamDecoder(object):
+    """
+    Incrementally decodes a stream of concatenated CBOR items, from data
+    passed to :meth:`feed` in arbitrary pieces as it arrives.
+
+    Nested items are tracked on an explicit stack rather than by recursion.
+    In event mode, containers aren't built at all: instead (event, value)
+    pairs are produced, so arrays and maps of any size can be processed
+    with constant memory.
+
+    The semantic tags supported are bignums (tags 2 and 3) and stringref
+    namespaces and references (tags 256 and 25), as written by
+    :class:`CBORBufferEncoder`; others raise :class:`CBORDecodeError`.
+    """
+
+    # Events produced in event mode, paired with a value.
+    START_ARRAY = 0  # value is the length, or None if indefinite
+    START_MAP = 1  # value is the number of pairs, or None if indefinite
+    KEY = 2  # value is a map key
+    VALUE = 3  # value is an array item, map value or top-level item
+    END = 4  # value is None
+
+    def __init__(self, events=False):
+        self._buf = bytearray()
+        self._pos = 0
+        self._stack = []
+        self._events = events
+        # Strings in each open stringref namespace, innermost last.
+        self._refs = []
+
+    def feed(self, data):
+        """
+        Add data to the stream. The data is buffered immediately, so the
+        result may be ignored to just collect data and decode it later.
+        :param data: the next bytes of the stream
+        :return: an iterator over the top-level items (or, in event mode, the
+            (event, value) pairs) completed by the data fed so far and not yet
+            produced; it's no longer valid once :meth:`feed` is called again
+        """
+        # Drop data consumed by the previous iterator, keeping any incomplete
+        # item.
+        del self._buf[: self._pos]
+        self._pos = 0
+        self._buf.extend(data)
+        return self._parse()
+
+    def _parse(self):
+        buf = self._buf
+        stack = self._stack
+        events = self._events
+        while self._pos < len(buf):
+            pos = self._pos
+            initial_byte = buf[pos]
+            major_type = initial_byte >> 5
+            subtype = initial_byte & 31
+            pos += 1
+            if subtype < 24:
+                arg = subtype
+            elif subtype < 28:
+                n = 1 << (subtype - 24)
+                if pos + n > len(buf):
+                    return
+                arg = struct.unpack_from(_ARG_FORMATS[subtype - 24], buf, pos)[0]
+                pos += n
+            elif subtype == 31 and major_type in (2, 3, 4, 5, 7):
+                arg = None
+            else:
+                raise CBORDecodeError("unknown subtype 0x%x" % subtype)
+
+            if major_type == 0:
+                value = arg
+            elif major_type == 1:
+                value = -arg - 1
+            elif major_type < 4:
+                if arg is None:
+                    self._pos = pos
+                    stack.append([major_type, None, bytearray(), False])
+                    continue
+                if pos + arg > len(buf):
+                    return
+                value = bytes(buf[pos : pos + arg])
+                pos += arg
+                if stack and stack[-1][_MAJOR] < 4:
+                    # Chunk of an indefinite length string.
+                    if stack[-1][_MAJOR] != major_type:
+                        raise CBORDecodeError("invalid indefinite length string chunk")
+                    self._pos = pos
+                    stack[-1][_CONTAINER].extend(value)
+                    continue
+                if major_type == 3:
+                    value = value.decode("utf-8")
+                refs = self._refs
+                if refs and arg >= string_ref_min_length(len(refs[-1])):
+                    refs[-1].append(value)
+            elif major_type < 6:
+                self._pos = pos
+                if events:
+                    yield (self.START_ARRAY if major_type == 4 else self.START_MAP, arg)
+                if arg is None or arg:
+                    if arg and major_type == 5:
+                        arg *= 2
+                    container = None if events else [] if major_type == 4 else {}
+                    stack.append([major_type, arg, container, True])
+                    continue
+                if events:
+                    yield (self.END, None)
+                value = None if events else [] if major_type == 4 else {}
+            elif major_type == 6:
+                if arg not in (2, 3, 25, 256):
+                    raise CBORDecodeError("unsupported semantic tag %d" % arg)
+                self._pos = pos
+                if arg == 256:
+                    self._refs.append([])
+                stack.append([major_type, 1, arg, False])
+                continue
+            elif subtype == 31:
+                # Break, ends the innermost indefinite length item.
+                if not stack or stack[-1][_LEFT] is not None:
+                    raise CBORDecodeError("unexpected break")
+                frame = stack.pop()
+                major_type = frame[_MAJOR]
+                value = frame[_CONTAINER]
+                if frame[_MAJOR] == 2:
+                    value = bytes(value)
+                elif frame[_MAJOR] == 3:
+                    value = value.decode("utf-8")
+                elif frame[_MAJOR] == 5 and not frame[_IS_KEY]:
+                    raise CBORDecodeError("map is missing a value")
+                elif events:
+                    yield (self.END, None)
+                    value = None
+            elif subtype < 20:
+                value = CBORSimpleValue(subtype)
+            elif subtype < 24:
+                value = (False, True, None, None)[subtype - 20]
+            elif subtype == 24:
+                value = CBORSimpleValue(arg)
+            elif subtype == 25:
+                value = half_to_float(arg)
+            else:
+                value = struct.unpack_from(">f" if subtype == 26 else ">d", buf, pos - n)[0]
+            self._pos = pos
+
+            # Add the completed value to the open containers, completing
+            # those that are then full.
+            while True:
+                if not stack:
+                    if events:
+                        if major_type < 4 or major_type > 5:
+                            yield (self.VALUE, value)
+                    else:
+                        yield value
+                    break
+                frame = stack[-1]
+                if frame[_MAJOR] == 6:
+                    # The tagged item is complete. In event mode, a tagged
+                    # container has been produced already.
+                    stack.pop()
+                    value = self._tag(frame[_CONTAINER], value)
+                    continue
+                container = frame[_CONTAINER]
+                if frame[_MAJOR] < 4:
+                    raise CBORDecodeError("invalid indefinite length string chunk")
+                if events:
+                    if major_type < 4 or major_type > 5:
+                        is_key = frame[_MAJOR] == 5 and frame[_IS_KEY]
+                        yield (self.KEY if is_key else self.VALUE, value)
+                elif frame[_MAJOR] == 4:
+                    container.append(value)
+                elif frame[_IS_KEY]:
+                    frame.append(value)
+                else:
+                    container[frame.pop()] = value
+                frame[_IS_KEY] = not frame[_IS_KEY]
+                if frame[_LEFT] is not None:
+                    frame[_LEFT] -= 1
+                    if not frame[_LEFT]:
+                        stack.pop()
+                        if events:
+                            yield (self.END, None)
+                        value = container
+                        major_type = frame[_MAJOR]
+                        continue
+                break
+
+    def _tag(self, tag, value):
+        refs = self._refs
+        if tag == 256:
+            refs.pop()
+            return value
+        if tag == 25:
+            if not refs:
+                raise CBORDecodeError("string reference outside of a namespace")
+            if type(value) is not int or value < 0 or value >= len(refs[-1]):
+                raise CBORDecodeError("invalid string reference")
+            return refs[-1][value]
+        if not isinstance(value, bytes):
+            raise CBORDecodeError("invalid bignum")
+        value = int.from_bytes(value, "big")
+        return value if tag == 2 else -value - 1
+
+
+def load_iter(fp, chunk_size=256, events=False):
+    """
+    Decode a stream of concatenated CBOR items from a file-like object,
+    reading it in chunks.
+    :param fp: the input file, socket or other stream with a ``read`` method
+    :param int chunk_size: the number of bytes to read at a time
+    :param bool events: produce (event, value) pairs, see
+        :class:`CBORStreamDecoder`
+    :return: an iterator over the decoded top-level items
+    """
+    decoder = CBORStreamDecoder(events)
+    while True:
+        data = fp.read(chunk_size)
+        if not data:
+            break
+        yield from decoder.feed(data)
@@ -35,3 +35,9 @@ print(data)
 print(data.hex())
 text = cbor2.loads(data)
 print(text)
+
+# Decode the same data as it arrives a few bytes at a time.
+decoder = cbor2.CBORStreamDecoder()
+for i in range(0, len(data), 8):
+    for item in decoder.feed(data[i : i + 8]):
+        print(item)
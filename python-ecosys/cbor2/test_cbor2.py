@@ -0,0 +1,159 @@
+import io
+import cbor2
+
+# Data is buffered even if the result of feed() isn't consumed.
+decoder = cbor2.CBORStreamDecoder()
+decoder.feed(b"\x01")
+decoder.feed(b"\x82")
+assert list(decoder.feed(b"\x02\x03")) == [1, [2, 3]]
+items = decoder.feed(b"\x04\x05")
+assert next(items) == 4
+assert list(decoder.feed(b"\x06")) == [5, 6]
+
+# Decoding from a buffer, and into existing containers.
+values = [
+    0,
+    23,
+    24,
+    65535,
+    2**32,
+    2**64 - 1,
+    -1,
+    -(2**64),
+    2**70,
+    -(2**70),
+    b"",
+    b"\x00\xff",
+    "",
+    "ü" * 30,
+    [1, [2, 3], {"a": b"b"}],
+    {"x": 1.5, 2: None, "y": [True, False]},
+    -0.25,
+]
+for value in values:
+    assert cbor2.loads(cbor2.dumps(value)) == value, value
+for data, value in (
+    ("f93e00", 1.5),
+    ("5f41014102ff", b"\x01\x02"),
+    ("7f61616162ff", "ab"),
+    ("9f01bf616102ffff", [1, {"a": 2}]),
+):
+    assert cbor2.loads(bytes.fromhex(data)) == value, data
+
+data = cbor2.dumps([1, 2]) + cbor2.dumps("next")
+decoder = cbor2.CBORBufferDecoder(data)
+assert decoder.decode() == [1, 2]
+assert decoder.decode() == "next"
+assert decoder.pos == len(data)
+assert cbor2.CBORBufferDecoder(data, 3).decode() == "next"
+
+value = cbor2.loads(cbor2.dumps([b"abc"]), zero_copy=True)[0]
+assert isinstance(value, memoryview) and bytes(value) == b"abc"
+
+key_table = {}
+records = cbor2.loads(cbor2.dumps([{"name": 1}, {"name": 2}]), key_table=key_table)
+((key0, _),), ((key1, _),) = (r.items() for r in records)
+assert key0 == key1 == "name"
+assert key0 is key1 is key_table["name"]
+
+# Containers are reused, including nested ones, and stale items removed.
+obj = {"a": [1, 2, 3], "b": {"c": 1}, "stale": 0}
+inner_list = obj["a"]
+inner_dict = obj["b"]
+result = cbor2.loads_into(cbor2.dumps({"a": [4], "b": {"d": 2}}), obj)
+assert result is obj and result == {"a": [4], "b": {"d": 2}}, result
+assert obj["a"] is inner_list and obj["b"] is inner_dict
+items = [[0], 0]
+result = cbor2.loads_into(cbor2.dumps([[1, 2], 3, 4]), items)
+assert result is items and result == [[1, 2], 3, 4], result
+assert cbor2.loads_into(bytes.fromhex("9f0102ff"), items) == [1, 2]
+assert cbor2.loads_into(cbor2.dumps(5), []) == 5
+
+for data in ("", "18", "19ff", "43ab", "62c3", "82", "a1", "1c", "ff00", "8201ff", "d90100"):
+    try:
+        cbor2.loads(bytes.fromhex(data))
+    except cbor2._decoder.CBORDecodeError:
+        pass
+    else:
+        raise AssertionError("decoded invalid data " + data)
+try:
+    cbor2.loads_into(bytes.fromhex("8201"), [])
+except cbor2._decoder.CBORDecodeError:
+    pass
+else:
+    raise AssertionError("decoded truncated array")
+
+# Floats are double precision unless shortest_float is set, when they're
+# half or single precision if that loses no precision.
+for value, double, shortest in (
+    (1.5, "fb3ff8000000000000", "f93e00"),
+    (-0.0, "fb8000000000000000", "f98000"),
+    (65504.0, "fb40effc0000000000", "f97bff"),
+    (5.960464477539063e-08, "fb3e70000000000000", "f90001"),
+    (100000.0, "fb40f86a0000000000", "fa47c35000"),
+    (0.1, "fb3fb999999999999a", "fb3fb999999999999a"),
+    (1e300, "fb7e37e43c8800759c", "fb7e37e43c8800759c"),
+    (float("inf"), "f97c00", "f97c00"),
+    (float("-inf"), "f9fc00", "f9fc00"),
+):
+    assert cbor2.dumps(value).hex() == double, value
+    data = cbor2.dumps(value, shortest_float=True)
+    assert data.hex() == shortest, value
+    assert cbor2.loads(data) == value, value
+assert cbor2.dumps(float("nan"), shortest_float=True).hex() == "f97e00"
+
+# In canonical mode, map keys are sorted by their encoding, and floats are
+# always the shortest.
+value = {"aa": 4, "b": 1, 10: 3, "a": 2, -1: 5, 1.5: 6}
+data = cbor2.dumps(value, canonical=True)
+assert data.hex() == "a60a03200561610261620162616104f93e0006", data.hex()
+assert cbor2.loads(data) == value
+data = cbor2.dumps({"b": {"d": 1, "c": 2}, "a": 1}, canonical=True)
+assert data.hex() == "a26161016162a2616302616401", data.hex()
+
+# Stringref namespaces (tag 256) and references (tag 25), and bignums (tags
+# 2 and 3), with the buffer, file and stream decoders.
+
+
+def stream_decode(data, events=False):
+    decoder = cbor2.CBORStreamDecoder(events)
+    items = []
+    for i in range(len(data)):
+        items.extend(decoder.feed(data[i : i + 1]))
+    return items
+
+
+data = cbor2.dumps(["aaa", "aaa", b"bb", b"bb"], string_referencing=True)
+# Strings shorter than a reference to them aren't numbered.
+assert data.hex() == "d901008463616161d81900426262426262", data.hex()
+# The example from the stringref specification, with a nested namespace.
+spec = bytes.fromhex("d901008363616161d81900d90100836362626263616161d81901")
+records = [
+    {"bn": "urn:dev:ow:10e2073a01080063", "u": "Cel", "t": 1276020076, "v": 23.5},
+    {"u": "Cel", "t": 1276020091, "v": 23.6},
+    {"u": "Cel", "t": 1276020106, "v": 2**64 + 1, "vb": -(2**70)},
+]
+for data, value in (
+    (spec, ["aaa", "aaa", ["bbb", "aaa", "aaa"]]),
+    (cbor2.dumps(records, string_referencing=True), records),
+    (cbor2.dumps(records, canonical=True, string_referencing=True), records),
+):
+    assert cbor2.loads(data) == value, data.hex()
+    assert cbor2.loads_into(data, []) == value, data.hex()
+    assert cbor2.load(io.BytesIO(data)) == value, data.hex()
+    assert stream_decode(data) == [value], data.hex()
+value = ["temperature"] * 10
+assert len(cbor2.dumps(value, string_referencing=True)) < len(cbor2.dumps(value)) // 2
+data = cbor2.dumps(records, string_referencing=True)
+events = stream_decode(data, True)
+assert [v for e, v in events if e == cbor2.CBORStreamDecoder.KEY].count("u") == 3
+assert (cbor2.CBORStreamDecoder.VALUE, -(2**70)) in events
+
+for data in ("d81900", "d901008263616161d81901", "d9010081d8196161", "c2f5", "c401"):
+    for decode in (cbor2.loads, stream_decode, lambda data: cbor2.load(io.BytesIO(data))):
+        try:
+            decode(bytes.fromhex(data))
+        except cbor2._decoder.CBORDecodeError:
+            pass
+        else:
+            raise AssertionError("decoded invalid data " + data)
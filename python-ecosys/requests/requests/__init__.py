@@ -1,16 +1,101 @@
+import io
 import socket
 
 
+class _BodyReader(io.IOBase):
+    # Base for readers that know where the body ends, so the stream f can be
+    # reused for the next request once _eof is set. Subclassing io.IOBase
+    # makes them streams that C code such as deflate.DeflateIO can read.
+    def close(self):
+        self._f.close()
+
+    def read(self, sz=-1):
+        buf = bytearray(sz if sz >= 0 else 512)
+        mv = memoryview(buf)
+        n = 0
+        while True:
+            if n == len(buf):
+                if sz >= 0:
+                    break
+                buf.extend(bytearray(len(buf)))
+                mv = memoryview(buf)
+            m = self.readinto(mv[n:])
+            if not m:
+                break
+            n += m
+        return bytes(mv[:n])
+
+
+class _LengthReader(_BodyReader):
+    # Reads a body of "Content-Length: length" bytes from the stream f.
+    def __init__(self, f, length):
+        self._f = f
+        self._left = length
+        self._eof = not length
+
+    def readinto(self, buf):
+        if self._eof:
+            return 0
+        if len(buf) > self._left:
+            buf = memoryview(buf)[: self._left]
+        n = self._f.readinto(buf)
+        if not n:
+            raise ValueError("HTTP error: truncated body")
+        self._left -= n
+        self._eof = not self._left
+        return n
+
+
+class _ChunkedReader(_BodyReader):
+    # Decodes a "Transfer-Encoding: chunked" body read from the stream f.
+    def __init__(self, f):
+        self._f = f
+        self._left = 0  # bytes left in the current chunk
+        self._eof = False
+
+    def readinto(self, buf):
+        if self._left == 0:
+            if self._eof:
+                return 0
+            self._left = int(self._f.readline().split(b";", 1)[0], 16)
+            if self._left == 0:
+                # Last chunk, skip any trailers up to the terminating blank line.
+                self._eof = True
+                while self._f.readline() not in (b"\r\n", b""):
+                    pass
+                return 0
+        if len(buf) > self._left:
+            buf = memoryview(buf)[: self._left]
+        n = self._f.readinto(buf)
+        if not n:
+            raise ValueError("HTTP error: truncated chunk")
+        self._left -= n
+        if self._left == 0:
+            # CRLF following the chunk data.
+            self._f.readline()
+        return n
+
+
 class Response:
     def __init__(self, f):
         self.raw = f
         self.encoding = "utf-8"
         self._cached = None
+        self._session = None  # Session to return the socket to, if keep-alive
+        self._key = None
+        self._conn = None
 
-    def close(self):
+    def _release(self):
         if self.raw:
-            self.raw.close()
+            if self._session and getattr(self.raw, "_eof", False):
+                # Body fully read, the connection can serve another request.
+                self._session._release(self._key, self._conn)
+            else:
+                self.raw.close()
             self.raw = None
+
+    def close(self):
+        self._release()
         self._cached = None
 
     @property
@@ -19,10 +104,40 @@ class Response:
             try:
                 self._cached = self.raw.read()
             finally:
-                self.raw.close()
-                self.raw = None
+                self._release()
         return self._cached
 
+    def readinto(self, buf):
+        # Reads the next part of the body into buf, returning 0 at the end.
+        return self.raw.readinto(buf)
+
+    def iter_content(self, chunk_size=1):
+        # Yields the body in pieces of chunk_size bytes (the last may be shorter).
+        if self._cached is not None:
+            for i in range(0, len(self._cached), chunk_size):
+                yield self._cached[i : i + chunk_size]
+            return
+        try:
+            while True:
+                chunk = self.raw.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            self._release()
+
+    def iter_lines(self, chunk_size=512, delimiter=None):
+        pending = b""
+        for chunk in self.iter_content(chunk_size):
+            lines = (pending + chunk).split(delimiter or b"\n")
+            pending = lines.pop()
+            for line in lines:
+                if not delimiter and line.endswith(b"\r"):
+                    line = line[:-1]
+                yield line
+        if pending:
+            yield pending
+
     @property
     def text(self):
         return str(self.content, self.encoding)
@@ -33,6 +148,41 @@ class Response:
         return json.loads(self.content)
 
 
+def _connect(proto, host, port, timeout, session):
+    key = (host, port)
+    ai = session._addrs.get(key) if session else None
+    if ai is None:
+        ai = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        ai = ai[0]
+        if session:
+            session._addrs[key] = ai
+
+    s = raw = socket.socket(ai[0], socket.SOCK_STREAM, ai[2])
+
+    if timeout is not None:
+        # Note: settimeout is not supported on all platforms, will raise
+        # an AttributeError if not available.
+        s.settimeout(timeout)
+
+    try:
+        s.connect(ai[-1])
+        if proto == "https:":
+            import tls
+
+            context = session and session._context
+            if not context:
+                context = tls.SSLContext(tls.PROTOCOL_TLS_CLIENT)
+                context.verify_mode = tls.CERT_NONE
+                if session:
+                    session._context = context
+            s = context.wrap_socket(s, server_hostname=host)
+    except OSError:
+        s.close()
+        raise
+    # Also return the plain socket, its timeout can be changed when reused.
+    return s, raw
+
+
 def request(
     method,
     url,
@@ -43,6 +193,7 @@ def request(
     auth=None,
     timeout=None,
     parse_headers=True,
+    session=None,
 ):
     if headers is None:
         headers = {}
@@ -50,6 +201,8 @@ def request(
         headers = headers.copy()
 
     redirect = None  # redirection url, None means no redirection
+    chunked = False
+    length = None  # Content-Length of the response, if given
     chunked_data = data and getattr(data, "__next__", None) and not getattr(data, "__len__", None)
 
     if auth is not None:
@@ -68,8 +221,6 @@ def request(
     if proto == "http:":
         port = 80
     elif proto == "https:":
-        import tls
-
         port = 443
     else:
         raise ValueError("Unsupported protocol: " + proto)
@@ -78,74 +229,89 @@ def request(
         host, port = host.split(":", 1)
         port = int(port)
 
-    ai = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
-    ai = ai[0]
-
     resp_d = None
     if parse_headers is not False:
         resp_d = {}
 
-    s = socket.socket(ai[0], socket.SOCK_STREAM, ai[2])
+    if "Host" not in headers:
+        headers["Host"] = host
 
-    if timeout is not None:
-        # Note: settimeout is not supported on all platforms, will raise
-        # an AttributeError if not available.
-        s.settimeout(timeout)
+    if json is not None:
+        assert data is None
+        from json import dumps
 
-    try:
-        s.connect(ai[-1])
-        if proto == "https:":
-            context = tls.SSLContext(tls.PROTOCOL_TLS_CLIENT)
-            context.verify_mode = tls.CERT_NONE
-            s = context.wrap_socket(s, server_hostname=host)
-        s.write(b"%s /%s HTTP/1.0\r\n" % (method, path))
+        data = dumps(json)
 
-        if "Host" not in headers:
-            headers["Host"] = host
+        if "Content-Type" not in headers:
+            headers["Content-Type"] = "application/json"
 
-        if json is not None:
-            assert data is None
-            from json import dumps
+    if data:
+        if chunked_data:
+            if "Transfer-Encoding" not in headers and "Content-Length" not in headers:
+                headers["Transfer-Encoding"] = "chunked"
+        elif "Content-Length" not in headers:
+            headers["Content-Length"] = str(len(data))
 
-            data = dumps(json)
+    if session:
+        # HTTP/1.1 connections are persistent by default.
+        version = b"1.1"
+    else:
+        version = b"1.0"
+        if "Connection" not in headers:
+            headers["Connection"] = "close"
 
-            if "Content-Type" not in headers:
-                headers["Content-Type"] = "application/json"
+    key = (proto, host, port)
+    while True:
+        # Reuse an idle keep-alive connection if the session has one.
+        conn = session and session._conns.pop(key, None)
+        reused = bool(conn)
+        if reused:
+            s, raw, conn_timeout = conn
+            if timeout != conn_timeout:
+                # Replace the timeout set by the previous request.
+                raw.settimeout(timeout)
+        else:
+            s, raw = _connect(proto, host, port, timeout, session)
 
-        if data:
-            if chunked_data:
-                if "Transfer-Encoding" not in headers and "Content-Length" not in headers:
-                    headers["Transfer-Encoding"] = "chunked"
-            elif "Content-Length" not in headers:
-                headers["Content-Length"] = str(len(data))
+        try:
+            s.write(b"%s /%s HTTP/%s\r\n" % (method, path, version))
 
-        if "Connection" not in headers:
-            headers["Connection"] = "close"
+            # Iterate over keys to avoid tuple alloc
+            for k in headers:
+                s.write(k)
+                s.write(b": ")
+                s.write(headers[k])
+                s.write(b"\r\n")
 
-        # Iterate over keys to avoid tuple alloc
-        for k in headers:
-            s.write(k)
-            s.write(b": ")
-            s.write(headers[k])
             s.write(b"\r\n")
 
-        s.write(b"\r\n")
-
-        if data:
-            if chunked_data:
-                if headers.get("Transfer-Encoding", None) == "chunked":
-                    for chunk in data:
-                        s.write(b"%x\r\n" % len(chunk))
-                        s.write(chunk)
-                        s.write(b"\r\n")
-                    s.write("0\r\n\r\n")
+            if data:
+                if chunked_data:
+                    if headers.get("Transfer-Encoding", None) == "chunked":
+                        for chunk in data:
+                            s.write(b"%x\r\n" % len(chunk))
+                            s.write(chunk)
+                            s.write(b"\r\n")
+                        s.write("0\r\n\r\n")
+                    else:
+                        for chunk in data:
+                            s.write(chunk)
                 else:
-                    for chunk in data:
-                        s.write(chunk)
-            else:
-                s.write(data)
+                    s.write(data)
+
+            l = s.readline()
+            if not l and reused:
+                # The server closed the idle connection.
+                raise OSError(104)  # ECONNRESET
+        except OSError:
+            s.close()
+            if reused and not chunked_data:
+                # Retry once on a fresh connection.
+                continue
+            raise
+        break
 
-        l = s.readline()
+    try:
         # print(l)
         l = l.split(None, 2)
         if len(l) < 2:
@@ -155,19 +321,25 @@ def request(
         reason = ""
         if len(l) > 2:
             reason = l[2].rstrip()
+        keepalive = session and l[0] == b"HTTP/1.1"
         while True:
             l = s.readline()
             if not l or l == b"\r\n":
                 break
             # print(l)
-            if l.startswith(b"Transfer-Encoding:"):
-                if b"chunked" in l:
-                    raise ValueError("Unsupported " + str(l, "utf-8"))
+            name = l[:18].lower()
+            if name == b"transfer-encoding:":
+                chunked = b"chunked" in l.lower()
             elif l.startswith(b"Location:") and not 200 <= status <= 299:
                 if status in [301, 302, 303, 307, 308]:
                     redirect = str(l[10:-2], "utf-8")
                 else:
                     raise NotImplementedError("Redirect %d not yet supported" % status)
+            elif session:
+                if name.startswith(b"content-length:"):
+                    length = int(l[15:])
+                elif name.startswith(b"connection:"):
+                    keepalive = b"keep-alive" in l.lower()
             if parse_headers is False:
                 pass
             elif parse_headers is True:
@@ -185,11 +357,25 @@ def request(
         # Use the host specified in the redirect URL, as it may not be the same as the original URL.
         headers.pop("Host", None)
         if status in [301, 302, 303]:
-            return request("GET", redirect, None, None, headers, stream)
-        else:
-            return request(method, redirect, data, json, headers, stream)
+            data = json = None
+            method = "GET"
+        return request(
+            method, redirect, data, json, headers, stream, auth, timeout, parse_headers, session
+        )
     else:
+        if method == "HEAD" or status in (204, 304):
+            chunked = False
+            length = 0
+        conn = (s, raw, timeout)
+        if chunked:
+            s = _ChunkedReader(s)
+        elif session and length is not None:
+            s = _LengthReader(s, length)
         resp = Response(s)
+        if keepalive:
+            resp._session = session
+            resp._key = key
+            resp._conn = conn
         resp.status_code = status
         resp.reason = reason
         if resp_d is not None:
@@ -197,6 +383,61 @@ def request(
         return resp
 
 
+class Session:
+    # Keeps HTTP/1.1 connections open between requests to the same host, and
+    # caches address lookups and the TLS context. Responses must be read to
+    # the end or closed before their connection can be reused.
+    def __init__(self):
+        self.headers = {}
+        self.auth = None
+        self._addrs = {}  # (host, port) -> getaddrinfo() entry
+        self._conns = {}  # (proto, host, port) -> idle (socket, plain socket, timeout)
+        self._context = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        for conn in self._conns.values():
+            conn[0].close()
+        self._conns.clear()
+
+    def _release(self, key, conn):
+        old = self._conns.pop(key, None)
+        if old:
+            old[0].close()
+        self._conns[key] = conn
+
+    def request(self, method, url, headers=None, auth=None, **kw):
+        if self.headers:
+            h = self.headers.copy()
+            if headers:
+                h.update(headers)
+            headers = h
+        return request(method, url, headers=headers, auth=auth or self.auth, session=self, **kw)
+
+    def head(self, url, **kw):
+        return self.request("HEAD", url, **kw)
+
+    def get(self, url, **kw):
+        return self.request("GET", url, **kw)
+
+    def post(self, url, **kw):
+        return self.request("POST", url, **kw)
+
+    def put(self, url, **kw):
+        return self.request("PUT", url, **kw)
+
+    def patch(self, url, **kw):
+        return self.request("PATCH", url, **kw)
+
+    def delete(self, url, **kw):
+        return self.request("DELETE", url, **kw)
+
+
 def head(url, **kw):
     return request("HEAD", url, **kw)
 
@@ -2,20 +2,36 @@ import io
 import sys
 
 
+response_data = b"HTTP/1.0 200 OK\r\n\r\n"
+
+
 class Socket:
     def __init__(self):
         self._write_buffer = io.BytesIO()
-        self._read_buffer = io.BytesIO(b"HTTP/1.0 200 OK\r\n\r\n")
+        self.timeouts = []
+        self._read_buffer = io.BytesIO(response_data)
 
     def connect(self, address):
         pass
 
+    def settimeout(self, timeout):
+        self.timeouts.append(timeout)
+
+    def close(self):
+        pass
+
     def write(self, buf):
         self._write_buffer.write(buf)
 
     def readline(self):
         return self._read_buffer.readline()
 
+    def read(self, size=-1):
+        return self._read_buffer.read(size)
+
+    def readinto(self, buf):
+        return self._read_buffer.readinto(buf)
+
 
 class socket:
     AF_INET = 2
@@ -153,6 +169,109 @@ def test_do_not_modify_headers_argument():
     assert do_not_modify_this_dict == {}, do_not_modify_this_dict
 
 
+def test_chunked_response():
+    global response_data
+    response_data = (
+        b"HTTP/1.1 200 OK\r\n"
+        + b"Transfer-Encoding: chunked\r\n\r\n"
+        + b"5\r\nhello\r\n"
+        + b"7;ext=1\r\n world\n\r\n"
+        + b"4\r\nline\r\n"
+        + b"0\r\n\r\n"
+    )
+    try:
+        response = requests.request("GET", "http://example.com")
+        assert response.content == b"hello world\nline", response.content
+
+        response = requests.request("GET", "http://example.com")
+        chunks = list(response.iter_content(4))
+        assert chunks == [b"hell", b"o wo", b"rld\n", b"line"], chunks
+
+        response = requests.request("GET", "http://example.com")
+        lines = list(response.iter_lines())
+        assert lines == [b"hello world", b"line"], lines
+
+        response = requests.request("GET", "http://example.com")
+        buf = bytearray(3)
+        body = b""
+        while True:
+            n = response.readinto(buf)
+            if not n:
+                break
+            body += buf[:n]
+        assert body == b"hello world\nline", body
+
+        response_data = response_data.replace(b"Transfer-Encoding", b"transfer-encoding")
+        response = requests.request("GET", "http://example.com")
+        assert response.content == b"hello world\nline", response.content
+    finally:
+        response_data = b"HTTP/1.0 200 OK\r\n\r\n"
+
+
+def test_session_keepalive():
+    global response_data
+    response_data = (
+        b"HTTP/1.1 200 OK\r\n"
+        + b"Content-Length: 5\r\n\r\n"
+        + b"first"
+        + b"HTTP/1.1 200 OK\r\n"
+        + b"Content-Length: 6\r\n\r\n"
+        + b"second"
+        + b"HTTP/1.1 200 OK\r\n"
+        + b"Content-Length: 5\r\n\r\n"
+        + b"third"
+    )
+    try:
+        session = requests.Session()
+        session.headers["User-Agent"] = "test-agent"
+        response = session.get("http://example.com/a")
+        sock = response.raw._f
+        assert response.content == b"first", response.content
+        response = session.get("http://example.com/b", timeout=5)
+        assert response.raw._f is sock
+        assert response.content == b"second", response.content
+        response = session.get("http://example.com/c")
+        assert response.raw._f is sock
+        assert response.content == b"third", response.content
+        # The timeout is only changed when it differs from the previous one.
+        assert sock.timeouts == [5, None], sock.timeouts
+
+        assert sock._write_buffer.getvalue() == (
+            b"GET /a HTTP/1.1\r\n"
+            + b"User-Agent: test-agent\r\n"
+            + b"Host: example.com\r\n\r\n"
+            + b"GET /b HTTP/1.1\r\n"
+            + b"User-Agent: test-agent\r\n"
+            + b"Host: example.com\r\n\r\n"
+            + b"GET /c HTTP/1.1\r\n"
+            + b"User-Agent: test-agent\r\n"
+            + b"Host: example.com\r\n\r\n"
+        ), sock._write_buffer.getvalue()
+        session.close()
+    finally:
+        response_data = b"HTTP/1.0 200 OK\r\n\r\n"
+
+
+def test_redirect_keeps_arguments():
+    global response_data
+    response_data = b"HTTP/1.0 302 Found\r\nLocation: http://example.com/b\r\n\r\n"
+    lines = []
+
+    def parse_headers(l, d):
+        global response_data
+        lines.append(l)
+        response_data = b"HTTP/1.0 200 OK\r\nX-Test: 1\r\n\r\n"
+
+    try:
+        response = requests.request(
+            "GET", "http://example.com/a", timeout=5, parse_headers=parse_headers
+        )
+        assert response.raw.timeouts == [5], response.raw.timeouts
+        assert lines == [b"Location: http://example.com/b\r\n", b"X-Test: 1\r\n"], lines
+    finally:
+        response_data = b"HTTP/1.0 200 OK\r\n\r\n"
+
+
 test_simple_get()
 test_get_auth()
 test_get_custom_header()
@@ -162,3 +281,6 @@ test_overwrite_get_headers()
 test_overwrite_post_json_headers()
 test_overwrite_post_chunked_data_headers()
 test_do_not_modify_headers_argument()
+test_chunked_response()
+test_session_keepalive()
+test_redirect_keeps_arguments()
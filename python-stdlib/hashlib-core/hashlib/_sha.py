@@ -5,26 +5,75 @@
 # Base class for SHA implementations, which must provide:
 #   .digestsize & .digest_size
 #   .block_size
+#   ._rounds
 #   ._iv
-#   ._update
-#   ._final
+#   ._transform(buf, offset, n), to hash the n blocks of buf from offset
+#
+# Input is hashed straight from the caller's buffer a whole number of blocks
+# at a time, and only the remainder (less than a block) is copied to ._data.
 class sha:
     def __init__(self, s=None):
         self._digest = self._iv[:]
-        self._count_lo = 0
-        self._count_hi = 0
+        self._count = 0
         self._data = bytearray(self.block_size)
         self._local = 0
         self._digestsize = self.digest_size
+        # Message schedule, reused for every block.
+        self._w = [0] * self._rounds
         if s:
             self.update(s)
 
     def update(self, s):
         if isinstance(s, str):
             s = s.encode("ascii")
-        else:
+        elif not isinstance(s, (bytes, bytearray, memoryview)):
             s = bytes(s)
-        self._update(s)
+        s = memoryview(s)
+        count = len(s)
+        self._count += count
+        block_size = self.block_size
+        i = 0
+
+        # Fill up a partial block from previous updates.
+        local = self._local
+        if local:
+            i = min(block_size - local, count)
+            self._data[local : local + i] = s[:i]
+            local += i
+            if local < block_size:
+                self._local = local
+                return
+            self._transform(self._data, 0, 1)
+
+        n = (count - i) // block_size
+        if n:
+            self._transform(s, i, n)
+            i += n * block_size
+
+        self._local = count - i
+        self._data[: self._local] = s[i:]
+
+    def _final(self):
+        block_size = self.block_size
+        data = self._data
+        local = self._local
+        data[local] = 0x80
+        local += 1
+        # The message length in bits takes the last 1/8 of the block (only
+        # lengths up to 64 bits are supported).
+        if local > block_size - block_size // 8:
+            data[local:] = bytes(block_size - local)
+            self._transform(data, 0, 1)
+            local = 0
+        data[local : block_size - 8] = bytes(block_size - 8 - local)
+        data[block_size - 8 :] = ((self._count << 3) & 0xFFFFFFFFFFFFFFFF).to_bytes(8, "big")
+        self._transform(data, 0, 1)
+
+        word_size = block_size // 16
+        dig = bytearray()
+        for i in self._digest:
+            dig.extend(i.to_bytes(word_size, "big"))
+        return dig
 
     def digest(self):
         return self.copy()._final()[: self._digestsize]
@@ -35,8 +84,7 @@ class sha:
     def copy(self):
         new = type(self)()
         new._digest = self._digest[:]
-        new._count_lo = self._count_lo
-        new._count_hi = self._count_hi
+        new._count = self._count
         new._data = self._data[:]
         new._local = self._local
         return new
@@ -1,25 +1,83 @@
 # MIT license; Copyright (c) 2023 Jim Mussared
 # Originally ported from CPython by Paul Sokolovsky
 
+from struct import unpack_from
 from ._sha import sha
 
 _SHA_BLOCKSIZE = const(64)
 
-
-ROR = lambda x, y: (((x & 0xFFFFFFFF) >> (y & 31)) | (x << (32 - (y & 31)))) & 0xFFFFFFFF
-Ch = lambda x, y, z: (z ^ (x & (y ^ z)))
-Maj = lambda x, y, z: (((x | y) & z) | (x & y))
-S = lambda x, n: ROR(x, n)
-R = lambda x, n: (x & 0xFFFFFFFF) >> n
-Sigma0 = lambda x: (S(x, 2) ^ S(x, 13) ^ S(x, 22))
-Sigma1 = lambda x: (S(x, 6) ^ S(x, 11) ^ S(x, 25))
-Gamma0 = lambda x: (S(x, 7) ^ S(x, 18) ^ R(x, 3))
-Gamma1 = lambda x: (S(x, 17) ^ S(x, 19) ^ R(x, 10))
+_K = (
+    0x428A2F98,
+    0x71374491,
+    0xB5C0FBCF,
+    0xE9B5DBA5,
+    0x3956C25B,
+    0x59F111F1,
+    0x923F82A4,
+    0xAB1C5ED5,
+    0xD807AA98,
+    0x12835B01,
+    0x243185BE,
+    0x550C7DC3,
+    0x72BE5D74,
+    0x80DEB1FE,
+    0x9BDC06A7,
+    0xC19BF174,
+    0xE49B69C1,
+    0xEFBE4786,
+    0x0FC19DC6,
+    0x240CA1CC,
+    0x2DE92C6F,
+    0x4A7484AA,
+    0x5CB0A9DC,
+    0x76F988DA,
+    0x983E5152,
+    0xA831C66D,
+    0xB00327C8,
+    0xBF597FC7,
+    0xC6E00BF3,
+    0xD5A79147,
+    0x06CA6351,
+    0x14292967,
+    0x27B70A85,
+    0x2E1B2138,
+    0x4D2C6DFC,
+    0x53380D13,
+    0x650A7354,
+    0x766A0ABB,
+    0x81C2C92E,
+    0x92722C85,
+    0xA2BFE8A1,
+    0xA81A664B,
+    0xC24B8B70,
+    0xC76C51A3,
+    0xD192E819,
+    0xD6990624,
+    0xF40E3585,
+    0x106AA070,
+    0x19A4C116,
+    0x1E376C08,
+    0x2748774C,
+    0x34B0BCB5,
+    0x391C0CB3,
+    0x4ED8AA4A,
+    0x5B9CCA4F,
+    0x682E6FF3,
+    0x748F82EE,
+    0x78A5636F,
+    0x84C87814,
+    0x8CC70208,
+    0x90BEFFFA,
+    0xA4506CEB,
+    0xBEF9A3F7,
+    0xC67178F2,
+)
 
 
 class sha256(sha):
     digest_size = digestsize = 32
     block_size = _SHA_BLOCKSIZE
+    _rounds = 64
     _iv = [
         0x6A09E667,
         0xBB67AE85,
@@ -31,164 +89,55 @@ class sha256(sha):
         0x5BE0CD19,
     ]
 
-    def _transform(self):
-        W = []
-
-        d = self._data
-        for i in range(0, 16):
-            W.append((d[4 * i] << 24) + (d[4 * i + 1] << 16) + (d[4 * i + 2] << 8) + d[4 * i + 3])
-
-        for i in range(16, 64):
-            W.append((Gamma1(W[i - 2]) + W[i - 7] + Gamma0(W[i - 15]) + W[i - 16]) & 0xFFFFFFFF)
-
-        ss = self._digest[:]
-
-        def RND(a, b, c, d, e, f, g, h, i, ki):
-            t0 = h + Sigma1(e) + Ch(e, f, g) + ki + W[i]
-            t1 = Sigma0(a) + Maj(a, b, c)
-            d += t0
-            h = t0 + t1
-            return d & 0xFFFFFFFF, h & 0xFFFFFFFF
-
-        ss[3], ss[7] = RND(ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], 0, 0x428A2F98)
-        ss[2], ss[6] = RND(ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], 1, 0x71374491)
-        ss[1], ss[5] = RND(ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], 2, 0xB5C0FBCF)
-        ss[0], ss[4] = RND(ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], 3, 0xE9B5DBA5)
-        ss[7], ss[3] = RND(ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], 4, 0x3956C25B)
-        ss[6], ss[2] = RND(ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], 5, 0x59F111F1)
-        ss[5], ss[1] = RND(ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], 6, 0x923F82A4)
-        ss[4], ss[0] = RND(ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], 7, 0xAB1C5ED5)
-        ss[3], ss[7] = RND(ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], 8, 0xD807AA98)
-        ss[2], ss[6] = RND(ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], 9, 0x12835B01)
-        ss[1], ss[5] = RND(ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], 10, 0x243185BE)
-        ss[0], ss[4] = RND(ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], 11, 0x550C7DC3)
-        ss[7], ss[3] = RND(ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], 12, 0x72BE5D74)
-        ss[6], ss[2] = RND(ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], 13, 0x80DEB1FE)
-        ss[5], ss[1] = RND(ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], 14, 0x9BDC06A7)
-        ss[4], ss[0] = RND(ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], 15, 0xC19BF174)
-        ss[3], ss[7] = RND(ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], 16, 0xE49B69C1)
-        ss[2], ss[6] = RND(ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], 17, 0xEFBE4786)
-        ss[1], ss[5] = RND(ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], 18, 0x0FC19DC6)
-        ss[0], ss[4] = RND(ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], 19, 0x240CA1CC)
-        ss[7], ss[3] = RND(ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], 20, 0x2DE92C6F)
-        ss[6], ss[2] = RND(ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], 21, 0x4A7484AA)
-        ss[5], ss[1] = RND(ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], 22, 0x5CB0A9DC)
-        ss[4], ss[0] = RND(ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], 23, 0x76F988DA)
-        ss[3], ss[7] = RND(ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], 24, 0x983E5152)
-        ss[2], ss[6] = RND(ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], 25, 0xA831C66D)
-        ss[1], ss[5] = RND(ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], 26, 0xB00327C8)
-        ss[0], ss[4] = RND(ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], 27, 0xBF597FC7)
-        ss[7], ss[3] = RND(ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], 28, 0xC6E00BF3)
-        ss[6], ss[2] = RND(ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], 29, 0xD5A79147)
-        ss[5], ss[1] = RND(ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], 30, 0x06CA6351)
-        ss[4], ss[0] = RND(ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], 31, 0x14292967)
-        ss[3], ss[7] = RND(ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], 32, 0x27B70A85)
-        ss[2], ss[6] = RND(ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], 33, 0x2E1B2138)
-        ss[1], ss[5] = RND(ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], 34, 0x4D2C6DFC)
-        ss[0], ss[4] = RND(ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], 35, 0x53380D13)
-        ss[7], ss[3] = RND(ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], 36, 0x650A7354)
-        ss[6], ss[2] = RND(ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], 37, 0x766A0ABB)
-        ss[5], ss[1] = RND(ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], 38, 0x81C2C92E)
-        ss[4], ss[0] = RND(ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], 39, 0x92722C85)
-        ss[3], ss[7] = RND(ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], 40, 0xA2BFE8A1)
-        ss[2], ss[6] = RND(ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], 41, 0xA81A664B)
-        ss[1], ss[5] = RND(ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], 42, 0xC24B8B70)
-        ss[0], ss[4] = RND(ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], 43, 0xC76C51A3)
-        ss[7], ss[3] = RND(ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], 44, 0xD192E819)
-        ss[6], ss[2] = RND(ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], 45, 0xD6990624)
-        ss[5], ss[1] = RND(ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], 46, 0xF40E3585)
-        ss[4], ss[0] = RND(ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], 47, 0x106AA070)
-        ss[3], ss[7] = RND(ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], 48, 0x19A4C116)
-        ss[2], ss[6] = RND(ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], 49, 0x1E376C08)
-        ss[1], ss[5] = RND(ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], 50, 0x2748774C)
-        ss[0], ss[4] = RND(ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], 51, 0x34B0BCB5)
-        ss[7], ss[3] = RND(ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], 52, 0x391C0CB3)
-        ss[6], ss[2] = RND(ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], 53, 0x4ED8AA4A)
-        ss[5], ss[1] = RND(ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], 54, 0x5B9CCA4F)
-        ss[4], ss[0] = RND(ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], 55, 0x682E6FF3)
-        ss[3], ss[7] = RND(ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], 56, 0x748F82EE)
-        ss[2], ss[6] = RND(ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], 57, 0x78A5636F)
-        ss[1], ss[5] = RND(ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], ss[5], 58, 0x84C87814)
-        ss[0], ss[4] = RND(ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], ss[4], 59, 0x8CC70208)
-        ss[7], ss[3] = RND(ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], ss[3], 60, 0x90BEFFFA)
-        ss[6], ss[2] = RND(ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], ss[2], 61, 0xA4506CEB)
-        ss[5], ss[1] = RND(ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], ss[1], 62, 0xBEF9A3F7)
-        ss[4], ss[0] = RND(ss[1], ss[2], ss[3], ss[4], ss[5], ss[6], ss[7], ss[0], 63, 0xC67178F2)
-
-        for i in range(len(self._digest)):
-            self._digest[i] = (self._digest[i] + ss[i]) & 0xFFFFFFFF
-
-    def _update(self, buffer):
-        if isinstance(buffer, str):
-            raise TypeError("Unicode strings must be encoded before hashing")
-        count = len(buffer)
-        buffer_idx = 0
-        clo = (self._count_lo + (count << 3)) & 0xFFFFFFFF
-        if clo < self._count_lo:
-            self._count_hi += 1
-        self._count_lo = clo
-
-        self._count_hi += count >> 29
-
-        if self._local:
-            i = _SHA_BLOCKSIZE - self._local
-            if i > count:
-                i = count
-
-            # copy buffer
-            for x in enumerate(buffer[buffer_idx : buffer_idx + i]):
-                self._data[self._local + x[0]] = x[1]
-
-            count -= i
-            buffer_idx += i
-
-            self._local += i
-            if self._local == _SHA_BLOCKSIZE:
-                self._transform()
-                self._local = 0
-            else:
-                return
-
-        while count >= _SHA_BLOCKSIZE:
-            # copy buffer
-            self._data = bytearray(buffer[buffer_idx : buffer_idx + _SHA_BLOCKSIZE])
-            count -= _SHA_BLOCKSIZE
-            buffer_idx += _SHA_BLOCKSIZE
-            self._transform()
-
-        # copy buffer
-        pos = self._local
-        self._data[pos : pos + count] = buffer[buffer_idx : buffer_idx + count]
-        self._local = count
-
-    def _final(self):
-        lo_bit_count = self._count_lo
-        hi_bit_count = self._count_hi
-        count = (lo_bit_count >> 3) & 0x3F
-        self._data[count] = 0x80
-        count += 1
-        if count > _SHA_BLOCKSIZE - 8:
-            # zero the bytes in data after the count
-            self._data = self._data[:count] + bytes(_SHA_BLOCKSIZE - count)
-            self._transform()
-            # zero bytes in data
-            self._data = bytearray(_SHA_BLOCKSIZE)
-        else:
-            self._data = self._data[:count] + bytes(_SHA_BLOCKSIZE - count)
-
-        self._data[56] = (hi_bit_count >> 24) & 0xFF
-        self._data[57] = (hi_bit_count >> 16) & 0xFF
-        self._data[58] = (hi_bit_count >> 8) & 0xFF
-        self._data[59] = (hi_bit_count >> 0) & 0xFF
-        self._data[60] = (lo_bit_count >> 24) & 0xFF
-        self._data[61] = (lo_bit_count >> 16) & 0xFF
-        self._data[62] = (lo_bit_count >> 8) & 0xFF
-        self._data[63] = (lo_bit_count >> 0) & 0xFF
-
-        self._transform()
-
-        dig = bytearray()
-        for i in self._digest:
-            for j in range(4):
-                dig.append((i >> ((3 - j) * 8)) & 0xFF)
-        return dig
+    # The rounds are written out inline rather than calling helpers for the
+    # rotations and mixing functions. Values are only truncated to 32 bits
+    # when they're stored, as the low bits of + ^ & | don't depend on the high
+    # bits of their operands.
+    def _transform(self, buf, offset, n):
+        K = _K
+        w = self._w
+        M = 0xFFFFFFFF
+        h0, h1, h2, h3, h4, h5, h6, h7 = self._digest
+        for pos in range(offset, offset + n * _SHA_BLOCKSIZE, _SHA_BLOCKSIZE):
+            w[:16] = unpack_from(">16I", buf, pos)
+            for i in range(16, 64):
+                x = w[i - 15]
+                y = w[i - 2]
+                w[i] = (
+                    w[i - 16]
+                    + w[i - 7]
+                    + ((x >> 7 | x << 25) ^ (x >> 18 | x << 14) ^ (x >> 3))
+                    + ((y >> 17 | y << 15) ^ (y >> 19 | y << 13) ^ (y >> 10))
+                ) & M
+
+            a, b, c, d, e, f, g, h = h0, h1, h2, h3, h4, h5, h6, h7
+            for i in range(64):
+                t = (
+                    h
+                    + ((e >> 6 | e << 26) ^ (e >> 11 | e << 21) ^ (e >> 25 | e << 7))
+                    + (g ^ (e & (f ^ g)))
+                    + K[i]
+                    + w[i]
+                )
+                h = g
+                g = f
+                f = e
+                e = (d + t) & M
+                d = c
+                c = b
+                b = a
+                a = (
+                    t
+                    + ((a >> 2 | a << 30) ^ (a >> 13 | a << 19) ^ (a >> 22 | a << 10))
+                    + ((b | c) & d | b & c)
+                ) & M
+
+            h0 = (h0 + a) & M
+            h1 = (h1 + b) & M
+            h2 = (h2 + c) & M
+            h3 = (h3 + d) & M
+            h4 = (h4 + e) & M
+            h5 = (h5 + f) & M
+            h6 = (h6 + g) & M
+            h7 = (h7 + h) & M
+        self._digest = [h0, h1, h2, h3, h4, h5, h6, h7]
@@ -1,4 +1,4 @@
-metadata(version="1.0.0", description="Adds the SHA512 hash algorithm to hashlib.")
+metadata(version="1.1.0", description="Adds the SHA512 hash algorithm to hashlib.")
 
 require("hashlib-core")
 package("hashlib")
@@ -82,6 +82,28 @@ class TestSha256(unittest.TestCase):
             "6a340b2bd2b63f4a0f9bb7566c26831354ee6ed17d1187d3a53627181fcb2907", s2.hexdigest()
         )
 
+    def test_bulk_update(self):
+        data = bytes(range(256)) * 40
+        self.assertEqual(
+            "e96760a87768717bcebcfd25ddc7d46b4dbc95a4b0014def080c08539f7d90d0",
+            sha256(data).hexdigest(),
+        )
+        self.assertEqual(
+            "e96760a87768717bcebcfd25ddc7d46b4dbc95a4b0014def080c08539f7d90d0",
+            sha256(memoryview(data)).hexdigest(),
+        )
+
+    def test_chunked_update(self):
+        data = bytes(range(256)) * 40
+        for size in (1, 7, 63, 64, 65, 127, 128, 129, 1000):
+            s = sha256()
+            for i in range(0, len(data), size):
+                s.update(memoryview(data)[i : i + size])
+            self.assertEqual(
+                "e96760a87768717bcebcfd25ddc7d46b4dbc95a4b0014def080c08539f7d90d0",
+                s.hexdigest(),
+            )
+
 
 if __name__ == "__main__":
     unittest.main()
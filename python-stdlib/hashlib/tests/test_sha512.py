@@ -84,6 +84,28 @@ class Testsha512(unittest.TestCase):
             s2.hexdigest(),
         )
 
+    def test_bulk_update(self):
+        data = bytes(range(256)) * 40
+        self.assertEqual(
+            "ad3a2775dab72f905f9ec1b53483b2df6c42abf50f776d732d309245149779ee011af252635b5259c99a1e7836488fe5b4c70a6a477e8ae7516139e6386364b6",
+            sha512(data).hexdigest(),
+        )
+        self.assertEqual(
+            "ad3a2775dab72f905f9ec1b53483b2df6c42abf50f776d732d309245149779ee011af252635b5259c99a1e7836488fe5b4c70a6a477e8ae7516139e6386364b6",
+            sha512(memoryview(data)).hexdigest(),
+        )
+
+    def test_chunked_update(self):
+        data = bytes(range(256)) * 40
+        for size in (1, 7, 63, 64, 65, 127, 128, 129, 1000):
+            s = sha512()
+            for i in range(0, len(data), size):
+                s.update(memoryview(data)[i : i + size])
+            self.assertEqual(
+                "ad3a2775dab72f905f9ec1b53483b2df6c42abf50f776d732d309245149779ee011af252635b5259c99a1e7836488fe5b4c70a6a477e8ae7516139e6386364b6",
+                s.hexdigest(),
+            )
+
 
 if __name__ == "__main__":
     unittest.main()
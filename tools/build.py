@@ -30,6 +30,12 @@
 # Usage:
 # ./tools/build.py --output /tmp/micropython-lib/v2
 
+# Packages are built in parallel (see --jobs). The result for each package is
+# recorded in .build-cache.json in the output directory, keyed on a hash of
+# its source files, their metadata and the mpy-cross version. With
+# --incremental, packages whose key hasn't changed since the previous run are
+# not compiled again.
+
 # The output directory (--output) will have the following layout
 # /
 #   index.json
@@ -109,23 +115,41 @@
 #     ["name", "version"],
 #     ...
 #   ]
-#   "version": "0.1"
+#   "version": "0.1",
+#   "archive": "a92c6b1e"   <-- optional: hash of a .tar.gz of all files in "hashes"
 # }
 
+# The archive lets mip install a package with a single request. It's a gzip
+# (compressed with a 2^_ARCHIVE_WBITS byte window, so that it can be
+# decompressed with little RAM) of a ustar tar file containing each file of
+# "hashes" under its target path, with zeroed mtimes and owners and fixed modes so
+# that identical files always give an identical archive. Each file can still be
+# verified against its hash in "hashes" as it is extracted. Packages with
+# a target path too long for a ustar name field have no archive.
+
 # mip (or other tools) should request /package/{mpy_version}/{package_name}/{version}.json.
 
+import concurrent.futures
 import glob
 import hashlib
+import io
 import json
 import os
 import shutil
+import subprocess
 import sys
+import tarfile
 import tempfile
 import time
+import zlib
 
 
 _JSON_VERSION_INDEX = 2
 _JSON_VERSION_PACKAGE = 1
+_JSON_VERSION_CACHE = 2
+
+# Must match the window that mip decompresses archives with.
+_ARCHIVE_WBITS = 10
 
 
 _COLOR_ERROR_ON = "\033[1;31m"
@@ -135,8 +159,7 @@ _COLOR_ERROR_OFF = "\033[0m"
 # Create all directories in the path (such that the file can be created).
 def ensure_path_exists(file_path):
     path = os.path.dirname(file_path)
-    if not os.path.isdir(path):
-        os.makedirs(path)
+    os.makedirs(path, exist_ok=True)
 
 
 # Returns the sha256 of the specified file object.
@@ -204,9 +227,12 @@ def _write_hashed_file(package_name, src, target_path, out_file_dir, hash_prefix
             print("Try increasing --hash-prefix (currently {})".format(hash_prefix_len))
             sys.exit(1)
     else:
-        # Create new file.
+        # Create new file. It's renamed into place so that packages being
+        # built in parallel never see it partially written.
         ensure_path_exists(output_file_path)
-        shutil.copyfile(src.name, output_file_path)
+        temp_path = "{}.{}.tmp".format(output_file_path, os.getpid())
+        shutil.copyfile(src.name, temp_path)
+        os.replace(temp_path, output_file_path)
 
     return short_file_hash
 
@@ -268,31 +294,212 @@ def _copy_as_py(
     package_json["hashes"].append((target_path, short_py_hash))
 
 
+# Write a .tar.gz of all the files in the package json to the "file" output
+# directory with its hashed name, and add its hash to the package json.
+def _write_archive(package_name, package_json, out_file_dir, hash_prefix_len):
+    tar_data = io.BytesIO()
+    with tarfile.open(fileobj=tar_data, mode="w", format=tarfile.USTAR_FORMAT) as tar:
+        for target_path, short_hash in package_json["hashes"]:
+            if len(target_path.encode()) >= tarfile.LENGTH_NAME:
+                return
+            with open(os.path.join(out_file_dir, short_hash[:2], short_hash), "rb") as f:
+                info = tarfile.TarInfo(target_path)
+                info.size = os.fstat(f.fileno()).st_size
+                info.mode = 0o644
+                tar.addfile(info, f)
+
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + _ARCHIVE_WBITS)
+    with tempfile.NamedTemporaryFile(mode="w+b", suffix=".tar.gz", delete=True) as archive_file:
+        archive_file.write(compressor.compress(tar_data.getvalue()))
+        archive_file.write(compressor.flush())
+        archive_file.flush()
+        archive_file.seek(0)
+        package_json["archive"] = _write_hashed_file(
+            package_name, archive_file, package_name + ".tar.gz", out_file_dir, hash_prefix_len
+        )
+
+
 # Update to the latest metadata, and add any new versions to the package in
 # the index json.
 def _update_index_package_metadata(index_package_json, metadata, mpy_version, package_path):
-    index_package_json["version"] = metadata.version or ""
+    index_package_json["version"] = metadata["version"]
     index_package_json["author"] = ""  # TODO: Make manifestfile.py capture this.
-    index_package_json["description"] = metadata.description or ""
-    index_package_json["license"] = metadata.license or "MIT"
+    index_package_json["description"] = metadata["description"]
+    index_package_json["license"] = metadata["license"]
     if "versions" not in index_package_json:
         index_package_json["versions"] = {}
-    if metadata.version:
+    if metadata["version"]:
         for v in ("py", mpy_version):
             if v not in index_package_json["versions"]:
                 index_package_json["versions"][v] = []
-            if metadata.version not in index_package_json["versions"][v]:
-                print("  New version {}={}".format(v, metadata.version))
-                index_package_json["versions"][v].append(metadata.version)
+            if metadata["version"] not in index_package_json["versions"][v]:
+                print("  New version {}={}".format(v, metadata["version"]))
+                index_package_json["versions"][v].append(metadata["version"])
 
     # The following entries were added in file format version 2.
     index_package_json["path"] = package_path
 
 
-def build(output_path, hash_prefix_len, mpy_cross_path):
+# Returns the full version of mpy-cross (which includes the git commit it was
+# built from), so that cached .mpy files are rebuilt when it changes.
+def _mpy_cross_version(mpy_cross, mpy_cross_path):
+    binary = mpy_cross_path or mpy_cross._find_mpy_cross_binary(None)
+    result = subprocess.run([binary, "--version"], capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+
+
+# Returns the cache key of a package: a hash of everything that its output
+# depends on.
+def _package_key(files, mpy_cross_version, hash_prefix_len):
+    key = hashlib.sha256()
+    key.update("{}\n{}\n".format(mpy_cross_version, hash_prefix_len).encode())
+    for result in files:
+        with open(result.full_path, "rb") as f:
+            source_hash = _get_file_hash(f)
+        m = result.metadata
+        key.update(
+            repr(
+                (
+                    result.target_path,
+                    result.opt,
+                    source_hash,
+                    getattr(m, "version", None),
+                    getattr(m, "description", None),
+                    getattr(m, "license", None),
+                    getattr(m, "author", None),
+                )
+            ).encode()
+        )
+    return key.hexdigest()
+
+
+# Returns true if all the files of the cached package json are in the "file"
+# output directory (which may have been deleted since it was cached).
+def _cached_files_exist(package_json, out_file_dir):
+    hashes = [short_hash for _, short_hash in package_json["hashes"]]
+    if "archive" in package_json:
+        hashes.append(package_json["archive"])
+    for short_hash in hashes:
+        if not os.path.exists(os.path.join(out_file_dir, short_hash[:2], short_hash)):
+            return False
+    return True
+
+
+# Used to set up worker processes, which need the same import path as the
+# main process to find manifestfile and mpy_cross.
+def _init_worker(path):
+    sys.path[:] = path
+
+
+# Compiles a single package (in a worker process), or reuses its cached result
+# if its inputs haven't changed. Returns the package metadata, the package
+# jsons and the cache key.
+def _build_package(
+    manifest_path,
+    path_vars,
+    mpy_cross_path,
+    mpy_cross_version,
+    out_file_dir,
+    hash_prefix_len,
+    cached,
+):
     import manifestfile
     import mpy_cross
 
+    package_path = os.path.dirname(manifest_path)
+    # .../foo/manifest.py -> foo
+    package_name = os.path.basename(package_path)
+
+    # Compile the manifest.
+    manifest = manifestfile.ManifestFile(manifestfile.MODE_COMPILE, path_vars)
+    manifest.execute(manifest_path)
+    metadata = manifest.metadata()
+
+    files = manifest.files()
+    for result in files:
+        # This isn't allowed in micropython-lib anyway.
+        if result.file_type != manifestfile.FILE_TYPE_LOCAL:
+            print(error_color("Error:"), "Non-local file not supported.", file=sys.stderr)
+            sys.exit(1)
+
+        if not result.target_path.endswith(".py"):
+            print(
+                error_color("Error:"),
+                "Target path isn't a .py file:",
+                result.target_path,
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+    key = _package_key(files, mpy_cross_version, hash_prefix_len)
+    if (
+        cached
+        and cached["key"] == key
+        and _cached_files_exist(cached["mpy"], out_file_dir)
+        and _cached_files_exist(cached["py"], out_file_dir)
+    ):
+        mpy_package_json = cached["mpy"]
+        py_package_json = cached["py"]
+    else:
+        cached = None
+
+        # This is the package json that mip/mpremote downloads.
+        mpy_package_json = {
+            "v": _JSON_VERSION_PACKAGE,
+            "hashes": [],
+            "version": metadata.version or "",
+        }
+        py_package_json = {
+            "v": _JSON_VERSION_PACKAGE,
+            "hashes": [],
+            "version": metadata.version or "",
+        }
+
+        for result in files:
+            # Tag each file with the package metadata and compile to .mpy
+            # (and copy the .py directly).
+            with manifestfile.tagged_py_file(result.full_path, result.metadata) as tagged_path:
+                _compile_as_mpy(
+                    package_name,
+                    mpy_package_json,
+                    tagged_path,
+                    result.target_path,
+                    result.opt,
+                    mpy_cross,
+                    mpy_cross_path,
+                    out_file_dir,
+                    hash_prefix_len,
+                )
+                _copy_as_py(
+                    package_name,
+                    py_package_json,
+                    tagged_path,
+                    result.target_path,
+                    out_file_dir,
+                    hash_prefix_len,
+                )
+
+        _write_archive(package_name, mpy_package_json, out_file_dir, hash_prefix_len)
+        _write_archive(package_name, py_package_json, out_file_dir, hash_prefix_len)
+
+    return {
+        "name": package_name,
+        "path": package_path,
+        "metadata": {
+            "version": metadata.version or "",
+            "description": metadata.description or "",
+            "license": metadata.license or "MIT",
+        },
+        "key": key,
+        "mpy": mpy_package_json,
+        "py": py_package_json,
+        "cached": cached is not None,
+    }
+
+
+def build(output_path, hash_prefix_len, mpy_cross_path, jobs=None, incremental=False):
+    import mpy_cross
+
     out_file_dir = os.path.join(output_path, "file")
     out_package_dir = os.path.join(output_path, "package")
 
@@ -301,6 +508,7 @@ def build(output_path, hash_prefix_len, mpy_cross_path):
     }
 
     index_json_path = os.path.join(output_path, "index.json")
+    cache_json_path = os.path.join(output_path, ".build-cache.json")
 
     try:
         with open(index_json_path) as f:
@@ -313,6 +521,16 @@ def build(output_path, hash_prefix_len, mpy_cross_path):
     index_json["v"] = _JSON_VERSION_INDEX
     index_json["updated"] = int(time.time())
 
+    cache_json = {"packages": {}}
+    if incremental:
+        try:
+            with open(cache_json_path) as f:
+                cache_json = json.load(f)
+            if cache_json.get("v") != _JSON_VERSION_CACHE:
+                cache_json = {"packages": {}}
+        except FileNotFoundError:
+            pass
+
     # For now, don't process unix-ffi. In the future this can be extended to
     # allow a way to request unix-ffi packages via mip.
     lib_dirs = ["micropython", "python-stdlib", "python-ecosys"]
@@ -320,126 +538,111 @@ def build(output_path, hash_prefix_len, mpy_cross_path):
     mpy_version, _mpy_sub_version = mpy_cross.mpy_version(mpy_cross=mpy_cross_path)
     mpy_version = str(mpy_version)
     print("Generating bytecode version", mpy_version)
+    mpy_cross_version = _mpy_cross_version(mpy_cross, mpy_cross_path)
 
+    manifest_paths = []
     for lib_dir in lib_dirs:
-        for manifest_path in glob.glob(os.path.join(lib_dir, "**", "manifest.py"), recursive=True):
-            package_path = os.path.dirname(manifest_path)
-            print("{}".format(package_path))
-            # .../foo/manifest.py -> foo
-            package_name = os.path.basename(os.path.dirname(manifest_path))
-
-            # Compile the manifest.
-            manifest = manifestfile.ManifestFile(manifestfile.MODE_COMPILE, path_vars)
-            manifest.execute(manifest_path)
-
-            # Append this package to the index.
-            if not manifest.metadata().version:
-                print(error_color("Warning:"), package_name, "doesn't have a version.")
-
-            # Try to find this package in the previous index.json.
-            for p in index_json["packages"]:
-                if p["name"] == package_name:
-                    index_package_json = p
-                    break
-            else:
-                print("  First-time package")
-                index_package_json = {
-                    "name": package_name,
-                }
-                index_json["packages"].append(index_package_json)
-
-            _update_index_package_metadata(
-                index_package_json, manifest.metadata(), mpy_version, package_path
-            )
+        manifest_paths.extend(
+            sorted(glob.glob(os.path.join(lib_dir, "**", "manifest.py"), recursive=True))
+        )
 
-            # This is the package json that mip/mpremote downloads.
-            mpy_package_json = {
-                "v": _JSON_VERSION_PACKAGE,
-                "hashes": [],
-                "version": manifest.metadata().version or "",
-            }
-            py_package_json = {
-                "v": _JSON_VERSION_PACKAGE,
-                "hashes": [],
-                "version": manifest.metadata().version or "",
+    # Build the packages in parallel, then merge the results into the index in
+    # a fixed order so that the output doesn't depend on scheduling.
+    with concurrent.futures.ProcessPoolExecutor(
+        jobs, initializer=_init_worker, initargs=(sys.path,)
+    ) as executor:
+        futures = [
+            executor.submit(
+                _build_package,
+                manifest_path,
+                path_vars,
+                mpy_cross_path,
+                mpy_cross_version,
+                out_file_dir,
+                hash_prefix_len,
+                cache_json["packages"].get(os.path.dirname(manifest_path)),
+            )
+            for manifest_path in manifest_paths
+        ]
+        results = [future.result() for future in futures]
+
+    num_cached = 0
+    for package in results:
+        package_name = package["name"]
+        metadata = package["metadata"]
+        mpy_package_json = package["mpy"]
+        py_package_json = package["py"]
+        print("{}{}".format(package["path"], " (unchanged)" if package["cached"] else ""))
+        num_cached += package["cached"]
+
+        # Append this package to the index.
+        if not metadata["version"]:
+            print(error_color("Warning:"), package_name, "doesn't have a version.")
+
+        # Try to find this package in the previous index.json.
+        for p in index_json["packages"]:
+            if p["name"] == package_name:
+                index_package_json = p
+                break
+        else:
+            print("  First-time package")
+            index_package_json = {
+                "name": package_name,
             }
+            index_json["packages"].append(index_package_json)
+
+        _update_index_package_metadata(index_package_json, metadata, mpy_version, package["path"])
+
+        # Create/replace {package}/latest.json.
+        _write_package_json(
+            mpy_package_json,
+            out_package_dir,
+            mpy_version,
+            package_name,
+            "latest",
+            replace=True,
+        )
+        _write_package_json(
+            py_package_json, out_package_dir, "py", package_name, "latest", replace=True
+        )
 
-            for result in manifest.files():
-                # This isn't allowed in micropython-lib anyway.
-                if result.file_type != manifestfile.FILE_TYPE_LOCAL:
-                    print(error_color("Error:"), "Non-local file not supported.", file=sys.stderr)
-                    sys.exit(1)
-
-                if not result.target_path.endswith(".py"):
-                    print(
-                        error_color("Error:"),
-                        "Target path isn't a .py file:",
-                        result.target_path,
-                        file=sys.stderr,
-                    )
-                    sys.exit(1)
-
-                # Tag each file with the package metadata and compile to .mpy
-                # (and copy the .py directly).
-                with manifestfile.tagged_py_file(result.full_path, result.metadata) as tagged_path:
-                    _compile_as_mpy(
-                        package_name,
-                        mpy_package_json,
-                        tagged_path,
-                        result.target_path,
-                        result.opt,
-                        mpy_cross,
-                        mpy_cross_path,
-                        out_file_dir,
-                        hash_prefix_len,
-                    )
-                    _copy_as_py(
-                        package_name,
-                        py_package_json,
-                        tagged_path,
-                        result.target_path,
-                        out_file_dir,
-                        hash_prefix_len,
-                    )
-
-            # Create/replace {package}/latest.json.
+        # Write {package}/{version}.json, but only if it doesn't already
+        # exist. A package version is "locked" the first time it's seen
+        # by this script.
+        if metadata["version"]:
             _write_package_json(
                 mpy_package_json,
                 out_package_dir,
                 mpy_version,
                 package_name,
-                "latest",
-                replace=True,
+                metadata["version"],
+                replace=False,
             )
             _write_package_json(
-                py_package_json, out_package_dir, "py", package_name, "latest", replace=True
+                py_package_json,
+                out_package_dir,
+                "py",
+                package_name,
+                metadata["version"],
+                replace=False,
             )
 
-            # Write {package}/{version}.json, but only if it doesn't already
-            # exist. A package version is "locked" the first time it's seen
-            # by this script.
-            if manifest.metadata().version:
-                _write_package_json(
-                    mpy_package_json,
-                    out_package_dir,
-                    mpy_version,
-                    package_name,
-                    manifest.metadata().version,
-                    replace=False,
-                )
-                _write_package_json(
-                    py_package_json,
-                    out_package_dir,
-                    "py",
-                    package_name,
-                    manifest.metadata().version,
-                    replace=False,
-                )
+    print("Built {} packages, {} unchanged".format(len(results) - num_cached, num_cached))
 
     # Write updated package index json, sorted by package name.
     index_json["packages"].sort(key=lambda p: p["name"])
     _write_json(index_json, index_json_path, minify=False)
 
+    # Record the results for the next incremental build.
+    cache_json = {
+        "v": _JSON_VERSION_CACHE,
+        "packages": {
+            package["path"]: {key: package[key] for key in ("key", "mpy", "py")}
+            for package in results
+        },
+    }
+    _write_json(cache_json, cache_json_path, minify=True)
+
 
 def main():
     import argparse
@@ -449,13 +652,27 @@ def main():
     cmd_parser.add_argument("--hash-prefix", default=8, type=int, help="hash prefix length")
     cmd_parser.add_argument("--mpy-cross", default=None, help="optional path to mpy-cross binary")
     cmd_parser.add_argument("--micropython", default=None, help="path to micropython repo")
+    cmd_parser.add_argument(
+        "--jobs", default=None, type=int, help="number of packages to build in parallel"
+    )
+    cmd_parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="don't rebuild packages that haven't changed since the previous build",
+    )
     args = cmd_parser.parse_args()
 
     if args.micropython:
         sys.path.append(os.path.join(args.micropython, "tools"))  # for manifestfile
         sys.path.append(os.path.join(args.micropython, "mpy-cross"))  # for mpy_cross
 
-    build(args.output, hash_prefix_len=max(4, args.hash_prefix), mpy_cross_path=args.mpy_cross)
+    build(
+        args.output,
+        hash_prefix_len=max(4, args.hash_prefix),
+        mpy_cross_path=args.mpy_cross,
+        jobs=args.jobs,
+        incremental=args.incremental,
+    )
 
 
 if __name__ == "__main__":
@@ -42,13 +42,23 @@ function ci_package_tests_setup_lib {
     $CP -r python-stdlib/unittest/unittest ~/.micropython/lib/
     $CP -r python-stdlib/unittest-discover/unittest ~/.micropython/lib/
     $CP unix-ffi/ffilib/ffilib.py ~/.micropython/lib/
+    $CP -r micropython/umqtt.simple/umqtt ~/.micropython/lib/
+    $CP -r python-ecosys/cbor2/cbor2 ~/.micropython/lib/
+    $CP micropython/umqtt.robust/umqtt/robust.py ~/.micropython/lib/umqtt/
+    $CP micropython/umqtt.aio/umqtt/aio.py ~/.micropython/lib/umqtt/
     tree ~/.micropython
 }
 
 function ci_package_tests_run {
     for test in \
         micropython/drivers/storage/sdcard/sdtest.py \
+        micropython/mip/test_mip.py \
+        micropython/senml/test_senml.py \
+        micropython/umqtt.aio/tests/test_aio.py \
+        micropython/umqtt.robust/tests/test_robust.py \
         micropython/xmltok/test_xmltok.py \
+        python-ecosys/aiohttp/test_aiohttp_ws.py \
+        python-ecosys/cbor2/test_cbor2.py \
         python-ecosys/requests/test_requests.py \
         python-stdlib/argparse/test_argparse.py \
         python-stdlib/base64/test_base64.py \
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+#
+# This file is part of the MicroPython project, http://micropython.org/
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2026 micropython-lib contributors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# This script serves a mip index (as built by build.py) from a local
+# directory, so that devices on a local network can install packages from it
+# rather than each from the internet.
+
+# Usage:
+#
+#   ./tools/serve.py --output /tmp/micropython-lib/mip --port 8000
+#
+# and then on a device:
+#
+#   mip.install("package-name", index="http://192.168.1.2:8000")
+#
+# With --upstream, it's also a caching mirror of another index: requests for
+# files that aren't in the directory are fetched from the upstream index and
+# saved there. Files in the "file" directory never change (and are verified
+# against the hash they're named by), so they're only ever fetched once, and
+# everything else (e.g. package json) is revalidated with the upstream index
+# on each request using If-Modified-Since, falling back to the saved copy if
+# it can't be reached.
+#
+#   ./tools/serve.py --output /tmp/mip-mirror --upstream https://micropython.org/pi/v2
+#
+# Responses have an ETag and Last-Modified, and conditional requests from mip
+# (which sends the ETag of its cached copy) get a 304 if nothing changed.
+# Connections are kept alive, so a device can install all the files of a
+# package over one connection.
+
+import email.utils
+import functools
+import hashlib
+import http.server
+import os
+import posixpath
+import sys
+import tempfile
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+_UPSTREAM_TIMEOUT = 10
+
+
+# Returns the path (relative to the served directory) of a request path, or
+# None if it isn't inside the served directory.
+def _relative_path(request_path):
+    path = posixpath.normpath(urllib.parse.unquote(urllib.parse.urlsplit(request_path).path))
+    path = path.lstrip("/")
+    if not path or path.startswith("..") or "\\" in path:
+        return None
+    return path
+
+
+# Write data to path, renaming it into place so that concurrent requests never
+# see a partially written file. Each write uses its own temporary file, as
+# requests for the same path may be handled by several threads at once.
+def _write_file(path, data, mtime=None):
+    directory, name = os.path.split(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        # mkstemp creates the file readable only by its owner.
+        os.chmod(temp_path, 0o644)
+        if mtime is not None:
+            os.utime(temp_path, (mtime, mtime))
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+# Fetch path from the upstream index into the directory. Files in the "file"
+# directory are only fetched if missing, everything else is revalidated.
+def _update_from_upstream(directory, upstream, path):
+    local_path = os.path.join(directory, path)
+    is_hashed_file = path.startswith("file/")
+    if is_hashed_file and os.path.exists(local_path):
+        return
+
+    request = urllib.request.Request(upstream + "/" + path)
+    if os.path.exists(local_path):
+        request.add_header(
+            "If-Modified-Since", email.utils.formatdate(os.stat(local_path).st_mtime, usegmt=True)
+        )
+    try:
+        with urllib.request.urlopen(request, timeout=_UPSTREAM_TIMEOUT) as response:
+            data = response.read()
+            modified = response.headers.get("Last-Modified")
+    except urllib.error.HTTPError as e:
+        if e.code != 304:
+            print("Upstream error", e.code, "for", path, file=sys.stderr)
+        return
+    except (urllib.error.URLError, OSError) as e:
+        print("Upstream unavailable for", path, e, file=sys.stderr)
+        return
+
+    if is_hashed_file:
+        short_hash = os.path.basename(path)
+        if not hashlib.sha256(data).hexdigest().startswith(short_hash):
+            print("Upstream hash mismatch for", path, file=sys.stderr)
+            return
+    mtime = None
+    if modified:
+        try:
+            mtime = email.utils.parsedate_to_datetime(modified).timestamp()
+        except (TypeError, ValueError):
+            pass
+    _write_file(local_path, data, mtime)
+
+
+class _RequestHandler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    etag = None
+
+    def __init__(self, *args, upstream=None, **kwargs):
+        self.upstream = upstream
+        super().__init__(*args, **kwargs)
+
+    def send_head(self):
+        path = _relative_path(self.path)
+        if path is None:
+            self.send_error(404)
+            return None
+        if self.upstream:
+            _update_from_upstream(self.directory, self.upstream, path)
+
+        self.etag = None
+        local_path = os.path.join(self.directory, path)
+        if os.path.isfile(local_path):
+            st = os.stat(local_path)
+            self.etag = '"{:x}-{:x}"'.format(st.st_size, st.st_mtime_ns)
+            if_none_match = self.headers.get("If-None-Match")
+            if if_none_match and self.etag in (t.strip() for t in if_none_match.split(",")):
+                self.send_response(304)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+        return super().send_head()
+
+    def end_headers(self):
+        if self.etag:
+            self.send_header("ETag", self.etag)
+            self.etag = None
+        super().end_headers()
+
+
+def serve(output_path, host, port, upstream=None):
+    handler = functools.partial(
+        _RequestHandler,
+        directory=os.path.abspath(output_path),
+        upstream=upstream.rstrip("/") if upstream else None,
+    )
+    with http.server.ThreadingHTTPServer((host, port), handler) as server:
+        print("Serving {} on http://{}:{}".format(output_path, host, server.server_port))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def main():
+    import argparse
+
+    cmd_parser = argparse.ArgumentParser(description="Serve a mip index from a local directory.")
+    cmd_parser.add_argument(
+        "--output", required=True, help="directory of the index (see build.py)"
+    )
+    cmd_parser.add_argument("--host", default="0.0.0.0", help="address to listen on")
+    cmd_parser.add_argument("--port", default=8000, type=int, help="port to listen on")
+    cmd_parser.add_argument(
+        "--upstream", default=None, help="index to fetch and save files that aren't in --output"
+    )
+    args = cmd_parser.parse_args()
+
+    serve(args.output, args.host, args.port, args.upstream)
+
+
+if __name__ == "__main__":
+    main()